@@ -0,0 +1,187 @@
+"""finanzas.json compartido entre varios procesos (varias instancias de bot2/bot3 detrás de un balanceador).
+
+- Cada usuario lleva un '_version' que sube en cada guardado. guardar_usuario() solo escribe si
+  en disco sigue la versión que se leyó; si no, lanza Conflicto. guardar_usuarios() hace lo mismo
+  para varios usuarios en una escritura y saltea los que no coinciden.
+- La escritura toma un lock exclusivo del archivo, relee el disco y reemplaza solo al usuario que
+  se guarda, así nunca se pisan los cambios de otros usuarios hechos por otra instancia.
+- proteger(app) envuelve cada handler: lo corre con el lock del usuario (compartido entre
+  procesos) y, si igual hubo Conflicto, lo vuelve a correr con los datos nuevos. Por eso un
+  handler que guarda no llama a la Bot API antes de _db_save.
+"""
+import asyncio
+import fcntl
+import functools
+import json
+import logging
+import os
+import random
+import time
+import zlib
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from pathlib import Path
+
+from telegram.ext import ConversationHandler, TypeHandler
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+ALMACEN_REINTENTOS = int(os.getenv("ALMACEN_REINTENTOS", 5))
+# Segundos esperando el lock de un usuario antes de seguir sin él (queda la versión optimista)
+ALMACEN_ESPERA = float(os.getenv("ALMACEN_ESPERA", 10))
+# Locks de usuario: un archivo por franja y no por usuario
+ALMACEN_FRANJAS = int(os.getenv("ALMACEN_FRANJAS", 256))
+
+class Conflicto(Exception):
+    """Otra instancia guardó al usuario después de que este proceso lo leyó."""
+
+# =============================
+# ALMACÉN
+# =============================
+class AlmacenCompartido:
+    def __init__(self, archivo: Path):
+        self.archivo = archivo
+
+    @property
+    def _locks(self) -> Path:
+        return self.archivo.with_name(self.archivo.name + ".locks")
+
+    def cargar(self) -> dict:
+        # Sin lock: las escrituras reemplazan el archivo entero de una vez (os.replace)
+        if not self.archivo.exists():
+            return {"users": {}}
+        try:
+            with self.archivo.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            logger.error("Error al cargar DB, creando nueva")
+            return {"users": {}}
+
+    @contextmanager
+    def _escritura(self):
+        # Un escritor a la vez entre todos los procesos
+        with self.archivo.with_name(self.archivo.name + ".lock").open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _escribir(self, db):
+        tmp = self.archivo.with_name(f"{self.archivo.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(db, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.archivo)
+
+    def guardar_todo(self, db):
+        """Reemplaza la DB entera (datos generados, pruebas). No mira versiones."""
+        with self._escritura():
+            self._escribir(db)
+
+    def guardar_usuario(self, db, user_id):
+        """Guarda db['users'][user_id] si nadie lo cambió desde que se leyó; si no, lanza Conflicto."""
+        uid = str(user_id)
+        user = db["users"][uid]
+        with self._escritura():
+            disco = self.cargar()
+            version = disco["users"].get(uid, {}).get("_version", 0)
+            if version != user.get("_version", 0):
+                raise Conflicto(uid)
+            user["_version"] = version + 1
+            disco["users"][uid] = user
+            self._escribir(disco)
+
+    def guardar_usuarios(self, db, user_ids) -> list:
+        """Como guardar_usuario para varios usuarios, en una sola escritura del archivo.
+
+        El que no pasa la verificación de versión se saltea (no se lanza Conflicto) y queda
+        como está en disco. Devuelve los ids que se guardaron.
+        """
+        guardados = []
+        with self._escritura():
+            disco = self.cargar()
+            for uid in map(str, user_ids):
+                user = db["users"][uid]
+                version = disco["users"].get(uid, {}).get("_version", 0)
+                if version != user.get("_version", 0):
+                    logger.info(f"Conflicto guardando a {uid}: queda como está en disco")
+                    continue
+                user["_version"] = version + 1
+                disco["users"][uid] = user
+                guardados.append(uid)
+            if guardados:
+                self._escribir(disco)
+        return guardados
+
+    @asynccontextmanager
+    async def bloqueo_usuario(self, user_id):
+        """Lock del usuario entre procesos. flock sobre una franja; se espera sin bloquear el loop."""
+        self._locks.mkdir(exist_ok=True)
+        franja = zlib.crc32(str(user_id).encode()) % ALMACEN_FRANJAS
+        lock = (self._locks / f"{franja}.lock").open("a")
+        inicio = time.perf_counter()
+        tomado = False
+        try:
+            while True:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    tomado = True
+                    break
+                except BlockingIOError:
+                    if time.perf_counter() - inicio > ALMACEN_ESPERA:
+                        logger.warning(f"Lock del usuario {user_id} ocupado: se sigue sin él")
+                        break
+                    await asyncio.sleep(0.005)
+            metricas.observar("almacen_espera_lock", "usuario", (time.perf_counter() - inicio) * 1000)
+            yield
+        finally:
+            if tomado:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+# =============================
+# HANDLERS
+# =============================
+def _envolver(almacen, handler, entre_procesos):
+    callback = handler.callback
+    if getattr(callback, "protegido", False):
+        return
+
+    @functools.wraps(callback)
+    async def protegido(update, context):
+        usuario = getattr(update, "effective_user", None)
+        if usuario is None:
+            return await callback(update, context)
+        async with almacen.bloqueo_usuario(usuario.id) if entre_procesos else nullcontext():
+            for intento in range(ALMACEN_REINTENTOS):
+                try:
+                    return await callback(update, context)
+                except Conflicto:
+                    # Los handlers hacen todas sus llamadas a la Bot API después de _db_save (también
+                    # query.answer()): el intento que falló no mandó nada y repetirlo no duplica
+                    metricas.observar("almacen_conflicto", callback.__name__, 0)
+                    logger.info(f"Conflicto guardando a {usuario.id} en {callback.__name__}: reintento {intento + 1}")
+                    await asyncio.sleep(random.uniform(0, 0.01 * 2 ** intento))
+            return await callback(update, context)
+
+    protegido.protegido = True
+    handler.callback = protegido
+
+def _proteger_handler(almacen, handler, entre_procesos):
+    if isinstance(handler, ConversationHandler):
+        for h in handler.entry_points + handler.fallbacks + [h for hs in handler.states.values() for h in hs]:
+            _proteger_handler(almacen, h, entre_procesos)
+    elif not isinstance(handler, TypeHandler):
+        # Los TypeHandler (repetidos, cronología) no tocan la DB
+        _envolver(almacen, handler, entre_procesos)
+
+def proteger(app, almacen: AlmacenCompartido, entre_procesos: bool = True):
+    """Envuelve todos los handlers de app. Llamar después de agregarlos y antes de instrumentar(app).
+
+    Con entre_procesos=False solo se reintenta ante Conflicto, sin el lock de archivo: para un
+    proceso que es el único que atiende a sus usuarios (bot.py) y los ordena con concurrencia.
+    """
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            _proteger_handler(almacen, handler, entre_procesos)
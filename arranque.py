@@ -0,0 +1,146 @@
+import time
+
+# Se importa primero en cada bot: la cronología empieza aquí
+_INICIO = time.perf_counter()
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from telegram import Update, User
+from telegram.ext import ExtBot, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+# Arranque rápido: getMe y setWebhook de la vez anterior (ver BotArranqueRapido)
+ARRANQUE_RAPIDO = os.getenv("ARRANQUE_RAPIDO", "0") == "1"
+ARRANQUE_CACHE = Path(__file__).parent / "arranque_cache.json"
+
+# =============================
+# CRONOLOGÍA
+# =============================
+class Cronologia:
+    def __init__(self, inicio: float):
+        self.inicio = inicio
+        self.etapas = []      # (etapa, ms de la etapa, ms desde el inicio)
+        self._ultima = inicio
+
+    def marcar(self, etapa: str):
+        ahora = time.perf_counter()
+        self.etapas.append((etapa, (ahora - self._ultima) * 1000, (ahora - self.inicio) * 1000))
+        self._ultima = ahora
+
+    def texto(self) -> str:
+        return "\n".join(f"  {etapa:<34} +{ms:8.1f} ms  ({total:8.1f} ms)" for etapa, ms, total in self.etapas)
+
+cronologia = Cronologia(_INICIO)
+_tareas = set()
+
+def registrar(app):
+    """Marca en la cronología el primer update atendido. Llamar después de agregar los handlers."""
+    app.add_handler(TypeHandler(Update, _primer_update), group=100)
+
+async def iniciado(app, al_aceptar=None):
+    """Para post_init: marca la inicialización y espera a que el bot acepte updates.
+
+    al_aceptar() corre recién entonces, para cargar lo pesado sin demorar el arranque.
+    """
+    cronologia.marcar("inicialización (getMe, persistencia)")
+    _en_segundo_plano(_esperar_aceptando(app, al_aceptar))
+
+async def _esperar_aceptando(app, al_aceptar):
+    # PTB no tiene un hook posterior a start(): se espera a que updater y Application estén corriendo
+    while not (app.running and (app.updater is None or app.updater.running)):
+        await asyncio.sleep(0.005)
+    cronologia.marcar("aceptando updates")
+    logger.info(f"Arranque:\n{cronologia.texto()}")
+    if al_aceptar:
+        al_aceptar()
+
+async def _primer_update(update, context):
+    if any(etapa == "primer update atendido" for etapa, _, _ in cronologia.etapas):
+        return
+    cronologia.marcar("primer update atendido")
+    logger.info(f"Arranque:\n{cronologia.texto()}")
+
+# =============================
+# BOT CON DATOS RECORDADOS
+# =============================
+class BotArranqueRapido(ExtBot):
+    """ExtBot que arranca sin esperar a getMe ni a setWebhook si ya los conoce de antes.
+
+    getMe usa el usuario guardado y setWebhook se omite si la configuración no cambió. Las dos
+    cosas se verifican después, con el bot ya atendiendo updates, y se corrigen si hace falta
+    (por ejemplo si alguien borró el webhook).
+    """
+
+    __slots__ = ()
+
+    async def get_me(self, *args, **kwargs):
+        if self._bot_user is None:
+            guardado = _leer_cache(self.token).get("bot")
+            if guardado:
+                self._bot_user = User.de_json(guardado, self)
+                _en_segundo_plano(self._refrescar_me())
+                return self._bot_user
+        usuario = await super().get_me(*args, **kwargs)
+        _guardar_cache(self.token, bot=usuario.to_dict())
+        return usuario
+
+    async def _refrescar_me(self):
+        try:
+            usuario = await super().get_me()
+            _guardar_cache(self.token, bot=usuario.to_dict())
+        except Exception as e:
+            logger.error(f"Error verificando getMe: {e}")
+
+    async def set_webhook(self, url, **kwargs):
+        clave = _clave_webhook(url, kwargs)
+        if kwargs.get("drop_pending_updates") or _leer_cache(self.token).get("webhook") != clave:
+            resultado = await super().set_webhook(url, **kwargs)
+            _guardar_cache(self.token, webhook=clave)
+            return resultado
+        logger.info("Webhook sin cambios: se omite setWebhook")
+        _en_segundo_plano(self._verificar_webhook(url, kwargs, clave))
+        return True
+
+    async def _verificar_webhook(self, url, kwargs, clave):
+        try:
+            info = await self.get_webhook_info()
+            if info.url != url:
+                logger.warning("El webhook registrado no coincide: se vuelve a registrar")
+                await super().set_webhook(url, **kwargs)
+                _guardar_cache(self.token, webhook=clave)
+        except Exception as e:
+            logger.error(f"Error verificando el webhook: {e}")
+
+def _en_segundo_plano(corrutina):
+    tarea = asyncio.create_task(corrutina)
+    _tareas.add(tarea)
+    tarea.add_done_callback(_tareas.discard)
+
+def _hash(texto: str) -> str:
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+def _clave_webhook(url, kwargs) -> str:
+    # Solo un hash: la URL lleva el token
+    return _hash(repr((url, sorted(kwargs.items()))))
+
+def _leer_cache(token: str) -> dict:
+    # Lo guardado con otro token no sirve
+    try:
+        cache = json.loads(ARRANQUE_CACHE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return cache if cache.get("token") == _hash(token) else {}
+
+def _guardar_cache(token: str, **valores):
+    cache = _leer_cache(token)
+    cache.update(valores, token=_hash(token))
+    try:
+        ARRANQUE_CACHE.write_text(json.dumps(cache, ensure_ascii=False), encoding="utf-8")
+    except OSError as e:
+        logger.error(f"Error guardando la cache de arranque: {e}")
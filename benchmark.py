@@ -0,0 +1,228 @@
+"""Benchmarks de almacenamiento y reportes con datos sintéticos.
+
+Uso:
+    python benchmark.py --escalas 10x100,100x1000 --salida bench_resultados.json
+    python benchmark.py --baseline bench_baseline.json     # compara y sale con 1 si hay regresiones
+
+Cada escala es USUARIOSxMOVIMIENTOS (movimientos por usuario). Los datos se generan de forma
+determinista con --semilla, con fechas en los últimos dos años hasta hoy.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("TOKEN", "123456:ABCDEF")
+
+import bot
+import graficos
+from presupuestos import gastos_dia, gastos_mes, ingresos_mes, registrar_gasto, registrar_ingreso
+
+DIAS_HISTORIAL = 730
+PRODUCTOS = {
+    "🍔 Comida": ["Arroz", "Frijoles", "Pollo", "Huevos", "Pan", "Leche", "Café", "Azúcar", "Aceite", "Pasta"],
+    "🎁 Regalos": ["Flores", "Chocolates", "Perfume", "Juguete"],
+    "🚕 Transporte": ["Taxi", "Guagua", "Gasolina", "Almendrón"],
+    "⚠️ Emergencia": ["Cerrajero", "Plomero"],
+    "🏠 Hogar": ["Detergente", "Jabón", "Bombillo", "Escoba", "Corriente", "Agua"],
+    "🎮 Ocio": ["Cine", "Cerveza", "Concierto", "Datos móviles"],
+    "📚 Educación": ["Libreta", "Libro", "Curso"],
+    "💊 Salud": ["Medicinas", "Consulta", "Vitaminas"],
+    "📦 Otros": ["Recarga", "Peluquería", "Ropa"],
+}
+RESUMENES = [
+    "Resumen de gastos", "Resumen de ingresos", "Resumen general", "Gráfico", "Mapa de calor",
+    "Análisis de hábitos", "Proyección", "Tendencia", "Exportar datos",
+]
+
+# =============================
+# DATOS SINTÉTICOS
+# =============================
+def generar_usuario(rng: random.Random, movimientos: int, ahora: datetime) -> dict:
+    user = {"ingresos": [], "gastos": [], "productos": {}, "presupuestos": {},
+            "recordatorio": {"activo": False, "hora": "20:00"}, "recurrentes": []}
+    for cat, nombres in PRODUCTOS.items():
+        # Algunos usuarios tienen variantes ("Arroz 2") para catálogos más grandes
+        extra = rng.randint(0, 10)
+        nombres = nombres + [f"{rng.choice(nombres)} {i}" for i in range(2, extra + 2)]
+        user["productos"][cat] = {n: rng.randint(5, 60) * 10 for n in nombres}
+        if rng.random() < 0.4:
+            user["presupuestos"][cat] = rng.randint(10, 200) * 100
+
+    inicio = ahora - timedelta(days=DIAS_HISTORIAL)
+    segundos = sorted(rng.uniform(0, DIAS_HISTORIAL * 86400) for _ in range(movimientos))
+    for s in segundos:
+        fecha = (inicio + timedelta(seconds=s)).isoformat()
+        if rng.random() < 0.08:
+            registrar_ingreso(user, {"monto": rng.randint(20, 300) * 100, "categoria": rng.choice(bot.CATEGORIAS_INGRESO), "fecha": fecha})
+            continue
+        cat = rng.choice(bot.CATEGORIAS_GASTO)
+        if rng.random() < 0.6:
+            producto = rng.choice(list(user["productos"][cat]))
+            if rng.random() < 0.05:
+                # Cambio de precio ocasional
+                user["productos"][cat][producto] = max(10, round(user["productos"][cat][producto] * rng.uniform(0.8, 1.3)))
+            registrar_gasto(user, {"monto": user["productos"][cat][producto], "categoria": cat, "producto": producto, "fecha": fecha})
+        else:
+            registrar_gasto(user, {"monto": rng.randint(1, 200) * 10, "categoria": cat, "producto": None, "fecha": fecha})
+    return user
+
+def generar(usuarios: int, movimientos: int, semilla: int = 1, ahora: datetime = None) -> dict:
+    """DB con la forma de finanzas.json: 'usuarios' usuarios con 'movimientos' movimientos cada uno."""
+    rng = random.Random(semilla)
+    ahora = ahora or datetime.now()
+    return {"users": {str(1000 + i): generar_usuario(rng, movimientos, ahora) for i in range(usuarios)}}
+
+# =============================
+# MEDICIÓN
+# =============================
+class _Mensaje:
+    # Lo mínimo que usan los handlers de resumen; las respuestas no salen a la red
+    def __init__(self, texto):
+        self.text = texto
+
+    async def reply_text(self, *args, **kwargs):
+        pass
+
+    reply_photo = reply_document = reply_text
+
+def _update(user_id, texto):
+    return SimpleNamespace(message=_Mensaje(texto), effective_user=SimpleNamespace(id=int(user_id)))
+
+def _medir(funcion, repeticiones: int) -> dict:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "min_ms": round(min(tiempos), 3),
+        "mediana_ms": round(statistics.median(tiempos), 3),
+        "media_ms": round(statistics.mean(tiempos), 3),
+    }
+
+def casos(db, loop) -> dict:
+    """{nombre: función sin argumentos} para una DB ya guardada en bot.DB_FILE."""
+    uid = next(iter(db["users"]))
+    user = db["users"][uid]
+    mes = datetime.now().strftime("%Y-%m")
+    por_cat_gastos = gastos_mes(user).get(mes, {})
+    por_cat_ingresos = {}
+    for i in user["ingresos"]:
+        if i["fecha"].startswith(mes):
+            por_cat_ingresos[i["categoria"]] = por_cat_ingresos.get(i["categoria"], 0) + i["monto"]
+    por_mes_gastos = {m: sum(c.values()) for m, c in gastos_mes(user).items()}
+
+    resultado = {
+        "db_load": bot._db_load,
+        "db_save": lambda: bot._db_save(db),
+        "get_user": lambda: bot._get_user(db, uid),
+        "saldo_actual": lambda: bot.saldo_actual(user),
+        "analisis_habitos": lambda: bot.analisis_habitos(user),
+        "grafico_categorias": lambda: graficos.grafico_categorias(por_cat_gastos, por_cat_ingresos),
+        "grafico_mapa_calor": lambda: graficos.mapa_calor(dict(gastos_dia(user))),
+        "grafico_tendencia": lambda: graficos.tendencia(dict(ingresos_mes(user)), por_mes_gastos),
+    }
+    for texto in RESUMENES:
+        # Como lo ve el usuario: incluye cargar la DB y, en los gráficos, el cache de PNG
+        resultado[f"resumen[{texto}]"] = (
+            lambda texto=texto: loop.run_until_complete(bot.resumen_opcion(_update(uid, texto), None))
+        )
+    return resultado
+
+def correr(escalas, repeticiones: int, semilla: int, filtro=None) -> dict:
+    resultados = {}
+    loop = asyncio.new_event_loop()
+    with tempfile.TemporaryDirectory() as carpeta:
+        bot.DB_FILE = Path(carpeta) / "finanzas.json"
+        for usuarios, movimientos in escalas:
+            escala = f"{usuarios}x{movimientos}"
+            db = generar(usuarios, movimientos, semilla)
+            bot._db_save(db)
+            resultados[escala] = {"bytes_db": bot.DB_FILE.stat().st_size}
+            for nombre, funcion in casos(db, loop).items():
+                if filtro and not any(f in nombre for f in filtro):
+                    continue
+                resultados[escala][nombre] = _medir(funcion, repeticiones)
+                print(f"{escala:>12} {nombre:<32} {resultados[escala][nombre]['mediana_ms']:>10.2f} ms", flush=True)
+    loop.close()
+    return resultados
+
+# =============================
+# COMPARACIÓN CON BASELINE
+# =============================
+def comparar(resultados: dict, baseline: dict, tolerancia: float, minimo_ms: float = 0.5) -> list:
+    """[(escala, caso, base_ms, actual_ms, proporción, es_regresión)] de los casos presentes en ambos."""
+    filas = []
+    for escala, medidos in resultados.items():
+        for caso, actual in medidos.items():
+            base = baseline.get(escala, {}).get(caso)
+            if not isinstance(actual, dict) or not isinstance(base, dict):
+                continue
+            b, a = base["mediana_ms"], actual["mediana_ms"]
+            proporcion = a / b if b else 1.0
+            # Las diferencias de menos de minimo_ms son ruido aunque la proporción sea grande
+            regresion = proporcion > 1 + tolerancia and a - b > minimo_ms
+            filas.append((escala, caso, b, a, proporcion, regresion))
+    return filas
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks con datos sintéticos")
+    parser.add_argument("--escalas", default="10x100,100x1000,5x20000", help="USUARIOSxMOVIMIENTOS separados por coma")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--casos", default="", help="solo los casos que contengan alguno de estos textos, separados por coma")
+    parser.add_argument("--salida", default="bench_resultados.json")
+    parser.add_argument("--baseline", help="resultados anteriores con los que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="regresión si la mediana sube más de esta fracción")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    warnings.filterwarnings("ignore")
+    escalas = [tuple(int(n) for n in e.lower().split("x")) for e in args.escalas.split(",") if e]
+    filtro = [c for c in args.casos.split(",") if c]
+
+    resultados = correr(escalas, args.repeticiones, args.semilla, filtro)
+    salida = {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "maquina": platform.machine(),
+            "semilla": args.semilla,
+            "repeticiones": args.repeticiones,
+        },
+        "resultados": resultados,
+    }
+
+    regresiones = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["resultados"]
+        filas = comparar(resultados, baseline, args.tolerancia)
+        print("\nComparación con", args.baseline)
+        for escala, caso, b, a, proporcion, regresion in filas:
+            print(f"{escala:>12} {caso:<32} {b:>10.2f} → {a:>10.2f} ms  x{proporcion:.2f}{'  ⚠️ REGRESIÓN' if regresion else ''}")
+        regresiones = [f for f in filas if f[5]]
+        salida["comparacion"] = [
+            {"escala": e, "caso": c, "base_ms": b, "actual_ms": a, "proporcion": round(p, 3), "regresion": r}
+            for e, c, b, a, p, r in filas
+        ]
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(salida, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados en {args.salida}")
+    sys.exit(1 if regresiones else 0)
+
+if __name__ == "__main__":
+    main()
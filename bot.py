@@ -1,19 +1,38 @@
+import arranque  # primero: la cronología de arranque empieza al importarlo
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, filters,
-    ContextTypes, ConversationHandler, CallbackQueryHandler, JobQueue
+    ContextTypes, ConversationHandler, CallbackQueryHandler, JobQueue, TypeHandler,
+    PicklePersistence, PersistenceInput
 )
-import json
+import asyncio
+import sys
 from pathlib import Path
-from datetime import datetime, time
-import matplotlib.pyplot as plt
-import seaborn as sns
+from datetime import date, datetime, time
 import io
 import logging
-import signal
-import pickle
 import os
-from telegram import Bot
+
+from almacen import AlmacenCompartido, Conflicto, proteger
+from busqueda import CacheBusqueda
+from cache_teclados import CacheTeclados
+from cliente_http import configurar_red, crear_bot, log_metricas_red
+import concurrencia
+from consumo import STATS_TOP, Contabilidad, reporte_texto
+from dedupe import UpdatesProcesados
+from graficos import (
+    CacheGraficos, dias_validos, grafico_categorias, mapa_calor, meses_validos, precargar, tendencia
+)
+from historial_precios import precio_en, registrar_precio, variacion
+from entrada_rapida import parsear as parsear_entrada, parsear_lote
+from indice_productos import IndiceProductos, teclado_paginado
+from instrumentacion import ADMIN_IDS, comando_metricas, instrumentar, partir_mensaje
+import metricas
+import perfilador
+from presupuestos import gastos_dia, gastos_mes, historial, ingresos_mes, registrar_gasto, registrar_ingreso
+from proyeccion import proyectar
+from recurrentes import aplicar_vencidas, describir, parsear_regla
+from trabajadores import TRABAJADORES, Frente, db_completa, juntar_partes
 
 # Configuración inicial
 logging.basicConfig(
@@ -23,10 +42,20 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 TOKEN = os.getenv("TOKEN")
-bot = Bot(token=TOKEN)
 
 DB_FILE = Path(__file__).parent / "finanzas.json"
-STATE_FILE = Path(__file__).parent / "conversation_states.pkl"
+# Con el nombre del módulo: bot, bot2 y bot3 en la misma carpeta no se pisan los estados
+STATE_FILE = Path(__file__).parent / f"conversaciones.{Path(__file__).stem}.pkl"
+PERSISTENCIA_INTERVALO = float(os.getenv("PERSISTENCIA_INTERVALO", 30))
+RECURRENTES_INTERVALO = float(os.getenv("RECURRENTES_INTERVALO", 3600))
+# Con el nombre del módulo: bot, bot2 y bot3 en la misma carpeta tienen tokens distintos y sus
+# update_id se repiten entre sí
+updates_procesados = UpdatesProcesados(Path(__file__).parent / f"updates_procesados.{Path(__file__).stem}.json")
+cache_teclados = CacheTeclados()
+cache_busqueda = CacheBusqueda()
+cache_graficos = CacheGraficos()
+contabilidad = Contabilidad()
+RESULTADOS_POR_PAGINA = 10
 
 # =============================
 # ESTADOS
@@ -36,6 +65,8 @@ SELECT_GASTO_CAT, SELECT_PRODUCTO_GASTO, GASTO_MANUAL = range(3,6)
 PRODUCTO_OPCION, PRODUCTO_NUEVO, PRODUCTO_ELIMINAR, PRODUCTO_ACTUALIZAR, PRODUCTO_ACTUALIZAR_PRECIO = range(6,11)
 RESUMEN_OPCION = 11
 SET_BUDGET_CAT, SET_BUDGET_AMOUNT = range(12,14)
+RECURRENTE_EDITAR = 14
+PRODUCTO_HISTORIAL = 15
 
 # =============================
 # TECLADOS
@@ -59,38 +90,43 @@ categorias_gasto_keyboard = ReplyKeyboardMarkup(
 )
 
 productos_keyboard = ReplyKeyboardMarkup(
-    [["Agregar Producto", "Eliminar Producto", "Actualizar Producto"], ["Ver Productos"], ["🔙 Menú principal"]],
+    [["Agregar Producto", "Eliminar Producto", "Actualizar Producto"], ["Ver Productos", "Historial de precios"], ["🔙 Menú principal"]],
     resize_keyboard=True
 )
 
 resumen_keyboard = ReplyKeyboardMarkup(
     [["Resumen de gastos", "Resumen de ingresos"], 
-     ["Resumen general", "Gráfico", "Análisis de hábitos"],
+     ["Resumen general", "Gráfico", "Mapa de calor"],
+     ["Análisis de hábitos", "Proyección", "Tendencia"],
      ["Exportar datos", "🔙 Menú principal"]],
     resize_keyboard=True
 )
 
 config_keyboard = ReplyKeyboardMarkup(
-    [["💸 Establecer presupuesto", "⏰ Recordatorios"], ["🔙 Menú principal"]],
+    [["💸 Establecer presupuesto", "⏰ Recordatorios"], ["🔁 Recurrentes"], ["🔙 Menú principal"]],
     resize_keyboard=True
 )
 
 # =============================
 # DB
 # =============================
-def _db_load():
-    if DB_FILE.exists():
-        try:
-            with DB_FILE.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            logger.error("Error al cargar DB, creando nueva")
-            return {"users": {}}
-    return {"users": {}}
+def _almacen():
+    # DB_FILE cambia en las pruebas y en los trabajadores (una parte por proceso)
+    return AlmacenCompartido(DB_FILE)
 
-def _db_save(db):
-    with DB_FILE.open("w", encoding="utf-8") as f:
-        json.dump(db, f, indent=2, ensure_ascii=False)
+def _db_load():
+    with metricas.medir("db", "load"):
+        return _almacen().cargar()
+
+def _db_save(db, user_id=None):
+    # Con un usuario, solo se reemplaza ese usuario en el archivo: un handler o job de otro
+    # usuario que guardó mientras tanto no pierde lo suyo. Sin usuario se escribe todo (pruebas).
+    with metricas.medir("db", "save"):
+        if user_id is None:
+            _almacen().guardar_todo(db)
+        else:
+            _almacen().guardar_usuario(db, user_id)
+    metricas.fijar("db_bytes", DB_FILE.name, DB_FILE.stat().st_size)
 
 def _get_user(db, user_id):
     uid = str(user_id)
@@ -109,9 +145,38 @@ def _get_user(db, user_id):
         user["presupuestos"] = {}
     if "recordatorio" not in user:
         user["recordatorio"] = {"activo": False, "hora": "20:00"}
-    
+    if "recurrentes" not in user:
+        user["recurrentes"] = []
+
+    cache_teclados.validar(uid, user.get("catalogo_version", 0))
     return user
 
+def _catalogo_modificado(user, user_id):
+    # Invalida los teclados cacheados de productos del usuario
+    user["catalogo_version"] = user.get("catalogo_version", 0) + 1
+    cache_teclados.invalidar(user_id)
+
+def _indice_productos(user_id, user=None):
+    def construir():
+        nonlocal user
+        if user is None:
+            user = _get_user(_db_load(), user_id)
+        version = user.get("catalogo_version", 0)
+        return version, IndiceProductos(user["productos"], version)
+    return cache_teclados.obtener(user_id, ("indice",), construir)
+
+def _producto_de_callback(user_id, data, categoria=None):
+    # Los teclados enviados antes de los ids cortos usaban el nombre ('Arroz' o 'Comida|Arroz')
+    if data.startswith("p:"):
+        return _indice_productos(user_id).por_id.get(data[2:])
+    if "|" in data:
+        return tuple(data.split("|", 1))
+    return (categoria, data)
+
+def _version_movimientos(user):
+    # Ingresos y gastos solo se agregan al final: sus largos identifican el estado del historial
+    return len(user['ingresos']), len(user['gastos'])
+
 def saldo_actual(user):
     total_ingresos = sum(i['monto'] for i in user.get('ingresos', []))
     total_gastos = sum(g['monto'] for g in user.get('gastos', []))
@@ -124,6 +189,20 @@ def fmt_cup(value: float) -> str:
     s = f"{value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
     return f"{s} CUP"
 
+def _texto_avisos(categoria, avisos):
+    msg = ""
+    if "atipico" in avisos:
+        monto, media, _ = avisos["atipico"]
+        comparacion = "mayor" if monto > media else "menor"
+        msg += f"\n🧐 {fmt_cup(monto)} es mucho {comparacion} que tu gasto habitual en '{categoria}' ({fmt_cup(media)} en promedio)"
+    if "presupuesto" in avisos:
+        umbral, gastado, presupuesto = avisos["presupuesto"]
+        if umbral >= 100:
+            msg += f"\n🚨 Superaste el presupuesto de '{categoria}': {fmt_cup(gastado)} de {fmt_cup(presupuesto)}"
+        else:
+            msg += f"\n🔔 Llevas el {umbral}% del presupuesto de '{categoria}': {fmt_cup(gastado)} de {fmt_cup(presupuesto)}"
+    return msg
+
 # =============================
 # START
 # =============================
@@ -162,18 +241,21 @@ async def ingreso_monto(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         monto = float(update.message.text)
         categoria = context.user_data.get('categoria_ingreso', 'Otro')
-        user['ingresos'].append({
+        registrar_ingreso(user, {
             "monto": monto, 
             "categoria": categoria, 
             "fecha": datetime.now().isoformat()
         })
-        _db_save(db)
+        _db_save(db, update.effective_user.id)
         await update.message.reply_text(
             f"✅ Ingreso registrado: {fmt_cup(monto)} en '{categoria}'", 
             reply_markup=main_keyboard
         )
     except ValueError:
         await update.message.reply_text("⚠️ Monto inválido. Debe ser un número (ej: 150 o 75.50).", reply_markup=main_keyboard)
+    except Conflicto:
+        # Lo reintenta almacen.proteger con los datos nuevos
+        raise
     except Exception as e:
         logger.error(f"Error en ingreso_monto: {e}")
         await update.message.reply_text("😵‍💫 Error inesperado. Intenta nuevamente.", reply_markup=main_keyboard)
@@ -186,6 +268,26 @@ async def gasto_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Selecciona la categoría del gasto:", reply_markup=categorias_gasto_keyboard)
     return SELECT_GASTO_CAT
 
+def _teclado_productos_gasto(user_id, categoria, pagina=0, filtro=""):
+    indice = _indice_productos(user_id)
+    resultados = indice.buscar(filtro, categoria)
+    if not resultados and not filtro:
+        return indice.version, None
+
+    extras = [
+        [InlineKeyboardButton("➕ Agregar producto nuevo", callback_data="nuevo")],
+        [InlineKeyboardButton("🔙 Menú principal", callback_data="cancel")]
+    ]
+    return indice.version, teclado_paginado(resultados, pagina, extras=extras)
+
+def _teclado_gasto(context, user_id, pagina=0):
+    categoria = context.user_data.get('gasto_categoria')
+    filtro = context.user_data.get('filtro_productos', "")
+    return cache_teclados.obtener(
+        user_id, ("gasto", categoria, pagina, filtro),
+        lambda: _teclado_productos_gasto(user_id, categoria, pagina, filtro)
+    )
+
 async def gasto_categoria(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
     if text == "🔙 Menú principal":
@@ -193,61 +295,137 @@ async def gasto_categoria(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
     context.user_data['gasto_categoria'] = text
-    db = _db_load()
-    user = _get_user(db, update.effective_user.id)
-    categoria_productos = user['productos'].get(text, {})
-
-    if categoria_productos:
-        keyboard = [[InlineKeyboardButton(p, callback_data=p)] for p in categoria_productos.keys()]
-        keyboard.append([InlineKeyboardButton("➕ Agregar producto nuevo", callback_data="nuevo")])
-        keyboard.append([InlineKeyboardButton("🔙 Menú principal", callback_data="cancel")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("Selecciona el producto:", reply_markup=reply_markup)
+    context.user_data.pop('filtro_productos', None)
+    reply_markup = _teclado_gasto(context, update.effective_user.id)
+
+    if reply_markup:
+        await update.message.reply_text("Selecciona el producto (o escribe para buscar):", reply_markup=reply_markup)
         return SELECT_PRODUCTO_GASTO
     else:
-        await update.message.reply_text("No hay productos en esta categoría. Puedes escribir el monto manualmente o agregar un producto nuevo:")
+        await update.message.reply_text("No hay productos en esta categoría. Puedes escribir el monto manualmente o agregar productos nuevos (uno por línea):")
         return GASTO_MANUAL
 
+async def gasto_filtrar_producto(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = update.message.text.strip()
+    # Tocar otra categoría del teclado cambia de categoría en vez de buscar
+    if text in CATEGORIAS_GASTO or text == "🔙 Menú principal":
+        return await gasto_categoria(update, context)
+
+    context.user_data['filtro_productos'] = text
+    reply_markup = _teclado_gasto(context, update.effective_user.id)
+    await update.message.reply_text(f"🔎 Productos que empiezan por '{text}':", reply_markup=reply_markup)
+    return SELECT_PRODUCTO_GASTO
+
 async def gasto_producto_seleccion(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
-    data = _db_load()
-    user = _get_user(data, query.from_user.id)
+    user_id = query.from_user.id
 
+    # El callback se responde en cada rama y, al registrar, recién después de guardar: si hay
+    # Conflicto almacen.proteger repite el handler y no puede responderlo dos veces
     if query.data == "cancel":
+        await query.answer()
         await query.message.reply_text("Has vuelto al menú principal ✅", reply_markup=main_keyboard)
         return ConversationHandler.END
     elif query.data == "nuevo":
-        await query.message.reply_text("Escribe el nombre del nuevo producto y su precio separado por coma (Ej: Arroz, 50):")
+        await query.answer()
+        await query.message.reply_text("Escribe el nombre del nuevo producto y su precio separado por coma (Ej: Arroz, 50). Puedes enviar varios, uno por línea:")
         return GASTO_MANUAL
+    elif query.data == "noop":
+        await query.answer()
+        return SELECT_PRODUCTO_GASTO
+    elif query.data.startswith("pag:"):
+        await query.answer()
+        await query.edit_message_reply_markup(reply_markup=_teclado_gasto(context, user_id, int(query.data[4:])))
+        return SELECT_PRODUCTO_GASTO
     else:
-        producto = query.data
-        precio = user['productos'][context.user_data['gasto_categoria']][producto]
+        categoria, producto = _producto_de_callback(user_id, query.data, context.user_data.get('gasto_categoria')) or (None, None)
+        data = _db_load()
+        user = _get_user(data, user_id)
+        if producto not in user['productos'].get(categoria, {}):
+            await query.answer()
+            await query.message.reply_text("⚠️ Producto no encontrado", reply_markup=main_keyboard)
+            return ConversationHandler.END
+
+        precio = user['productos'][categoria][producto]
         saldo = saldo_actual(user)
         if saldo < precio:
+            await query.answer()
             await query.message.reply_text(
                 f"⚠️ Saldo insuficiente: {fmt_cup(saldo)}\nNo puedes registrar este gasto de {fmt_cup(precio)}", 
                 reply_markup=main_keyboard
             )
             return ConversationHandler.END
         
-        user['gastos'].append({
+        avisos = registrar_gasto(user, {
             "monto": precio, 
-            "categoria": context.user_data['gasto_categoria'], 
+            "categoria": categoria, 
             "producto": producto, 
             "fecha": datetime.now().isoformat()
         })
-        _db_save(data)
+        _db_save(data, update.effective_user.id)
+        await query.answer()
         await query.message.reply_text(
-            f"💸 Gasto registrado: {producto} - {fmt_cup(precio)}", 
+            f"💸 Gasto registrado: {producto} - {fmt_cup(precio)}" + _texto_avisos(categoria, avisos), 
+            reply_markup=main_keyboard
+        )
+        return ConversationHandler.END
+
+def _errores_lote(errores, formato):
+    msg = "⚠️ No se registró nada. Revisa estas líneas:\n"
+    msg += "\n".join(f"{n}. {linea}" for n, linea in errores)
+    return msg + f"\n\nFormato: una línea por elemento, {formato}."
+
+async def gasto_lote(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Varias líneas en un mensaje: se validan todas, se comprueba el saldo contra el total
+    # y se guarda una sola vez
+    items, errores = parsear_lote(update.message.text)
+    if errores or not items:
+        await update.message.reply_text(_errores_lote(errores, "'nombre, monto' o solo 'monto'"), reply_markup=main_keyboard)
+        return ConversationHandler.END
+
+    user_id = update.effective_user.id
+    db = _db_load()
+    user = _get_user(db, user_id)
+    categoria = context.user_data.get('gasto_categoria')
+    total = sum(i['monto'] for i in items)
+    saldo = saldo_actual(user)
+    if saldo < total:
+        await update.message.reply_text(
+            f"⚠️ Saldo insuficiente: {fmt_cup(saldo)}\nNo puedes registrar estos {len(items)} gastos por {fmt_cup(total)}.",
             reply_markup=main_keyboard
         )
         return ConversationHandler.END
 
+    fecha = datetime.now().isoformat()
+    nuevos = 0
+    lineas = []
+    avisos = {}
+    for n, item in enumerate(items, 1):
+        producto = item['producto']
+        if producto:
+            productos_cat = user['productos'].setdefault(categoria, {})
+            nuevos += producto not in productos_cat
+            productos_cat[producto] = item['monto']
+        avisos.update(registrar_gasto(user, {"monto": item['monto'], "categoria": categoria, "producto": producto, "fecha": fecha}))
+        lineas.append(f"{n}. {producto or 'Sin producto'}: {fmt_cup(item['monto'])}")
+    if any(i['producto'] for i in items):
+        _catalogo_modificado(user, user_id)
+    _db_save(db, update.effective_user.id)
+
+    msg = f"💸 {len(items)} gastos registrados en '{categoria}' por {fmt_cup(total)}"
+    if nuevos:
+        msg += f" ({nuevos} productos nuevos)"
+    msg += ":\n" + "\n".join(lineas) + _texto_avisos(categoria, avisos)
+    await update.message.reply_text(msg, reply_markup=main_keyboard)
+    return ConversationHandler.END
+
 async def gasto_manual(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if "\n" in update.message.text.strip():
+        return await gasto_lote(update, context)
     db = _db_load()
     user = _get_user(db, update.effective_user.id)
     categoria = context.user_data.get('gasto_categoria')
+    nuevo = None
     try:
         if "," in update.message.text:
             nombre, monto = map(str.strip, update.message.text.split(","))
@@ -255,7 +433,9 @@ async def gasto_manual(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if categoria not in user['productos']:
                 user['productos'][categoria] = {}
             user['productos'][categoria][nombre] = monto
-            await update.message.reply_text(f"✅ Producto '{nombre}' agregado automáticamente a {fmt_cup(monto)} en '{categoria}'")
+            registrar_precio(user, categoria, nombre, monto, datetime.now().isoformat())
+            _catalogo_modificado(user, update.effective_user.id)
+            nuevo = nombre
         else:
             monto = float(update.message.text)
 
@@ -267,20 +447,125 @@ async def gasto_manual(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ConversationHandler.END
 
-        user['gastos'].append({
+        avisos = registrar_gasto(user, {
             "monto": monto, 
             "categoria": categoria, 
             "fecha": datetime.now().isoformat()
         })
-        _db_save(db)
-        await update.message.reply_text(f"💸 Gasto registrado: {fmt_cup(monto)} en '{categoria}'", reply_markup=main_keyboard)
+        _db_save(db, update.effective_user.id)
+        # Los mensajes van después de guardar: un Conflicto repite el handler entero
+        if nuevo:
+            await update.message.reply_text(f"✅ Producto '{nuevo}' agregado automáticamente a {fmt_cup(monto)} en '{categoria}'")
+        await update.message.reply_text(
+            f"💸 Gasto registrado: {fmt_cup(monto)} en '{categoria}'" + _texto_avisos(categoria, avisos),
+            reply_markup=main_keyboard
+        )
     except ValueError:
         await update.message.reply_text("⚠️ Formato inválido. Usa 'nombre, monto' o solo 'monto' (ej: Arroz, 50 o 75.50).", reply_markup=main_keyboard)
+    except Conflicto:
+        raise
     except Exception as e:
         logger.error(f"Error en gasto_manual: {e}")
         await update.message.reply_text("😵‍💫 Error inesperado. Intenta nuevamente.", reply_markup=main_keyboard)
     return ConversationHandler.END
 
+# =============================
+# ENTRADA RÁPIDA
+# =============================
+async def entrada_rapida(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # "arroz 50", "comida arroz 50" o "+1500 salario" fuera de cualquier conversación:
+    # se registra con una sola lectura y una sola escritura de la DB
+    user_id = update.effective_user.id
+    db = _db_load()
+    user = _get_user(db, user_id)
+    entrada = parsear_entrada(update.message.text, _indice_productos(user_id, user), CATEGORIAS_GASTO, CATEGORIAS_INGRESO)
+    if not entrada:
+        await update.message.reply_text(
+            "Usa los botones o escribe directamente, por ejemplo:\n"
+            "• 'arroz 50' o 'comida arroz 50' para un gasto\n"
+            "• '+1500 salario' para un ingreso",
+            reply_markup=main_keyboard
+        )
+        return
+
+    monto = entrada['monto']
+    categoria = entrada['categoria']
+    if entrada['tipo'] == "ingreso":
+        registrar_ingreso(user, {"monto": monto, "categoria": categoria, "fecha": datetime.now().isoformat()})
+        _db_save(db, update.effective_user.id)
+        await update.message.reply_text(f"✅ Ingreso registrado: {fmt_cup(monto)} en '{categoria}'", reply_markup=main_keyboard)
+        return
+
+    saldo = saldo_actual(user)
+    if saldo < monto:
+        await update.message.reply_text(
+            f"⚠️ Saldo insuficiente: {fmt_cup(saldo)}\nNo puedes registrar este gasto de {fmt_cup(monto)}.",
+            reply_markup=main_keyboard
+        )
+        return
+
+    producto = entrada['producto']
+    if entrada['nuevo']:
+        user['productos'].setdefault(categoria, {})[producto] = monto
+        _catalogo_modificado(user, user_id)
+    avisos = registrar_gasto(user, {"monto": monto, "categoria": categoria, "producto": producto, "fecha": datetime.now().isoformat()})
+    _db_save(db, update.effective_user.id)
+    detalle = f"{producto} - " if producto else ""
+    nuevo = " (producto nuevo)" if entrada['nuevo'] else ""
+    await update.message.reply_text(
+        f"💸 Gasto registrado: {detalle}{fmt_cup(monto)} en '{categoria}'{nuevo}" + _texto_avisos(categoria, avisos),
+        reply_markup=main_keyboard
+    )
+
+# =============================
+# BÚSQUEDA
+# =============================
+def _pagina_busqueda(user_id, consulta, pagina=0):
+    user = _get_user(_db_load(), user_id)
+    indice = cache_busqueda.obtener(user_id, user)
+    numeros = indice.buscar(consulta)
+    if not numeros:
+        return f"🔎 Sin resultados para '{consulta}'.", None
+
+    paginas = -(-len(numeros) // RESULTADOS_POR_PAGINA)
+    pagina = min(max(pagina, 0), paginas - 1)
+    msg = f"🔎 {len(numeros)} resultados para '{consulta}':\n"
+    for tipo, pos in indice.pagina(numeros, pagina, RESULTADOS_POR_PAGINA):
+        mov = user['ingresos' if tipo == "ingreso" else 'gastos'][pos]
+        producto = f" → {mov['producto']}" if mov.get('producto') else ""
+        msg += f"- {str(mov.get('fecha', ''))[:10]} {tipo.capitalize()} {mov['categoria']}{producto}: {fmt_cup(mov['monto'])}\n"
+
+    if paginas == 1:
+        return msg, None
+    nav = []
+    if pagina > 0:
+        nav.append(InlineKeyboardButton("◀️", callback_data=f"bus:{pagina - 1}"))
+    nav.append(InlineKeyboardButton(f"{pagina + 1}/{paginas}", callback_data="bus:noop"))
+    if pagina < paginas - 1:
+        nav.append(InlineKeyboardButton("▶️", callback_data=f"bus:{pagina + 1}"))
+    return msg, InlineKeyboardMarkup([nav])
+
+async def buscar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    consulta = " ".join(context.args).strip()
+    if not consulta:
+        await update.message.reply_text(
+            "Uso: /buscar <texto>\nBusca en categorías, productos y montos. Ej: /buscar arroz, /buscar comida 50",
+            reply_markup=main_keyboard
+        )
+        return
+    context.user_data['busqueda'] = consulta
+    msg, keyboard = _pagina_busqueda(update.effective_user.id, consulta)
+    await update.message.reply_text(msg, reply_markup=keyboard)
+
+async def buscar_pagina(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    consulta = context.user_data.get('busqueda')
+    if query.data == "bus:noop" or not consulta:
+        return
+    msg, keyboard = _pagina_busqueda(query.from_user.id, consulta, int(query.data[4:]))
+    await query.edit_message_text(msg, reply_markup=keyboard)
+
 # =============================
 # PRODUCTOS
 # =============================
@@ -288,49 +573,116 @@ async def productos_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("📦 Gestión de productos:", reply_markup=productos_keyboard)
     return PRODUCTO_OPCION
 
+def _texto_productos(user_id):
+    user = _get_user(_db_load(), user_id)
+    msg = "📦 Productos guardados:\n"
+    for cat, prods in user['productos'].items():
+        for p, val in prods.items():
+            msg += f"- {cat} → {p}: {fmt_cup(val)}\n"
+    if not user['productos']:
+        msg += "No tienes productos registrados aún."
+    return user.get('catalogo_version', 0), msg
+
+def _teclado_productos(user_id, pagina=0, filtro=""):
+    indice = _indice_productos(user_id)
+    resultados = indice.buscar(filtro)
+    if not resultados and not filtro:
+        return indice.version, None
+
+    extras = [[InlineKeyboardButton("🔙 Menú principal", callback_data="cancel")]]
+    return indice.version, teclado_paginado(resultados, pagina, etiqueta=lambda c, p: f"{c}: {p}", extras=extras)
+
+def _teclado_lista_productos(context, user_id, pagina=0):
+    # El mismo teclado sirve para eliminar y actualizar
+    filtro = context.user_data.get('filtro_productos', "")
+    return cache_teclados.obtener(
+        user_id, ("productos", pagina, filtro),
+        lambda: _teclado_productos(user_id, pagina, filtro)
+    )
+
+# Botón del menú -> acción; todas usan el mismo selector de productos
+ACCIONES_PRODUCTOS = {"Eliminar Producto": "eliminar", "Actualizar Producto": "actualizar", "Historial de precios": "consultar"}
+ESTADOS_ACCION = {"eliminar": PRODUCTO_ELIMINAR, "actualizar": PRODUCTO_ACTUALIZAR, "consultar": PRODUCTO_HISTORIAL}
+
 async def productos_opcion(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
-    db = _db_load()
-    user = _get_user(db, update.effective_user.id)
+    user_id = update.effective_user.id
 
     if text == "🔙 Menú principal":
         await update.message.reply_text("Volvemos al menú principal.", reply_markup=main_keyboard)
         return ConversationHandler.END
     elif text == "Agregar Producto":
-        await update.message.reply_text("Escribe el nombre del producto y precio separados por coma (Ej: Arroz, 50):")
+        await update.message.reply_text("Escribe el nombre del producto y precio separados por coma (Ej: Arroz, 50). Puedes enviar varios, uno por línea:")
         return PRODUCTO_NUEVO
-    elif text == "Eliminar Producto":
-        productos = [(cat,p) for cat in user['productos'] for p in user['productos'][cat]]
-        if not productos:
-            await update.message.reply_text("No tienes productos para eliminar.", reply_markup=productos_keyboard)
-            return PRODUCTO_OPCION
-        keyboard = [[InlineKeyboardButton(f"{c}: {p}", callback_data=f"{c}|{p}")] for c,p in productos]
-        keyboard.append([InlineKeyboardButton("🔙 Menú principal", callback_data="cancel")])
-        await update.message.reply_text("Selecciona el producto a eliminar:", reply_markup=InlineKeyboardMarkup(keyboard))
-        return PRODUCTO_ELIMINAR
-    elif text == "Actualizar Producto":
-        productos = [(cat,p) for cat in user['productos'] for p in user['productos'][cat]]
-        if not productos:
-            await update.message.reply_text("No tienes productos para actualizar.", reply_markup=productos_keyboard)
+    elif text in ACCIONES_PRODUCTOS:
+        accion = ACCIONES_PRODUCTOS[text]
+        context.user_data['accion_productos'] = accion
+        context.user_data.pop('filtro_productos', None)
+        keyboard = _teclado_lista_productos(context, user_id)
+        if not keyboard:
+            await update.message.reply_text(f"No tienes productos para {accion}.", reply_markup=productos_keyboard)
             return PRODUCTO_OPCION
-        keyboard = [[InlineKeyboardButton(f"{c}: {p}", callback_data=f"{c}|{p}")] for c,p in productos]
-        keyboard.append([InlineKeyboardButton("🔙 Menú principal", callback_data="cancel")])
-        await update.message.reply_text("Selecciona el producto a actualizar:", reply_markup=InlineKeyboardMarkup(keyboard))
-        return PRODUCTO_ACTUALIZAR
+        await update.message.reply_text(f"Selecciona el producto a {accion} (o escribe para buscar):", reply_markup=keyboard)
+        return ESTADOS_ACCION[accion]
     elif text == "Ver Productos":
-        msg = "📦 Productos guardados:\n"
-        for cat, prods in user['productos'].items():
-            for p, val in prods.items():
-                msg += f"- {cat} → {p}: {fmt_cup(val)}\n"
-        if not user['productos']:
-            msg += "No tienes productos registrados aún."
-        await update.message.reply_text(msg, reply_markup=productos_keyboard)
+        msg = cache_teclados.obtener(user_id, ("ver",), lambda: _texto_productos(user_id))
+        for parte in partir_mensaje(msg):
+            await update.message.reply_text(parte, reply_markup=productos_keyboard)
         return PRODUCTO_OPCION
     else:
         await update.message.reply_text("Opción no válida", reply_markup=productos_keyboard)
         return PRODUCTO_OPCION
 
+async def productos_filtrar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = update.message.text.strip()
+    # Los botones del menú de productos siguen funcionando mientras se elige
+    if text in ("🔙 Menú principal", "Agregar Producto", "Ver Productos") or text in ACCIONES_PRODUCTOS:
+        return await productos_opcion(update, context)
+
+    context.user_data['filtro_productos'] = text
+    keyboard = _teclado_lista_productos(context, update.effective_user.id)
+    await update.message.reply_text(f"🔎 Productos que empiezan por '{text}':", reply_markup=keyboard)
+    return ESTADOS_ACCION[context.user_data.get('accion_productos', "actualizar")]
+
+async def _paginar_productos(query, context):
+    if query.data == "noop":
+        return True
+    if query.data.startswith("pag:"):
+        keyboard = _teclado_lista_productos(context, query.from_user.id, int(query.data[4:]))
+        await query.edit_message_reply_markup(reply_markup=keyboard)
+        return True
+    return False
+
+async def producto_lote(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Un producto por línea, todos en '📦 Otros', con una sola escritura
+    items, errores = parsear_lote(update.message.text, requiere_nombre=True)
+    productos = [("📦 Otros", i['producto'], i['monto']) for i in items]
+    if errores or not items:
+        await update.message.reply_text(_errores_lote(errores, "'nombre, precio'"), reply_markup=productos_keyboard)
+        return PRODUCTO_OPCION
+
+    user_id = update.effective_user.id
+    db = _db_load()
+    user = _get_user(db, user_id)
+    fecha = datetime.now().isoformat()
+    nuevos = 0
+    lineas = []
+    for n, (categoria, nombre, precio) in enumerate(productos, 1):
+        productos_cat = user['productos'].setdefault(categoria, {})
+        nuevos += nombre not in productos_cat
+        productos_cat[nombre] = precio
+        registrar_precio(user, categoria, nombre, precio, fecha)
+        lineas.append(f"{n}. {categoria} → {nombre}: {fmt_cup(precio)}")
+    _catalogo_modificado(user, user_id)
+    _db_save(db, update.effective_user.id)
+
+    msg = f"✅ {len(productos)} productos guardados ({nuevos} nuevos, {len(productos) - nuevos} actualizados):\n"
+    await update.message.reply_text(msg + "\n".join(lineas), reply_markup=productos_keyboard)
+    return PRODUCTO_OPCION
+
 async def agregar_producto(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if "\n" in update.message.text.strip():
+        return await producto_lote(update, context)
     db = _db_load()
     user = _get_user(db, update.effective_user.id)
     try:
@@ -343,10 +695,14 @@ async def agregar_producto(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if categoria not in user['productos']:
             user['productos'][categoria] = {}
         user['productos'][categoria][nombre] = precio
-        _db_save(db)
+        registrar_precio(user, categoria, nombre, precio, datetime.now().isoformat())
+        _catalogo_modificado(user, update.effective_user.id)
+        _db_save(db, update.effective_user.id)
         await update.message.reply_text(f"✅ Producto '{nombre}' agregado a {fmt_cup(precio)} en '{categoria}'", reply_markup=productos_keyboard)
     except ValueError:
         await update.message.reply_text("⚠️ Formato inválido. Usa 'nombre, precio' (ej: Arroz, 50)", reply_markup=productos_keyboard)
+    except Conflicto:
+        raise
     except Exception as e:
         logger.error(f"Error en agregar_producto: {e}")
         await update.message.reply_text("😵‍💫 Error inesperado. Intenta nuevamente.", reply_markup=productos_keyboard)
@@ -354,26 +710,35 @@ async def agregar_producto(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def eliminar_producto(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
+    # Al eliminar, el callback se responde después de guardar (ver gasto_producto_seleccion)
+    if query.data in ("cancel", "noop") or query.data.startswith("pag:"):
+        await query.answer()
     
     if query.data == "cancel":
         await query.message.reply_text("Operación cancelada.", reply_markup=productos_keyboard)
         return PRODUCTO_OPCION
+    if await _paginar_productos(query, context):
+        return PRODUCTO_ELIMINAR
     
     try:
-        categoria, producto = query.data.split("|")
+        categoria, producto = _producto_de_callback(query.from_user.id, query.data) or (None, None)
         db = _db_load()
         user = _get_user(db, query.from_user.id)
         
-        if categoria in user['productos'] and producto in user['productos'][categoria]:
+        if producto in user['productos'].get(categoria, {}):
             del user['productos'][categoria][producto]
             # Eliminar categoría si queda vacía
             if not user['productos'][categoria]:
                 del user['productos'][categoria]
-            _db_save(db)
+            _catalogo_modificado(user, query.from_user.id)
+            _db_save(db, update.effective_user.id)
+            await query.answer()
             await query.message.reply_text(f"❌ Producto '{producto}' eliminado de '{categoria}'", reply_markup=productos_keyboard)
         else:
+            await query.answer()
             await query.message.reply_text("⚠️ Producto no encontrado", reply_markup=productos_keyboard)
+    except Conflicto:
+        raise
     except Exception as e:
         logger.error(f"Error en eliminar_producto: {e}")
         await query.message.reply_text("😵‍💫 Error al eliminar producto", reply_markup=productos_keyboard)
@@ -387,9 +752,15 @@ async def actualizar_producto(update: Update, context: ContextTypes.DEFAULT_TYPE
     if query.data == "cancel":
         await query.message.reply_text("Operación cancelada.", reply_markup=productos_keyboard)
         return PRODUCTO_OPCION
+    if await _paginar_productos(query, context):
+        return PRODUCTO_ACTUALIZAR
     
     try:
-        categoria, producto = query.data.split("|")
+        seleccion = _producto_de_callback(query.from_user.id, query.data)
+        if not seleccion:
+            await query.message.reply_text("⚠️ Producto no encontrado", reply_markup=productos_keyboard)
+            return PRODUCTO_OPCION
+        categoria, producto = seleccion
         context.user_data['producto_actualizar'] = (categoria, producto)
         await query.message.reply_text(f"Actualizando '{producto}' en '{categoria}'. Escribe el nuevo precio:")
         return PRODUCTO_ACTUALIZAR_PRECIO
@@ -408,18 +779,63 @@ async def guardar_actualizacion_producto(update: Update, context: ContextTypes.D
         
         if categoria in user['productos'] and producto in user['productos'][categoria]:
             user['productos'][categoria][producto] = nuevo_precio
-            _db_save(db)
+            registrar_precio(user, categoria, producto, nuevo_precio, datetime.now().isoformat())
+            _catalogo_modificado(user, update.effective_user.id)
+            _db_save(db, update.effective_user.id)
             await update.message.reply_text(f"✅ '{producto}' actualizado a {fmt_cup(nuevo_precio)}", reply_markup=productos_keyboard)
         else:
             await update.message.reply_text("❌ Producto no encontrado", reply_markup=productos_keyboard)
     except ValueError:
         await update.message.reply_text("⚠️ Precio inválido. Debe ser un número (ej: 50 o 75.50)", reply_markup=productos_keyboard)
+    except Conflicto:
+        raise
     except Exception as e:
         logger.error(f"Error en guardar_actualizacion_producto: {e}")
         await update.message.reply_text("😵‍💫 Error al actualizar producto", reply_markup=productos_keyboard)
     
     return PRODUCTO_OPCION
 
+def _texto_historial(user, categoria, producto, hoy=None):
+    h = historial(user, categoria, producto)
+    if not h or not h['fechas']:
+        return f"No hay precios registrados para '{producto}'."
+    hoy = hoy or date.today()
+    msg = f"📈 Historial de precios de '{producto}' ({categoria}):\n"
+    if len(h['fechas']) > 20:
+        msg += f"… {len(h['fechas']) - 20} cambios anteriores\n"
+    for fecha, precio in list(zip(h['fechas'], h['precios']))[-20:]:
+        msg += f"- {fecha}: {fmt_cup(precio)}\n"
+
+    actual = precio_en(h, hoy.isoformat())
+    msg += f"\nPrecio actual: {fmt_cup(actual if actual is not None else h['precios'][-1])}\n"
+    for etiqueta, dias in (("30 días", 30), ("90 días", 90), ("1 año", 365)):
+        cambio = variacion(h, date.fromordinal(hoy.toordinal() - dias).isoformat(), hoy.isoformat())
+        if cambio:
+            antes, despues, porcentaje = cambio
+            msg += f"• {etiqueta}: {fmt_cup(antes)} → {fmt_cup(despues)} ({porcentaje:+.1f}%)\n"
+    cambio = variacion(h, h['fechas'][0], hoy.isoformat())
+    if cambio and len(h['fechas']) > 1:
+        msg += f"• Desde {h['fechas'][0]}: {cambio[2]:+.1f}%\n"
+    return msg
+
+async def historial_producto(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    if query.data == "cancel":
+        await query.message.reply_text("Operación cancelada.", reply_markup=productos_keyboard)
+        return PRODUCTO_OPCION
+    if await _paginar_productos(query, context):
+        return PRODUCTO_HISTORIAL
+
+    seleccion = _producto_de_callback(query.from_user.id, query.data)
+    if not seleccion:
+        await query.message.reply_text("⚠️ Producto no encontrado", reply_markup=productos_keyboard)
+        return PRODUCTO_OPCION
+    user = _get_user(_db_load(), query.from_user.id)
+    await query.message.reply_text(_texto_historial(user, *seleccion), reply_markup=productos_keyboard)
+    return PRODUCTO_OPCION
+
 # =============================
 # RESUMEN
 # =============================
@@ -536,41 +952,43 @@ async def resumen_opcion(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("No hay datos para generar el gráfico.", reply_markup=resumen_keyboard)
             return RESUMEN_OPCION
             
-        categorias = list({g['categoria'] for g in gastos})
-        valores_gastos = [sum(g['monto'] for g in gastos if g['categoria']==c) for c in categorias]
-        
-        categorias_ingresos = list({i['categoria'] for i in ingresos})
-        valores_ingresos = [sum(i['monto'] for i in ingresos if i['categoria']==c) for c in categorias_ingresos]
+        gastos_por_cat, ingresos_por_cat = {}, {}
+        for g in gastos:
+            gastos_por_cat[g['categoria']] = gastos_por_cat.get(g['categoria'], 0) + g['monto']
+        for i in ingresos:
+            ingresos_por_cat[i['categoria']] = ingresos_por_cat.get(i['categoria'], 0) + i['monto']
 
-        plt.figure(figsize=(10, 6))
-        sns.set_theme(style="whitegrid")
-        
-        # Combinar todas las categorías
-        todas_categorias = list(set(categorias + categorias_ingresos))
-        gastos_por_cat = {cat: sum(g['monto'] for g in gastos if g['categoria'] == cat) for cat in todas_categorias}
-        ingresos_por_cat = {cat: sum(i['monto'] for i in ingresos if i['categoria'] == cat) for cat in todas_categorias}
-        
-        # Crear gráfico de barras
-        x = range(len(todas_categorias))
-        width = 0.35
-        
-        plt.bar([i - width/2 for i in x], [gastos_por_cat[cat] for cat in todas_categorias], 
-                width, label='Gastos', color='#ff7f7f')
-        plt.bar([i + width/2 for i in x], [ingresos_por_cat[cat] for cat in todas_categorias], 
-                width, label='Ingresos', color='#7fbf7f')
-        
-        plt.xlabel('Categorías')
-        plt.ylabel('Monto (CUP)')
-        plt.title('Ingresos vs Gastos por Categoría')
-        plt.xticks(x, todas_categorias, rotation=45, ha='right')
-        plt.legend()
-        plt.tight_layout()
-        
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        plt.close()
-        await update.message.reply_photo(photo=buf, reply_markup=resumen_keyboard)
+        # Se dibuja en el hilo de gráficos y se reutiliza hasta que haya movimientos nuevos
+        png = await cache_graficos.obtener(
+            update.effective_user.id, ("grafico", now.strftime("%Y-%m")), _version_movimientos(user),
+            grafico_categorias, gastos_por_cat, ingresos_por_cat
+        )
+        await update.message.reply_photo(photo=png, reply_markup=resumen_keyboard)
+
+    elif text == "Mapa de calor":
+        por_dia = dias_validos(gastos_dia(user))
+        if not por_dia:
+            await update.message.reply_text("No hay gastos para generar el mapa de calor.", reply_markup=resumen_keyboard)
+            return RESUMEN_OPCION
+        png = await cache_graficos.obtener(
+            update.effective_user.id, ("mapa_calor",), _version_movimientos(user),
+            mapa_calor, por_dia
+        )
+        await update.message.reply_photo(photo=png, caption="🗓️ Gasto por día", reply_markup=resumen_keyboard)
+
+    elif text == "Tendencia":
+        # Solo totales mensuales: el costo depende de los meses, no de los movimientos
+        # Los meses que salen de fechas mal formadas ('10/03/2') no se dibujan
+        por_mes_gastos = meses_validos({mes: sum(cats.values()) for mes, cats in gastos_mes(user).items()})
+        por_mes_ingresos = meses_validos(ingresos_mes(user))
+        if not por_mes_gastos and not por_mes_ingresos:
+            await update.message.reply_text("No hay datos para generar la tendencia.", reply_markup=resumen_keyboard)
+            return RESUMEN_OPCION
+        png = await cache_graficos.obtener(
+            update.effective_user.id, ("tendencia",), _version_movimientos(user),
+            tendencia, por_mes_ingresos, por_mes_gastos
+        )
+        await update.message.reply_photo(photo=png, caption="📉 Ingresos, gastos y balance en el tiempo", reply_markup=resumen_keyboard)
 
     elif text == "Análisis de hábitos":
         analisis = analisis_habitos(user)
@@ -586,6 +1004,31 @@ async def resumen_opcion(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await update.message.reply_text(msg, reply_markup=resumen_keyboard)
 
+    elif text == "Proyección":
+        saldo = saldo_actual(user)
+        p = proyectar(update.effective_user.id, user, saldo, gastos_mes(user).get(now.strftime("%Y-%m"), {}), now.date())
+        if not p['categorias'] and not p['ingreso_diario']:
+            await update.message.reply_text("No hay suficientes datos para la proyección.", reply_markup=resumen_keyboard)
+            return RESUMEN_OPCION
+
+        msg = f"🔮 Proyección a fin de mes ({p['dias_restantes']} días restantes):\n"
+        for cat, gastado, proyectado, presupuesto in p['categorias']:
+            msg += f"- {cat}: {fmt_cup(gastado)} → {fmt_cup(proyectado)}"
+            if presupuesto:
+                porcentaje = proyectado / presupuesto * 100
+                msg += f" ({porcentaje:.0f}% del presupuesto{' ⚠️' if porcentaje > 100 else ''})"
+            msg += "\n"
+        msg += f"\nGasto diario estimado: {fmt_cup(p['gasto_diario'])}\n"
+        msg += f"Ingreso diario promedio: {fmt_cup(p['ingreso_diario'])}\n"
+        msg += f"Saldo actual: {fmt_cup(saldo)}\n"
+        if saldo < 0:
+            msg += "🚨 Tu saldo ya es negativo."
+        elif p['fecha_negativo']:
+            msg += f"⚠️ A este ritmo tu saldo sería negativo el {p['fecha_negativo'].strftime('%d/%m/%Y')}."
+        else:
+            msg += "✅ A este ritmo tu saldo no llega a negativo en el próximo año."
+        await update.message.reply_text(msg, reply_markup=resumen_keyboard)
+
     elif text == "Exportar datos":
         # Crear CSV
         csv_content = "Tipo,Categoría,Producto,Monto,Fecha\n"
@@ -639,6 +1082,56 @@ async def config_opcion(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "• 'off' para desactivar"
         )
         return RESUMEN_OPCION
+    elif text == "🔁 Recurrentes":
+        db = _db_load()
+        user = _get_user(db, update.effective_user.id)
+        msg = "🔁 Movimientos recurrentes:\n"
+        for regla in user['recurrentes']:
+            msg += f"{regla['id']}. {describir(regla)}: {fmt_cup(regla['monto'])}\n"
+        if not user['recurrentes']:
+            msg += "No tienes movimientos recurrentes.\n"
+        msg += (
+            "\nPara agregar uno escribe: tipo, monto, categoría, frecuencia, día[, producto]\n"
+            "• ingreso, 1500, salario, mensual, 1\n"
+            "• gasto, 300, hogar, semanal, lunes, Gas\n"
+            "Para quitar uno escribe: borrar <número>"
+        )
+        await update.message.reply_text(msg)
+        return RECURRENTE_EDITAR
+
+async def recurrente_editar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = update.message.text.strip()
+    if text == "🔙 Menú principal":
+        await update.message.reply_text("Volvemos al menú principal.", reply_markup=main_keyboard)
+        return ConversationHandler.END
+
+    db = _db_load()
+    user = _get_user(db, update.effective_user.id)
+    if text.lower().startswith("borrar"):
+        try:
+            regla_id = int(text.split()[1])
+        except (IndexError, ValueError):
+            await update.message.reply_text("⚠️ Usa: borrar <número> (ej: borrar 2)")
+            return RECURRENTE_EDITAR
+        restantes = [r for r in user['recurrentes'] if r['id'] != regla_id]
+        if len(restantes) == len(user['recurrentes']):
+            await update.message.reply_text("⚠️ No existe un recurrente con ese número.")
+            return RECURRENTE_EDITAR
+        user['recurrentes'] = restantes
+        _db_save(db, update.effective_user.id)
+        await update.message.reply_text(f"❌ Recurrente {regla_id} eliminado.", reply_markup=config_keyboard)
+        return RESUMEN_OPCION
+
+    try:
+        regla = parsear_regla(text, CATEGORIAS_INGRESO, CATEGORIAS_GASTO, date.today())
+    except ValueError as e:
+        await update.message.reply_text(f"⚠️ Formato inválido: {e}. Ej: gasto, 300, hogar, mensual, 5")
+        return RECURRENTE_EDITAR
+    regla['id'] = max((r['id'] for r in user['recurrentes']), default=0) + 1
+    user['recurrentes'].append(regla)
+    _db_save(db, update.effective_user.id)
+    await update.message.reply_text(f"✅ Recurrente agregado: {describir(regla)}: {fmt_cup(regla['monto'])}", reply_markup=config_keyboard)
+    return RESUMEN_OPCION
 
 async def set_budget_categoria(update: Update, context: ContextTypes.DEFAULT_TYPE):
     categoria = update.message.text
@@ -658,7 +1151,7 @@ async def set_budget_monto(update: Update, context: ContextTypes.DEFAULT_TYPE):
         db = _db_load()
         user = _get_user(db, update.effective_user.id)
         user['presupuestos'][categoria] = monto
-        _db_save(db)
+        _db_save(db, update.effective_user.id)
         
         await update.message.reply_text(
             f"✅ Presupuesto establecido para '{categoria}': {fmt_cup(monto)}", 
@@ -666,6 +1159,8 @@ async def set_budget_monto(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     except ValueError:
         await update.message.reply_text("⚠️ Monto inválido. Debe ser un número (ej: 500 o 1200.50)", reply_markup=config_keyboard)
+    except Conflicto:
+        raise
     except Exception as e:
         logger.error(f"Error en set_budget_monto: {e}")
         await update.message.reply_text("😵‍💫 Error al establecer presupuesto", reply_markup=config_keyboard)
@@ -692,11 +1187,123 @@ async def daily_reminder(context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Error enviando recordatorio a {user_id}: {e}")
 
+# =============================
+# MOVIMIENTOS RECURRENTES
+# =============================
+def _tiene_vencidas(user_id, user, hoy) -> bool:
+    try:
+        return any(date.fromisoformat(r['proxima']) <= hoy for r in user.get('recurrentes', []))
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Recurrente inválido de {user_id}: {e}")
+        return False
+
+async def aplicar_recurrentes(context: ContextTypes.DEFAULT_TYPE):
+    # Una pasada y una sola escritura del archivo por corrida. Sin awaits entre leer y guardar;
+    # guardar_usuarios verifica la versión de cada usuario: si un handler suyo guardó mientras
+    # tanto, ese usuario se saltea y, como su 'proxima' no avanzó, se aplica en la próxima corrida.
+    # Si el bot estuvo caído, se aplican también las ocurrencias perdidas con su fecha original.
+    hoy = date.today()
+    db = _db_load()
+    aplicados = {}
+    for user_id, user_data in db["users"].items():
+        if not _tiene_vencidas(user_id, user_data, hoy):
+            continue
+        # Una regla rota no deja sin aplicar (ni sin aviso) a los demás. Ese usuario no se guarda,
+        # así que lo que aplicar_vencidas haya dejado a medias no llega al disco
+        try:
+            movimientos = aplicar_vencidas(user_data, hoy)
+        except Exception as e:
+            logger.error(f"Error aplicando recurrentes de {user_id}: {e}")
+            continue
+        if movimientos:
+            aplicados[user_id] = movimientos
+    if not aplicados:
+        return
+    try:
+        with metricas.medir("db", "save"):
+            guardados = set(_almacen().guardar_usuarios(db, aplicados))
+    except Exception as e:
+        logger.error(f"Error guardando recurrentes: {e}")
+        return
+    aplicados = {user_id: m for user_id, m in aplicados.items() if user_id in guardados}
+    if not aplicados:
+        return
+
+    logger.info(f"Recurrentes aplicados: {sum(len(m) for m in aplicados.values())} en {len(aplicados)} usuarios")
+    for user_id, movimientos in aplicados.items():
+        try:
+            msg = "🔁 Movimientos recurrentes registrados:\n"
+            for regla, movimiento in movimientos:
+                msg += f"- {regla['tipo'].capitalize()} {regla['categoria']}: {fmt_cup(regla['monto'])} ({movimiento['fecha'][:10]})\n"
+            await context.bot.send_message(chat_id=user_id, text=msg)
+        except Exception as e:
+            logger.error(f"Error avisando recurrentes a {user_id}: {e}")
+
+# =============================
+# USO POR USUARIO (ADMIN)
+# =============================
+def _medir_db():
+    # Leer y parsear el JSON entero también es un recorrido de toda la DB: va en el hilo con la medición.
+    # Con trabajadores, cada uno tiene solo sus usuarios en DB_FILE
+    return contabilidad.medir(db_completa(DB_FILE)), DB_FILE.stat().st_size if DB_FILE.exists() else 0
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /stats: la medición va en un hilo aparte y solo recalcula los usuarios que cambiaron
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    mediciones, tamano = await asyncio.to_thread(_medir_db)
+    texto = reporte_texto(mediciones, tamano)
+    for parte in partir_mensaje(texto):
+        await update.message.reply_text(parte)
+
+def stats_cli(args):
+    # python bot.py stats [N]: el mismo reporte por consola, con los N usuarios más pesados
+    top = int(args[0]) if args else STATS_TOP
+    mediciones = Contabilidad().medir(db_completa(DB_FILE))
+    print(reporte_texto(mediciones, DB_FILE.stat().st_size if DB_FILE.exists() else 0, top))
+
 # =============================
 # MAIN
 # =============================
-def main():
-    app = ApplicationBuilder().token(TOKEN).build()
+async def al_iniciar(app):
+    # Las librerías de gráficos se importan cuando el bot ya acepta updates
+    await arranque.iniciado(app, precargar)
+
+async def al_cerrar(app):
+    await updates_procesados.guardar_al_cerrar(app)
+    await log_metricas_red(app)
+    perfilador.guardar()
+
+def _builder():
+    builder = ApplicationBuilder()
+    if arranque.ARRANQUE_RAPIDO:
+        # Sin esperar a getMe: usa el bot de la vez anterior y lo verifica después
+        return builder.bot(crear_bot(TOKEN, arranque.BotArranqueRapido))
+    return configurar_red(builder).token(TOKEN)
+
+def construir_app(recibir=True):
+    """Application con persistencia, jobs y todos los handlers, lista para arrancar.
+
+    Con recibir=False no tiene updater: es un trabajador y los updates le llegan del proceso
+    principal (ver trabajadores.py), que descarta los repetidos con su propio updates_procesados.
+    """
+    # Estados de conversación y user_data se guardan en lote cada PERSISTENCIA_INTERVALO
+    # segundos y al detenerse (SIGINT, SIGTERM o SIGABRT)
+    persistence = PicklePersistence(
+        filepath=STATE_FILE,
+        store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+        update_interval=PERSISTENCIA_INTERVALO
+    )
+    builder = concurrencia.configurar(_builder())
+    if not recibir:
+        builder = builder.updater(None)
+    app = (
+        builder
+        .persistence(persistence)
+        .post_init(al_iniciar)
+        .post_shutdown(al_cerrar)
+        .build()
+    )
     
     # Configurar job de recordatorios
     job_queue = app.job_queue
@@ -706,6 +1313,12 @@ def main():
             time=time(20, 0, 0, tzinfo=None),  # 8:00 PM
             name="daily_reminder"
         )
+        job_queue.run_repeating(
+            aplicar_recurrentes,
+            interval=RECURRENTES_INTERVALO,
+            first=10,
+            name="recurrentes"
+        )
     else:
         logger.warning("JobQueue no está disponible")
 
@@ -718,18 +1331,25 @@ def main():
             INGRESO_MONTO: [MessageHandler(filters.TEXT & ~filters.COMMAND, ingreso_monto)],
         },
         fallbacks=[CommandHandler("start", start)],
-        map_to_parent={ConversationHandler.END: ConversationHandler.END}
+        map_to_parent={ConversationHandler.END: ConversationHandler.END},
+        name="ingreso",
+        persistent=True
     )
 
     conv_gasto = ConversationHandler(
         entry_points=[MessageHandler(filters.Regex("➖ Gasto"), gasto_start)],
         states={
             SELECT_GASTO_CAT: [MessageHandler(filters.TEXT & ~filters.COMMAND, gasto_categoria)],
-            SELECT_PRODUCTO_GASTO: [CallbackQueryHandler(gasto_producto_seleccion)],
+            SELECT_PRODUCTO_GASTO: [
+                CallbackQueryHandler(gasto_producto_seleccion),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, gasto_filtrar_producto)
+            ],
             GASTO_MANUAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, gasto_manual)],
         },
         fallbacks=[CommandHandler("start", start)],
-        map_to_parent={ConversationHandler.END: ConversationHandler.END}
+        map_to_parent={ConversationHandler.END: ConversationHandler.END},
+        name="gasto",
+        persistent=True
     )
 
     conv_productos = ConversationHandler(
@@ -737,12 +1357,24 @@ def main():
         states={
             PRODUCTO_OPCION: [MessageHandler(filters.TEXT & ~filters.COMMAND, productos_opcion)],
             PRODUCTO_NUEVO: [MessageHandler(filters.TEXT & ~filters.COMMAND, agregar_producto)],
-            PRODUCTO_ELIMINAR: [CallbackQueryHandler(eliminar_producto)],
-            PRODUCTO_ACTUALIZAR: [CallbackQueryHandler(actualizar_producto)],
-            PRODUCTO_ACTUALIZAR_PRECIO: [MessageHandler(filters.TEXT & ~filters.COMMAND, guardar_actualizacion_producto)]
+            PRODUCTO_ELIMINAR: [
+                CallbackQueryHandler(eliminar_producto),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, productos_filtrar)
+            ],
+            PRODUCTO_ACTUALIZAR: [
+                CallbackQueryHandler(actualizar_producto),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, productos_filtrar)
+            ],
+            PRODUCTO_ACTUALIZAR_PRECIO: [MessageHandler(filters.TEXT & ~filters.COMMAND, guardar_actualizacion_producto)],
+            PRODUCTO_HISTORIAL: [
+                CallbackQueryHandler(historial_producto),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, productos_filtrar)
+            ]
         },
         fallbacks=[CommandHandler("start", start)],
-        map_to_parent={ConversationHandler.END: ConversationHandler.END}
+        map_to_parent={ConversationHandler.END: ConversationHandler.END},
+        name="productos",
+        persistent=True
     )
 
     conv_resumen = ConversationHandler(
@@ -751,7 +1383,9 @@ def main():
             RESUMEN_OPCION: [MessageHandler(filters.TEXT & ~filters.COMMAND, resumen_opcion)],
         },
         fallbacks=[CommandHandler("start", start)],
-        map_to_parent={ConversationHandler.END: ConversationHandler.END}
+        map_to_parent={ConversationHandler.END: ConversationHandler.END},
+        name="resumen",
+        persistent=True
     )
 
     conv_config = ConversationHandler(
@@ -759,45 +1393,65 @@ def main():
         states={
             RESUMEN_OPCION: [MessageHandler(filters.TEXT & ~filters.COMMAND, config_opcion)],
             SET_BUDGET_CAT: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_budget_categoria)],
-            SET_BUDGET_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_budget_monto)]
+            SET_BUDGET_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_budget_monto)],
+            RECURRENTE_EDITAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, recurrente_editar)]
         },
         fallbacks=[CommandHandler("start", start)],
-        map_to_parent={ConversationHandler.END: ConversationHandler.END}
+        map_to_parent={ConversationHandler.END: ConversationHandler.END},
+        name="config",
+        persistent=True
     )
 
     # Añadir todos los handlers
+    # En un trabajador también: el proceso principal le repite los updates sin confirmar
+    updates_procesados.instalar(app)
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("buscar", buscar))
+    app.add_handler(CommandHandler("metricas", comando_metricas))
+    app.add_handler(CommandHandler("stats", stats))
+    # Antes que las conversaciones, que tienen CallbackQueryHandler sin patrón
+    app.add_handler(CallbackQueryHandler(buscar_pagina, pattern=r"^bus:"))
     app.add_handler(conv_ingreso)
     app.add_handler(conv_gasto)
     app.add_handler(conv_productos)
     app.add_handler(conv_resumen)
     app.add_handler(conv_config)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, entrada_rapida))
+    # Reintenta ante Conflicto (p. ej. aplicar_recurrentes guardó al usuario en medio del handler).
+    # Sin lock entre procesos: cada proceso es el único que atiende a sus usuarios
+    proteger(app, _almacen(), entre_procesos=False)
+    instrumentar(app)
+    perfilador.configurar(_db_load)
+    arranque.registrar(app)
+    return app
+
+def construir_frente(n):
+    """Application del proceso principal con TRABAJADORES > 1: solo recibe los updates y los reparte."""
+    frente = Frente(Path(__file__).stem, n, DB_FILE, STATE_FILE)
+
+    async def al_cerrar_frente(app):
+        await frente.cerrar(app)
+        await updates_procesados.guardar_al_cerrar(app)
+
+    app = _builder().post_init(frente.iniciar).post_shutdown(al_cerrar_frente).build()
+    updates_procesados.instalar(app)
+    app.add_handler(TypeHandler(Update, frente.enrutar))
+    return app
 
-    # Manejar persistencia de estados
-    if STATE_FILE.exists():
-        try:
-            with open(STATE_FILE, 'rb') as f:
-                app.persistence = pickle.load(f)
-        except Exception as e:
-            logger.error(f"Error cargando estados: {e}")
-
-    # Guardar estados al cerrar
-    def save_states(signum, frame):
-        logger.info("Guardando estados de conversación...")
-        try:
-            with open(STATE_FILE, 'wb') as f:
-                pickle.dump(app.persistence, f)
-            logger.info("Estados guardados exitosamente")
-        except Exception as e:
-            logger.error(f"Error guardando estados: {e}")
-        signal.signal(signal.SIGINT, original_sigint)
-        exit(0)
-
-    original_sigint = signal.getsignal(signal.SIGINT)
-    signal.signal(signal.SIGINT, save_states)
-
+def main():
+    arranque.cronologia.marcar("imports")
+    if TRABAJADORES > 1:
+        app = construir_frente(TRABAJADORES)
+    else:
+        app = construir_app()
+        # La persistencia se carga recién en initialize(): hasta entonces se pueden juntar las partes
+        juntar_partes(DB_FILE, STATE_FILE, app.bot)
+    arranque.cronologia.marcar("handlers")
     print("Bot corriendo…")
     app.run_polling()
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["stats"]:
+        stats_cli(sys.argv[2:])
+    else:
+        main()
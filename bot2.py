@@ -1,17 +1,31 @@
+import arranque  # primero: la cronología de arranque empieza al importarlo
 import os
-import json
 import logging
 from pathlib import Path
 from datetime import datetime
 
 from telegram import (
-    Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup, Bot
+    Update, ReplyKeyboardMarkup, InlineKeyboardButton
 )
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, filters,
-    ContextTypes, ConversationHandler, CallbackQueryHandler
+    ContextTypes, ConversationHandler, CallbackQueryHandler,
+    PicklePersistence, PersistenceInput
 )
 
+from almacen import AlmacenCompartido, proteger
+from cache_teclados import CacheTeclados
+import concurrencia
+from cliente_http import configurar_red, crear_bot, log_metricas_red
+from dedupe import UpdatesProcesados
+from entrada_rapida import parsear_lote
+from historial_precios import registrar_precio
+from indice_productos import IndiceProductos, teclado_paginado
+from instrumentacion import instrumentar, puerto_instancia, servidor_metricas
+import metricas
+import perfilador
+from presupuestos import registrar_gasto, registrar_ingreso
+
 # =============================
 # CONFIGURACIÓN INICIAL
 # =============================
@@ -24,9 +38,21 @@ logger = logging.getLogger(__name__)
 TOKEN = os.getenv("TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 PORT = int(os.getenv("PORT", 8443))
-bot = Bot(token=TOKEN)
+
+# Con varias instancias sobre el mismo finanzas.json, cada una con su INSTANCIA: los estados
+# de conversación y los updates vistos son de cada proceso
+INSTANCIA = os.getenv("INSTANCIA", "")
+_SUFIJO = f".{INSTANCIA}" if INSTANCIA else ""
 
 DB_FILE = Path(__file__).parent / "finanzas.json"
+# Con el nombre del módulo: bot, bot2 y bot3 en la misma carpeta no se pisan los estados
+STATE_FILE = Path(__file__).parent / f"conversaciones.{Path(__file__).stem}{_SUFIJO}.pkl"
+PERSISTENCIA_INTERVALO = float(os.getenv("PERSISTENCIA_INTERVALO", 30))
+# Con el nombre del módulo: bot, bot2 y bot3 en la misma carpeta tienen tokens distintos y sus
+# update_id se repiten entre sí
+updates_procesados = UpdatesProcesados(Path(__file__).parent / f"updates_procesados.{Path(__file__).stem}{_SUFIJO}.json")
+almacen = AlmacenCompartido(DB_FILE)
+cache_teclados = CacheTeclados()
 
 # =============================
 # ESTADOS
@@ -73,18 +99,14 @@ config_keyboard = ReplyKeyboardMarkup(
 # BASE DE DATOS
 # =============================
 def _db_load():
-    if DB_FILE.exists():
-        try:
-            with DB_FILE.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            logger.error("Error al cargar DB, creando nueva")
-            return {"users": {}}
-    return {"users": {}}
-
-def _db_save(db):
-    with DB_FILE.open("w", encoding="utf-8") as f:
-        json.dump(db, f, indent=2, ensure_ascii=False)
+    with metricas.medir("db", "load"):
+        return almacen.cargar()
+
+def _db_save(db, user_id):
+    # Solo el usuario que cambió: otras instancias pueden estar guardando a otros al mismo tiempo
+    with metricas.medir("db", "save"):
+        almacen.guardar_usuario(db, user_id)
+    metricas.fijar("db_bytes", DB_FILE.name, DB_FILE.stat().st_size)
 
 def _get_user(db, user_id):
     uid = str(user_id)
@@ -103,8 +125,34 @@ def _get_user(db, user_id):
     if "recordatorio" not in user:
         user["recordatorio"] = {"activo": False, "hora": "20:00"}
 
+    cache_teclados.validar(uid, user.get("catalogo_version", 0))
     return user
 
+def _catalogo_modificado(user, user_id):
+    # Invalida los teclados cacheados del usuario
+    user["catalogo_version"] = user.get("catalogo_version", 0) + 1
+    cache_teclados.invalidar(user_id)
+
+def _catalogo_al_dia(user_id):
+    # La caché de teclados es de este proceso y otra instancia pudo cambiar el catálogo: antes de
+    # usar lo cacheado se lee el usuario de disco (_get_user compara su catalogo_version)
+    return _get_user(_db_load(), user_id)
+
+def _indice_productos(user_id, user=None):
+    if user is None:
+        user = _catalogo_al_dia(user_id)
+
+    def construir():
+        version = user.get("catalogo_version", 0)
+        return version, IndiceProductos(user["productos"], version)
+    return cache_teclados.obtener(user_id, ("indice",), construir)
+
+def _producto_de_callback(user_id, data, categoria=None):
+    # Los teclados enviados antes de los ids cortos usaban el nombre del producto
+    if data.startswith("p:"):
+        return _indice_productos(user_id).por_id.get(data[2:])
+    return (categoria, data)
+
 def saldo_actual(user):
     total_ingresos = sum(i['monto'] for i in user.get('ingresos', []))
     total_gastos = sum(g['monto'] for g in user.get('gastos', []))
@@ -155,12 +203,12 @@ async def ingreso_monto(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         monto = float(update.message.text)
         categoria = context.user_data.get('categoria_ingreso', 'Otro')
-        user['ingresos'].append({
+        registrar_ingreso(user, {
             "monto": monto, 
             "categoria": categoria, 
             "fecha": datetime.now().isoformat()
         })
-        _db_save(db)
+        _db_save(db, update.effective_user.id)
         await update.message.reply_text(f"✅ Ingreso registrado: {fmt_cup(monto)} en '{categoria}'", reply_markup=main_keyboard)
     except ValueError:
         await update.message.reply_text("⚠️ Monto inválido. Debe ser un número (ej: 150 o 75.50).", reply_markup=main_keyboard)
@@ -173,6 +221,27 @@ async def gasto_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Selecciona la categoría del gasto:", reply_markup=categorias_gasto_keyboard)
     return SELECT_GASTO_CAT
 
+def _teclado_productos_gasto(user_id, user, categoria, pagina=0, filtro=""):
+    indice = _indice_productos(user_id, user)
+    resultados = indice.buscar(filtro, categoria)
+    if not resultados and not filtro:
+        return indice.version, None
+
+    extras = [
+        [InlineKeyboardButton("➕ Agregar producto nuevo", callback_data="nuevo")],
+        [InlineKeyboardButton("🔙 Menú principal", callback_data="cancel")]
+    ]
+    return indice.version, teclado_paginado(resultados, pagina, extras=extras)
+
+def _teclado_gasto(context, user_id, pagina=0):
+    categoria = context.user_data.get('gasto_categoria')
+    filtro = context.user_data.get('filtro_productos', "")
+    user = _catalogo_al_dia(user_id)
+    return cache_teclados.obtener(
+        user_id, ("gasto", categoria, pagina, filtro),
+        lambda: _teclado_productos_gasto(user_id, user, categoria, pagina, filtro)
+    )
+
 async def gasto_categoria(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
     if text == "🔙 Menú principal":
@@ -180,46 +249,119 @@ async def gasto_categoria(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
     context.user_data['gasto_categoria'] = text
-    db = _db_load()
-    user = _get_user(db, update.effective_user.id)
-    categoria_productos = user['productos'].get(text, {})
-
-    if categoria_productos:
-        keyboard = [[InlineKeyboardButton(p, callback_data=p)] for p in categoria_productos.keys()]
-        keyboard.append([InlineKeyboardButton("➕ Agregar producto nuevo", callback_data="nuevo")])
-        keyboard.append([InlineKeyboardButton("🔙 Menú principal", callback_data="cancel")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("Selecciona el producto:", reply_markup=reply_markup)
+    context.user_data.pop('filtro_productos', None)
+    reply_markup = _teclado_gasto(context, update.effective_user.id)
+
+    if reply_markup:
+        await update.message.reply_text("Selecciona el producto (o escribe para buscar):", reply_markup=reply_markup)
         return SELECT_PRODUCTO_GASTO
     else:
-        await update.message.reply_text("No hay productos en esta categoría. Puedes escribir el monto manualmente o agregar un producto nuevo:")
+        await update.message.reply_text("No hay productos en esta categoría. Puedes escribir el monto manualmente o agregar productos nuevos (uno por línea):")
         return GASTO_MANUAL
 
+async def gasto_filtrar_producto(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = update.message.text.strip()
+    # Tocar otra categoría del teclado cambia de categoría en vez de buscar
+    if text in CATEGORIAS_GASTO or text == "🔙 Menú principal":
+        return await gasto_categoria(update, context)
+
+    context.user_data['filtro_productos'] = text
+    reply_markup = _teclado_gasto(context, update.effective_user.id)
+    await update.message.reply_text(f"🔎 Productos que empiezan por '{text}':", reply_markup=reply_markup)
+    return SELECT_PRODUCTO_GASTO
+
 async def gasto_producto_seleccion(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
-    data = _db_load()
-    user = _get_user(data, query.from_user.id)
+    user_id = query.from_user.id
 
+    # El callback se responde en cada rama y, al registrar, recién después de guardar: si hay
+    # Conflicto almacen.proteger repite el handler y no puede responderlo dos veces
     if query.data == "cancel":
+        await query.answer()
         await query.message.reply_text("Has vuelto al menú principal ✅", reply_markup=main_keyboard)
         return ConversationHandler.END
     elif query.data == "nuevo":
-        await query.message.reply_text("Escribe el nombre del nuevo producto y su precio separado por coma (Ej: Arroz, 50):")
+        await query.answer()
+        await query.message.reply_text("Escribe el nombre del nuevo producto y su precio separado por coma (Ej: Arroz, 50). Puedes enviar varios, uno por línea:")
         return GASTO_MANUAL
+    elif query.data == "noop":
+        await query.answer()
+        return SELECT_PRODUCTO_GASTO
+    elif query.data.startswith("pag:"):
+        await query.answer()
+        await query.edit_message_reply_markup(reply_markup=_teclado_gasto(context, user_id, int(query.data[4:])))
+        return SELECT_PRODUCTO_GASTO
     else:
-        producto = query.data
-        precio = user['productos'][context.user_data['gasto_categoria']][producto]
+        categoria, producto = _producto_de_callback(user_id, query.data, context.user_data.get('gasto_categoria')) or (None, None)
+        db = _db_load()
+        user = _get_user(db, user_id)
+        if producto not in user['productos'].get(categoria, {}):
+            await query.answer()
+            await query.message.reply_text("⚠️ Producto no encontrado", reply_markup=main_keyboard)
+            return ConversationHandler.END
+        precio = user['productos'][categoria][producto]
         saldo = saldo_actual(user)
         if saldo < precio:
+            await query.answer()
             await query.message.reply_text(f"⚠️ Saldo insuficiente: {fmt_cup(saldo)}. No se puede gastar {fmt_cup(precio)}.", reply_markup=main_keyboard)
             return ConversationHandler.END
-        user['gastos'].append({"monto": precio, "categoria": context.user_data['gasto_categoria'], "producto": producto, "fecha": datetime.now().isoformat()})
-        _db_save(data)
+        registrar_gasto(user, {"monto": precio, "categoria": categoria, "producto": producto, "fecha": datetime.now().isoformat()})
+        _db_save(db, update.effective_user.id)
+        await query.answer()
         await query.message.reply_text(f"✅ Gasto registrado: {producto} {fmt_cup(precio)}", reply_markup=main_keyboard)
         return ConversationHandler.END
 
+def _errores_lote(errores, formato):
+    msg = "⚠️ No se registró nada. Revisa estas líneas:\n"
+    msg += "\n".join(f"{n}. {linea}" for n, linea in errores)
+    return msg + f"\n\nFormato: una línea por elemento, {formato}."
+
+async def gasto_lote(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Varias líneas en un mensaje: se validan todas, se comprueba el saldo contra el total
+    # y se guarda una sola vez
+    items, errores = parsear_lote(update.message.text)
+    if errores or not items:
+        await update.message.reply_text(_errores_lote(errores, "'nombre, monto' o solo 'monto'"), reply_markup=main_keyboard)
+        return ConversationHandler.END
+
+    user_id = update.effective_user.id
+    db = _db_load()
+    user = _get_user(db, user_id)
+    categoria = context.user_data.get('gasto_categoria', "Otros")
+    total = sum(i['monto'] for i in items)
+    saldo = saldo_actual(user)
+    if saldo < total:
+        await update.message.reply_text(
+            f"⚠️ Saldo insuficiente: {fmt_cup(saldo)}\nNo puedes registrar estos {len(items)} gastos por {fmt_cup(total)}.",
+            reply_markup=main_keyboard
+        )
+        return ConversationHandler.END
+
+    fecha = datetime.now().isoformat()
+    nuevos = 0
+    lineas = []
+    for n, item in enumerate(items, 1):
+        producto = item['producto']
+        if producto:
+            productos_cat = user['productos'].setdefault(categoria, {})
+            nuevos += producto not in productos_cat
+            productos_cat[producto] = item['monto']
+        registrar_gasto(user, {"monto": item['monto'], "categoria": categoria, "producto": producto, "fecha": fecha})
+        lineas.append(f"{n}. {producto or 'Sin producto'}: {fmt_cup(item['monto'])}")
+    if any(i['producto'] for i in items):
+        _catalogo_modificado(user, user_id)
+    _db_save(db, update.effective_user.id)
+
+    msg = f"💸 {len(items)} gastos registrados en '{categoria}' por {fmt_cup(total)}"
+    if nuevos:
+        msg += f" ({nuevos} productos nuevos)"
+    msg += ":\n" + "\n".join(lineas)
+    await update.message.reply_text(msg, reply_markup=main_keyboard)
+    return ConversationHandler.END
+
 async def gasto_manual(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if "\n" in update.message.text.strip():
+        return await gasto_lote(update, context)
     text = update.message.text
     db = _db_load()
     user = _get_user(db, update.effective_user.id)
@@ -232,14 +374,15 @@ async def gasto_manual(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if cat not in user['productos']:
                 user['productos'][cat] = {}
             user['productos'][cat][producto] = precio
-            user['gastos'].append({"monto": precio, "categoria": cat, "producto": producto, "fecha": datetime.now().isoformat()})
-            _db_save(db)
+            _catalogo_modificado(user, update.effective_user.id)
+            registrar_gasto(user, {"monto": precio, "categoria": cat, "producto": producto, "fecha": datetime.now().isoformat()})
+            _db_save(db, update.effective_user.id)
             await update.message.reply_text(f"✅ Producto '{producto}' agregado y gasto registrado: {fmt_cup(precio)}", reply_markup=main_keyboard)
         else:
             monto = float(text)
             cat = context.user_data.get('gasto_categoria', "Otros")
-            user['gastos'].append({"monto": monto, "categoria": cat, "producto": None, "fecha": datetime.now().isoformat()})
-            _db_save(db)
+            registrar_gasto(user, {"monto": monto, "categoria": cat, "producto": None, "fecha": datetime.now().isoformat()})
+            _db_save(db, update.effective_user.id)
             await update.message.reply_text(f"✅ Gasto registrado: {fmt_cup(monto)}", reply_markup=main_keyboard)
     except ValueError:
         await update.message.reply_text("⚠️ Entrada inválida, intenta de nuevo.", reply_markup=main_keyboard)
@@ -258,7 +401,7 @@ async def productos_opcion(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = _get_user(db, update.effective_user.id)
 
     if text == "Agregar Producto":
-        await update.message.reply_text("Escribe: nombre del producto, categoría, precio (ej: Arroz, Comida, 50):")
+        await update.message.reply_text("Escribe: nombre del producto, categoría, precio (ej: Arroz, Comida, 50). Puedes enviar varios, uno por línea:")
         return PRODUCTO_NUEVO
 
     elif text == "Eliminar Producto":
@@ -283,7 +426,42 @@ async def productos_opcion(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 # AGREGAR, ELIMINAR, ACTUALIZAR PRODUCTOS
+async def producto_lote(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Un producto por línea ('Nombre, Categoría, Precio') con una sola escritura
+    items, errores = parsear_lote(update.message.text, requiere_nombre=True)
+    productos = []
+    for item in items:
+        nombre, _, categoria = item['producto'].partition(",")
+        if not nombre.strip() or not categoria.strip():
+            errores.append((item['linea'], item['texto']))
+            continue
+        productos.append((categoria.strip(), nombre.strip(), item['monto']))
+    errores.sort()
+    if errores or not items:
+        await update.message.reply_text(_errores_lote(errores, "'Nombre, Categoría, Precio'"), reply_markup=productos_keyboard)
+        return PRODUCTO_OPCION
+
+    user_id = update.effective_user.id
+    db = _db_load()
+    user = _get_user(db, user_id)
+    nuevos = 0
+    lineas = []
+    for n, (categoria, nombre, precio) in enumerate(productos, 1):
+        productos_cat = user['productos'].setdefault(categoria, {})
+        nuevos += nombre not in productos_cat
+        productos_cat[nombre] = precio
+        registrar_precio(user, categoria, nombre, precio, datetime.now().isoformat())
+        lineas.append(f"{n}. {categoria} → {nombre}: {fmt_cup(precio)}")
+    _catalogo_modificado(user, user_id)
+    _db_save(db, update.effective_user.id)
+
+    msg = f"✅ {len(productos)} productos guardados ({nuevos} nuevos, {len(productos) - nuevos} actualizados):\n"
+    await update.message.reply_text(msg + "\n".join(lineas), reply_markup=productos_keyboard)
+    return PRODUCTO_OPCION
+
 async def producto_nuevo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if "\n" in update.message.text.strip():
+        return await producto_lote(update, context)
     text = update.message.text
     db = _db_load()
     user = _get_user(db, update.effective_user.id)
@@ -293,7 +471,9 @@ async def producto_nuevo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if categoria not in user['productos']:
             user['productos'][categoria] = {}
         user['productos'][categoria][nombre] = precio
-        _db_save(db)
+        registrar_precio(user, categoria, nombre, precio, datetime.now().isoformat())
+        _catalogo_modificado(user, update.effective_user.id)
+        _db_save(db, update.effective_user.id)
         await update.message.reply_text(f"✅ Producto '{nombre}' agregado en '{categoria}' con precio {fmt_cup(precio)}", reply_markup=productos_keyboard)
     except ValueError:
         await update.message.reply_text("⚠️ Formato incorrecto. Usa: Nombre, Categoría, Precio (ej: Arroz, Comida, 50)")
@@ -310,7 +490,8 @@ async def producto_eliminar(update: Update, context: ContextTypes.DEFAULT_TYPE):
             del user['productos'][categoria][nombre]
             if not user['productos'][categoria]:
                 del user['productos'][categoria]
-            _db_save(db)
+            _catalogo_modificado(user, update.effective_user.id)
+            _db_save(db, update.effective_user.id)
             await update.message.reply_text(f"✅ Producto '{nombre}' eliminado de '{categoria}'", reply_markup=productos_keyboard)
         else:
             await update.message.reply_text("⚠️ Producto o categoría no encontrados.")
@@ -345,7 +526,9 @@ async def producto_actualizar_precio(update: Update, context: ContextTypes.DEFAU
         nuevo_precio = float(text)
         categoria, nombre = context.user_data['actualizar_producto']
         user['productos'][categoria][nombre] = nuevo_precio
-        _db_save(db)
+        registrar_precio(user, categoria, nombre, nuevo_precio, datetime.now().isoformat())
+        _catalogo_modificado(user, update.effective_user.id)
+        _db_save(db, update.effective_user.id)
         await update.message.reply_text(f"✅ Producto '{nombre}' actualizado a {fmt_cup(nuevo_precio)}", reply_markup=productos_keyboard)
     except ValueError:
         await update.message.reply_text("⚠️ Precio inválido. Intenta de nuevo (ej: 50 o 75.5)")
@@ -361,8 +544,41 @@ async def config_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # -----------------------------
 # MAIN
 # -----------------------------
-def main():
-    app = ApplicationBuilder().token(TOKEN).build()
+async def al_iniciar(app):
+    # /metrics en su propio puerto: el servidor del webhook no admite rutas extra
+    app.bot_data["servidor_metricas"] = servidor_metricas(puerto_instancia(INSTANCIA))
+    await arranque.iniciado(app)
+
+async def al_cerrar(app):
+    servidor = app.bot_data.get("servidor_metricas")
+    if servidor is not None:
+        servidor.stop()
+    await updates_procesados.guardar_al_cerrar(app)
+    await log_metricas_red(app)
+    perfilador.guardar()
+
+def construir_app():
+    """Application con persistencia y todos los handlers, lista para arrancar."""
+    # Estados de conversación y user_data se guardan en lote cada PERSISTENCIA_INTERVALO
+    # segundos y al detenerse (SIGINT, SIGTERM o SIGABRT)
+    persistence = PicklePersistence(
+        filepath=STATE_FILE,
+        store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+        update_interval=PERSISTENCIA_INTERVALO
+    )
+    builder = concurrencia.configurar(ApplicationBuilder())
+    if arranque.ARRANQUE_RAPIDO:
+        # Sin esperar a getMe ni a setWebhook si no cambiaron (se verifican después)
+        builder = builder.bot(crear_bot(TOKEN, arranque.BotArranqueRapido))
+    else:
+        builder = configurar_red(builder).token(TOKEN)
+    app = (
+        builder
+        .persistence(persistence)
+        .post_init(al_iniciar)
+        .post_shutdown(al_cerrar)
+        .build()
+    )
 
     # Conversaciones
     conv_ingreso = ConversationHandler(
@@ -372,17 +588,24 @@ def main():
             INGRESO_OTRO: [MessageHandler(filters.TEXT & ~filters.COMMAND, ingreso_otro)],
             INGRESO_MONTO: [MessageHandler(filters.TEXT & ~filters.COMMAND, ingreso_monto)]
         },
-        fallbacks=[CommandHandler("start", start)]
+        fallbacks=[CommandHandler("start", start)],
+        name="ingreso",
+        persistent=True
     )
 
     conv_gasto = ConversationHandler(
         entry_points=[MessageHandler(filters.Regex("➖ Gasto"), gasto_start)],
         states={
             SELECT_GASTO_CAT: [MessageHandler(filters.TEXT & ~filters.COMMAND, gasto_categoria)],
-            SELECT_PRODUCTO_GASTO: [CallbackQueryHandler(gasto_producto_seleccion)],
+            SELECT_PRODUCTO_GASTO: [
+                CallbackQueryHandler(gasto_producto_seleccion),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, gasto_filtrar_producto)
+            ],
             GASTO_MANUAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, gasto_manual)]
         },
-        fallbacks=[CommandHandler("start", start)]
+        fallbacks=[CommandHandler("start", start)],
+        name="gasto",
+        persistent=True
     )
 
     conv_productos = ConversationHandler(
@@ -394,14 +617,27 @@ def main():
             PRODUCTO_ACTUALIZAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, producto_actualizar)],
             PRODUCTO_ACTUALIZAR_PRECIO: [MessageHandler(filters.TEXT & ~filters.COMMAND, producto_actualizar_precio)]
         },
-        fallbacks=[CommandHandler("start", start)]
+        fallbacks=[CommandHandler("start", start)],
+        name="productos",
+        persistent=True
     )
 
+    updates_procesados.instalar(app)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(conv_ingreso)
     app.add_handler(conv_gasto)
     app.add_handler(conv_productos)
     app.add_handler(MessageHandler(filters.Regex("⚙️ Configuración"), config_start))
+    proteger(app, almacen)
+    instrumentar(app)
+    perfilador.configurar(_db_load)
+    arranque.registrar(app)
+    return app
+
+def main():
+    arranque.cronologia.marcar("imports")
+    app = construir_app()
+    arranque.cronologia.marcar("handlers")
 
     logger.info("Bot iniciado ✅")
     webhook_url = f"{WEBHOOK_URL.rstrip('/')}/{TOKEN}"  # evita doble slash
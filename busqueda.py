@@ -0,0 +1,133 @@
+import os
+import re
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from indice_productos import normalizar
+
+BUSQUEDA_USUARIOS = int(os.getenv("BUSQUEDA_USUARIOS", 200))
+# Total de entradas (término, movimiento) en memoria sumando todos los usuarios
+BUSQUEDA_MAX_ENTRADAS = int(os.getenv("BUSQUEDA_MAX_ENTRADAS", 2_000_000))
+# Un término incompleto ("arro") se expande como mucho a estos términos del vocabulario
+MAX_EXPANSIONES = 50
+
+TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)?|\w+")
+
+# =============================
+# TÉRMINOS
+# =============================
+def _monto(monto) -> str:
+    # 50.0 -> "50", 75.5 -> "75.5"
+    return f"{float(monto):.2f}".rstrip("0").rstrip(".")
+
+def terminos(texto: str) -> list:
+    resultado = []
+    for token in TOKEN_RE.findall(normalizar(texto)):
+        if token[0].isdigit():
+            token = _monto(token.replace(",", "."))
+        resultado.append(token)
+    return resultado
+
+def _terminos_movimiento(tipo, mov):
+    texto = f"{tipo} {mov.get('categoria') or ''} {mov.get('producto') or ''}"
+    return set(TOKEN_RE.findall(normalizar(texto))) | {_monto(mov.get('monto', 0))}
+
+# =============================
+# ÍNDICE INVERTIDO
+# =============================
+class IndiceMovimientos:
+    """Índice invertido término -> movimientos de un usuario.
+
+    Cada movimiento indexado recibe un número consecutivo y cada término guarda los números
+    en un array ordenado. Como ingresos y gastos solo se agregan al final, actualizar el
+    índice es indexar los que faltan.
+    """
+
+    def __init__(self):
+        self.refs = array("q")          # número -> posición * 2 + (1 si es gasto)
+        self.postings = {}              # término -> array("I") de números
+        self.vocabulario = []           # términos ordenados, para prefijos
+        self.n_ingresos = 0
+        self.n_gastos = 0
+        self.entradas = 0
+
+    def valido(self, user) -> bool:
+        return self.n_ingresos <= len(user['ingresos']) and self.n_gastos <= len(user['gastos'])
+
+    def actualizar(self, user):
+        for tipo, lista, inicio in (("ingreso", user['ingresos'], self.n_ingresos), ("gasto", user['gastos'], self.n_gastos)):
+            for pos in range(inicio, len(lista)):
+                numero = len(self.refs)
+                self.refs.append(pos * 2 + (tipo == "gasto"))
+                for termino in _terminos_movimiento(tipo, lista[pos]):
+                    posting = self.postings.get(termino)
+                    if posting is None:
+                        posting = self.postings[termino] = array("I")
+                        self.vocabulario.insert(bisect_left(self.vocabulario, termino), termino)
+                    posting.append(numero)
+                    self.entradas += 1
+        self.n_ingresos = len(user['ingresos'])
+        self.n_gastos = len(user['gastos'])
+
+    def _posting(self, termino):
+        posting = self.postings.get(termino)
+        if posting is not None:
+            return posting
+        inicio = bisect_left(self.vocabulario, termino)
+        fin = bisect_left(self.vocabulario, termino + "\uffff")
+        if inicio == fin:
+            return array("I")
+        numeros = set()
+        for t in self.vocabulario[inicio:min(fin, inicio + MAX_EXPANSIONES)]:
+            numeros.update(self.postings[t])
+        return array("I", sorted(numeros))
+
+    def buscar(self, consulta: str):
+        """Números de los movimientos que contienen todos los términos (o palabras que empiezan por ellos).
+
+        Con un solo término es la lista del índice tal cual, sin copiarla; usar pagina() para leerla.
+        """
+        listas = sorted((self._posting(t) for t in set(terminos(consulta))), key=len)
+        if not listas:
+            return []
+        numeros = listas[0]
+        for otra in listas[1:]:
+            # Cada candidato se busca por bisección en la lista más larga
+            numeros = [n for n in numeros if (i := bisect_left(otra, n)) < len(otra) and otra[i] == n]
+        return numeros
+
+    def pagina(self, numeros, pagina: int, por_pagina: int) -> list:
+        """[(tipo, posición)] de una página de resultados, los más recientes primero."""
+        fin = len(numeros) - pagina * por_pagina
+        inicio = max(fin - por_pagina, 0)
+        refs = (self.refs[n] for n in reversed(numeros[inicio:max(fin, 0)]))
+        return [("gasto" if r & 1 else "ingreso", r >> 1) for r in refs]
+
+# =============================
+# CACHE POR USUARIO
+# =============================
+class CacheBusqueda:
+    """Índices por usuario en un LRU acotado por usuarios y por entradas totales."""
+
+    def __init__(self, usuarios: int = BUSQUEDA_USUARIOS, max_entradas: int = BUSQUEDA_MAX_ENTRADAS):
+        self.usuarios = usuarios
+        self.max_entradas = max_entradas
+        self._indices = OrderedDict()
+        self.entradas = 0
+
+    def obtener(self, user_id, user) -> IndiceMovimientos:
+        uid = str(user_id)
+        indice = self._indices.pop(uid, None)
+        if indice is not None:
+            self.entradas -= indice.entradas
+        if indice is None or not indice.valido(user):
+            indice = IndiceMovimientos()
+        indice.actualizar(user)
+        self._indices[uid] = indice
+        self.entradas += indice.entradas
+
+        while len(self._indices) > 1 and (len(self._indices) > self.usuarios or self.entradas > self.max_entradas):
+            _, viejo = self._indices.popitem(last=False)
+            self.entradas -= viejo.entradas
+        return indice
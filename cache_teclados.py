@@ -0,0 +1,60 @@
+import os
+from collections import OrderedDict
+
+TECLADOS_USUARIOS = int(os.getenv("TECLADOS_USUARIOS", 1000))
+TECLADOS_POR_USUARIO = int(os.getenv("TECLADOS_POR_USUARIO", 32))
+
+# =============================
+# CACHE DE TECLADOS
+# =============================
+class CacheTeclados:
+    """Teclados ya construidos por usuario, válidos mientras no cambie su catálogo.
+
+    LRU acotado en dos niveles: usuarios y teclados por usuario. Cada usuario guarda la
+    versión de catálogo con la que se construyeron sus teclados; si cambia, se descartan todos.
+    """
+
+    def __init__(self, usuarios: int = TECLADOS_USUARIOS, por_usuario: int = TECLADOS_POR_USUARIO):
+        self.usuarios = usuarios
+        self.por_usuario = por_usuario
+        self._cache = OrderedDict()  # uid -> (version, OrderedDict(clave -> teclado))
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, user_id, clave, construir):
+        """Devuelve el teclado cacheado o llama a construir() -> (version, teclado)."""
+        uid = str(user_id)
+        entrada = self._cache.get(uid)
+        if entrada is not None and clave in entrada[1]:
+            self._cache.move_to_end(uid)
+            entrada[1].move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1][clave]
+
+        self.fallos += 1
+        version, teclado = construir()
+        self.guardar(uid, version, clave, teclado)
+        return teclado
+
+    def guardar(self, user_id, version, clave, teclado):
+        uid = str(user_id)
+        entrada = self._cache.get(uid)
+        if entrada is None or entrada[0] != version:
+            entrada = (version, OrderedDict())
+            self._cache[uid] = entrada
+        self._cache.move_to_end(uid)
+        entrada[1][clave] = teclado
+        if len(entrada[1]) > self.por_usuario:
+            entrada[1].popitem(last=False)
+        if len(self._cache) > self.usuarios:
+            self._cache.popitem(last=False)
+
+    def validar(self, user_id, version):
+        # Si el catálogo cambió fuera de este proceso, descarta lo cacheado
+        uid = str(user_id)
+        entrada = self._cache.get(uid)
+        if entrada is not None and entrada[0] != version:
+            del self._cache[uid]
+
+    def invalidar(self, user_id):
+        self._cache.pop(str(user_id), None)
@@ -0,0 +1,128 @@
+import logging
+import os
+import time
+
+import httpx
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# =============================
+# CONFIGURACIÓN
+# =============================
+# Cliente principal: query.answer, reply_text, reply_photo, reply_document, recordatorios...
+TG_POOL = int(os.getenv("TG_POOL", 16))
+TG_POOL_TIMEOUT = float(os.getenv("TG_POOL_TIMEOUT", 5))
+TG_CONNECT_TIMEOUT = float(os.getenv("TG_CONNECT_TIMEOUT", 5))
+TG_READ_TIMEOUT = float(os.getenv("TG_READ_TIMEOUT", 10))
+# Subir fotos y CSV puede tardar más que un mensaje de texto
+TG_WRITE_TIMEOUT = float(os.getenv("TG_WRITE_TIMEOUT", 20))
+TG_KEEPALIVE = float(os.getenv("TG_KEEPALIVE", 60))
+TG_HTTP_VERSION = os.getenv("TG_HTTP_VERSION", "1.1")
+
+# Cliente de getUpdates: una sola conexión de long polling
+TG_UPDATES_POOL = int(os.getenv("TG_UPDATES_POOL", 1))
+TG_UPDATES_READ_TIMEOUT = float(os.getenv("TG_UPDATES_READ_TIMEOUT", 10))
+
+# Permite apuntar a un servidor local (ver mock_bot_api.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+TELEGRAM_FILE_URL = os.getenv("TELEGRAM_FILE_URL", "https://api.telegram.org/file/bot")
+
+# =============================
+# REQUEST CON MÉTRICAS
+# =============================
+class RequestMedido(HTTPXRequest):
+    """HTTPXRequest con keep-alive configurable y métricas de espera de pool y latencia."""
+
+    __slots__ = ("nombre", "keepalive")
+
+    def __init__(self, nombre: str, keepalive: float = TG_KEEPALIVE, **kwargs):
+        self.nombre = nombre
+        self.keepalive = keepalive
+        super().__init__(**kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limites = self._client_kwargs["limits"]
+        self._client_kwargs["limits"] = httpx.Limits(
+            max_connections=limites.max_connections,
+            max_keepalive_connections=limites.max_keepalive_connections,
+            keepalive_expiry=self.keepalive
+        )
+        self._client_kwargs["event_hooks"] = {"request": [self._medir_espera_pool]}
+        return super()._build_client()
+
+    async def _medir_espera_pool(self, request: httpx.Request):
+        # El primer evento de httpcore ocurre cuando ya hay una conexión del pool asignada
+        inicio = time.perf_counter()
+        metodo = request.url.path.rsplit("/", 1)[-1]
+        pendiente = [True]
+
+        async def trace(evento, info):
+            if pendiente:
+                pendiente.clear()
+                metricas.observar(f"http_espera_pool_{self.nombre}", metodo, (time.perf_counter() - inicio) * 1000)
+
+        request.extensions["trace"] = trace
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        metodo = url.rsplit("/", 1)[-1]
+        inicio = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data=request_data, **kwargs)
+        except Exception:
+            metricas.observar(f"http_error_{self.nombre}", metodo, (time.perf_counter() - inicio) * 1000)
+            raise
+        finally:
+            metricas.observar(f"http_latencia_{self.nombre}", metodo, (time.perf_counter() - inicio) * 1000)
+
+
+def _requests():
+    principal = RequestMedido(
+        "principal",
+        connection_pool_size=TG_POOL,
+        pool_timeout=TG_POOL_TIMEOUT,
+        connect_timeout=TG_CONNECT_TIMEOUT,
+        read_timeout=TG_READ_TIMEOUT,
+        write_timeout=TG_WRITE_TIMEOUT,
+        http_version=TG_HTTP_VERSION
+    )
+    updates = RequestMedido(
+        "updates",
+        connection_pool_size=TG_UPDATES_POOL,
+        pool_timeout=TG_POOL_TIMEOUT,
+        connect_timeout=TG_CONNECT_TIMEOUT,
+        read_timeout=TG_UPDATES_READ_TIMEOUT,
+        write_timeout=TG_WRITE_TIMEOUT,
+        http_version=TG_HTTP_VERSION
+    )
+    return principal, updates
+
+def configurar_red(builder):
+    """Aplica pool, timeouts, keep-alive y URL de la API a un ApplicationBuilder."""
+    principal, updates = _requests()
+    return (
+        builder
+        .base_url(TELEGRAM_API_URL)
+        .base_file_url(TELEGRAM_FILE_URL)
+        .request(principal)
+        .get_updates_request(updates)
+    )
+
+def crear_bot(token: str, clase=ExtBot):
+    """Bot con la misma configuración de red, para usar una subclase de ExtBot con builder.bot()."""
+    principal, updates = _requests()
+    return clase(
+        token,
+        base_url=TELEGRAM_API_URL,
+        base_file_url=TELEGRAM_FILE_URL,
+        request=principal,
+        get_updates_request=updates
+    )
+
+async def log_metricas_red(app):
+    resumen = metricas.resumen_texto("http_")
+    if resumen:
+        logger.info(f"Métricas HTTP:\n{resumen}")
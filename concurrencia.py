@@ -0,0 +1,77 @@
+"""Updates en paralelo sin perder movimientos: los de un mismo usuario van de a uno y en orden.
+
+Con CONCURRENCIA > 1 la Application atiende varios updates a la vez. ProcesadorPorUsuario toma
+el lock del usuario durante todo el update, así que dos toques seguidos del mismo usuario no
+intercalan su leer-modificar-guardar ni ven un estado de conversación viejo. Los jobs que
+modifican usuarios no lo toman: guardan con la verificación de versión de almacen.
+
+El límite de CONCURRENCIA se aplica recién con el lock del usuario tomado: los updates que esperan
+a su usuario (una ráfaga de toques) no ocupan lugares y no demoran a los demás usuarios.
+"""
+import asyncio
+import os
+import sys
+import time
+import weakref
+
+from telegram.ext import BaseUpdateProcessor
+
+import metricas
+
+# 1: un update a la vez, como siempre
+CONCURRENCIA = int(os.getenv("CONCURRENCIA", 1))
+
+class BloqueosUsuario:
+    """Un asyncio.Lock por usuario, que existe solo mientras alguien lo tiene o lo espera.
+
+    Un lock por usuario y no por franja: dos usuarios nunca se esperan entre sí, y la memoria
+    depende de los usuarios con updates en curso, no de todos los que hay.
+    """
+
+    def __init__(self):
+        self._locks = weakref.WeakValueDictionary()
+
+    def de(self, user_id) -> asyncio.Lock:
+        # Los jobs tienen el id como texto (clave de la DB) y los updates como número
+        clave = str(user_id)
+        lock = self._locks.get(clave)
+        if lock is None:
+            lock = self._locks[clave] = asyncio.Lock()
+        return lock
+
+bloqueos = BloqueosUsuario()
+
+class ProcesadorPorUsuario(BaseUpdateProcessor):
+    """Hasta 'limite' updates a la vez, en serie dentro de cada usuario."""
+
+    def __init__(self, limite: int):
+        # PTB toma su semáforo antes de do_process_update: con el límite ahí, los updates que esperan
+        # el lock de su usuario ocuparían todos los lugares. Se lo deja sin límite y se usa uno propio
+        super().__init__(sys.maxsize)
+        self.limite = limite
+        self._lugares = asyncio.BoundedSemaphore(limite)
+
+    async def do_process_update(self, update, coroutine):
+        usuario = getattr(update, "effective_user", None)
+        if usuario is None:
+            async with self._lugares:
+                await coroutine
+            return
+        inicio = time.perf_counter()
+        # asyncio.Lock despierta a los que esperan en orden de llegada: se respeta el orden del usuario
+        async with bloqueos.de(usuario.id):
+            metricas.observar("concurrencia_espera", "usuario", (time.perf_counter() - inicio) * 1000)
+            async with self._lugares:
+                await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+def configurar(builder):
+    """Activa el procesamiento concurrente si CONCURRENCIA > 1."""
+    if CONCURRENCIA > 1:
+        builder = builder.concurrent_updates(ProcesadorPorUsuario(CONCURRENCIA))
+    return builder
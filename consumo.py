@@ -0,0 +1,131 @@
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+# Movimientos que se miden por lista; con más se extrapola desde una muestra pareja
+STATS_MUESTRA = int(os.getenv("STATS_MUESTRA", 200))
+STATS_TOP = int(os.getenv("STATS_TOP", 10))
+# Ventana para la tasa de crecimiento
+STATS_DIAS = 30
+
+# =============================
+# TAMAÑOS
+# =============================
+def _tamano(obj) -> int:
+    # Bytes en memoria de obj y todo lo que contiene (aprox.: no descuenta objetos compartidos)
+    n = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        n += sum(_tamano(k) + _tamano(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        n += sum(_tamano(v) for v in obj)
+    return n
+
+def _tamano_json(obj, nivel: int) -> int:
+    # Bytes que ocupa obj en finanzas.json (indent=2) anidado a 'nivel' niveles de profundidad
+    texto = json.dumps(obj, indent=2, ensure_ascii=False)
+    return len(texto.encode()) + texto.count("\n") * 2 * nivel
+
+def _muestra(lista):
+    if len(lista) <= STATS_MUESTRA:
+        return lista
+    paso = len(lista) / STATS_MUESTRA
+    return [lista[int(i * paso)] for i in range(STATS_MUESTRA)]
+
+def _estimar_lista(lista):
+    """(bytes en memoria, bytes en JSON) de ingresos o gastos, extrapolando desde una muestra."""
+    if not lista:
+        return sys.getsizeof(lista), 2
+    muestra = _muestra(lista)
+    factor = len(lista) / len(muestra)
+    # users -> uid -> gastos -> movimiento: 4 niveles
+    memoria = sys.getsizeof(lista) + factor * sum(_tamano(m) for m in muestra)
+    serializado = factor * sum(_tamano_json(m, 4) + 10 for m in muestra)
+    return int(memoria), int(serializado)
+
+def _recientes(lista, desde: str) -> int:
+    # Las listas solo crecen al final: se cuentan desde el final hasta el primero más viejo
+    n = 0
+    for mov in reversed(lista):
+        if (mov.get('fecha') or "") < desde:
+            break
+        n += 1
+    return n
+
+def medir_usuario(uid, user, hoy: date) -> dict:
+    ingresos, gastos = user.get('ingresos', []), user.get('gastos', [])
+    mem_i, json_i = _estimar_lista(ingresos)
+    mem_g, json_g = _estimar_lista(gastos)
+    memoria, serializado = mem_i + mem_g, json_i + json_g
+    for clave, valor in user.items():
+        if clave not in ('ingresos', 'gastos'):
+            memoria += _tamano(valor)
+            serializado += _tamano_json(valor, 3)
+
+    desde = (hoy - timedelta(days=STATS_DIAS)).isoformat()
+    recientes = _recientes(ingresos, desde) + _recientes(gastos, desde)
+    movimientos = len(ingresos) + len(gastos)
+    por_movimiento = (json_i + json_g) / movimientos if movimientos else 0
+    return {
+        "uid": uid,
+        "ingresos": len(ingresos),
+        "gastos": len(gastos),
+        "productos": sum(len(p) for p in user.get('productos', {}).values()),
+        "bytes_memoria": memoria,
+        "bytes_json": serializado,
+        "mov_dia": recientes / STATS_DIAS,
+        "bytes_dia": recientes / STATS_DIAS * por_movimiento,
+    }
+
+# =============================
+# CONTABILIDAD INCREMENTAL
+# =============================
+class Contabilidad:
+    """Mediciones por usuario, recalculadas solo para quien agregó o borró datos desde la última vez."""
+
+    def __init__(self):
+        self._cache = {}   # uid -> (version, medición)
+
+    def medir(self, db) -> list:
+        hoy = date.today()
+        mediciones = []
+        for uid, user in db["users"].items():
+            version = (
+                hoy, len(user), len(user.get('ingresos', [])), len(user.get('gastos', [])),
+                sum(len(p) for p in user.get('productos', {}).values()),
+            )
+            entrada = self._cache.get(uid)
+            if entrada is None or entrada[0] != version:
+                entrada = self._cache[uid] = (version, medir_usuario(uid, user, hoy))
+            mediciones.append(entrada[1])
+        for uid in self._cache.keys() - db["users"].keys():
+            del self._cache[uid]
+        return mediciones
+
+# =============================
+# REPORTE
+# =============================
+def _bytes(n: float) -> str:
+    for unidad in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unidad}" if unidad == "B" else f"{n:.1f} {unidad}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def reporte_texto(mediciones: list, bytes_archivo: int, top: int = STATS_TOP) -> str:
+    total = lambda campo: sum(m[campo] for m in mediciones)
+    lineas = [
+        "📈 Uso por usuario (aproximado)",
+        f"Usuarios: {len(mediciones)} | Ingresos: {total('ingresos')} | Gastos: {total('gastos')} | Productos: {total('productos')}",
+        f"Memoria: {_bytes(total('bytes_memoria'))} | JSON: {_bytes(total('bytes_json'))} (archivo: {_bytes(bytes_archivo)})",
+        f"Crecimiento ({STATS_DIAS} días): {total('mov_dia'):.1f} mov/día ≈ {_bytes(total('bytes_dia'))}/día",
+    ]
+    pesados = sorted(mediciones, key=lambda m: m['bytes_json'], reverse=True)[:top]
+    if pesados:
+        lineas.append("\nMás pesados:")
+    for i, m in enumerate(pesados, 1):
+        lineas.append(
+            f"{i}. {m['uid']}: {_bytes(m['bytes_json'])} JSON, {_bytes(m['bytes_memoria'])} memoria | "
+            f"{m['ingresos']} ingresos, {m['gastos']} gastos, {m['productos']} productos | {m['mov_dia']:.1f} mov/día"
+        )
+    return "\n".join(lineas)
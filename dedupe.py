@@ -0,0 +1,135 @@
+import functools
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_CAPACIDAD = int(os.getenv("DEDUPE_CAPACIDAD", 5000))
+DEDUPE_INTERVALO = float(os.getenv("DEDUPE_INTERVALO", 30))
+
+# =============================
+# DEDUPLICACIÓN DE UPDATES
+# =============================
+class UpdatesProcesados:
+    """LRU acotado de update_id / callback_query.id ya procesados, guardado en disco.
+
+    Un update se marca como procesado recién cuando terminaron sus handlers: si el proceso se cae a
+    mitad de uno, Telegram lo vuelve a mandar y se atiende de nuevo (al menos una vez).
+    """
+
+    def __init__(self, archivo: Path, capacidad: int = DEDUPE_CAPACIDAD, intervalo: float = DEDUPE_INTERVALO):
+        self.archivo = archivo
+        self.capacidad = capacidad
+        self.intervalo = intervalo
+        self._vistos = OrderedDict()
+        self._en_curso = {}   # clave -> el update que filtrar dejó pasar
+        self._sucio = False
+        self._ultimo_guardado = time.monotonic()
+        self.cargar()
+
+    def cargar(self):
+        if not self.archivo.exists():
+            return
+        try:
+            with self.archivo.open("r", encoding="utf-8") as f:
+                claves = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Error cargando updates procesados: {e}")
+            return
+        for clave in claves[-self.capacidad:]:
+            self._vistos[clave] = None
+
+    def guardar(self):
+        if not self._sucio:
+            return
+        tmp = self.archivo.with_suffix(".tmp")
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(list(self._vistos), f)
+            os.replace(tmp, self.archivo)
+            self._sucio = False
+        except OSError as e:
+            logger.error(f"Error guardando updates procesados: {e}")
+        self._ultimo_guardado = time.monotonic()
+
+    @staticmethod
+    def claves(update: Update):
+        claves = [f"u{update.update_id}"]
+        if update.callback_query:
+            claves.append(f"c{update.callback_query.id}")
+        return claves
+
+    def registrar(self, update: Update) -> bool:
+        """Marca el update como procesado. Devuelve False si ya se había visto."""
+        claves = self.claves(update)
+        if any(c in self._vistos for c in claves):
+            for c in claves:
+                if c in self._vistos:
+                    self._vistos.move_to_end(c)
+            return False
+
+        for c in claves:
+            self._vistos[c] = None
+        while len(self._vistos) > self.capacidad:
+            self._vistos.popitem(last=False)
+        self._sucio = True
+
+        if time.monotonic() - self._ultimo_guardado >= self.intervalo:
+            self.guardar()
+        return True
+
+    async def filtrar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # Grupo -1, antes que cualquier handler que toque la DB. Los que se están atendiendo también
+        # cuentan: con CONCURRENCIA > 1 una reentrega puede llegar antes de que termine el original
+        claves = self.claves(update)
+        if any(c in self._vistos or c in self._en_curso for c in claves):
+            for c in claves:
+                if c in self._vistos:
+                    self._vistos.move_to_end(c)
+            logger.info(f"Update repetido ignorado: {update.update_id}")
+            raise ApplicationHandlerStop
+        for c in claves:
+            self._en_curso[c] = update
+
+    def terminar(self, update: Update, atendido: bool):
+        # Solo el update que filtrar dejó pasar: una reentrega descartada no suelta al original
+        claves = self.claves(update)
+        if self._en_curso.get(claves[0]) is not update:
+            return
+        for c in claves:
+            self._en_curso.pop(c, None)
+        if atendido:
+            self.registrar(update)
+
+    def instalar(self, app):
+        """Agrega el filtro (grupo -1) y envuelve app.process_update para confirmar al terminar.
+
+        La confirmación no es un handler de un grupo posterior: un ApplicationHandlerStop la
+        salteaba y el update quedaba en curso para siempre. Los errores de los handlers los atiende
+        PTB dentro de process_update, así que el update cuenta como atendido; si process_update se
+        corta (p. ej. cancelado al cerrar) solo se suelta, para atender la reentrega.
+        """
+        app.add_handler(TypeHandler(Update, self.filtrar), group=-1)
+        procesar = app.process_update
+
+        @functools.wraps(procesar)
+        async def process_update(update):
+            atendido = False
+            try:
+                await procesar(update)
+                atendido = True
+            finally:
+                if isinstance(update, Update):
+                    self.terminar(update, atendido)
+
+        app.process_update = process_update
+
+    async def guardar_al_cerrar(self, app):
+        self.guardar()
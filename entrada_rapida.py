@@ -0,0 +1,123 @@
+import os
+import re
+
+from indice_productos import normalizar
+
+MONTO_RE = re.compile(r"^(\+)?(\d+(?:[.,]\d+)?)$")
+# Un número más grande no es un monto escrito a mano: un teléfono ("+5355512345"), un carnet...
+MONTO_MAX = float(os.getenv("MONTO_MAX", 100_000_000))
+
+# =============================
+# PARSER DE ENTRADA RÁPIDA
+# =============================
+def nombre_categoria(categoria: str) -> str:
+    # "🍔 Comida" -> "comida", "📚 Educación" -> "educacion"
+    texto = normalizar(categoria)
+    return re.sub(r"^[^\w]+", "", texto).strip()
+
+def _monto(token: str):
+    m = MONTO_RE.match(token)
+    if not m:
+        return None, False
+    monto = float(m.group(2).replace(",", "."))
+    if monto > MONTO_MAX:
+        return None, False
+    return monto, bool(m.group(1))
+
+def buscar_categoria(texto: str, categorias):
+    texto = normalizar(texto)
+    for c in categorias:
+        if nombre_categoria(c) == texto:
+            return c
+    return None
+
+def parsear(texto: str, indice, categorias_gasto, categorias_ingreso):
+    """Interpreta un mensaje de una línea como gasto o ingreso.
+
+    - "+1500 salario"       -> ingreso de 1500 en "💼 Salario"
+    - "arroz 50"            -> gasto del producto Arroz (categoría tomada del catálogo)
+    - "comida arroz 50"     -> gasto de Arroz en "🍔 Comida"
+    - "comida 50"           -> gasto sin producto en "🍔 Comida"
+
+    Devuelve un dict con tipo, monto, categoria, producto y nuevo (producto fuera del
+    catálogo), o None si el texto no tiene ese formato.
+    """
+    tokens = texto.split()
+    if not tokens:
+        return None
+
+    # Ingreso: un monto con "+" al principio o al final. En medio del texto suele ser otra cosa
+    for i in dict.fromkeys((0, len(tokens) - 1)):
+        monto, positivo = _monto(tokens[i])
+        if monto is not None and positivo and monto > 0:
+            resto = " ".join(tokens[:i] + tokens[i + 1:])
+            categoria = buscar_categoria(resto, categorias_ingreso) or resto.strip() or "Otro"
+            return {"tipo": "ingreso", "monto": monto, "categoria": categoria}
+
+    # Gasto: monto al final o al principio
+    if len(tokens) < 2:
+        return None
+    monto, _ = _monto(tokens[-1])
+    palabras = tokens[:-1]
+    if monto is None:
+        monto, _ = _monto(tokens[0])
+        palabras = tokens[1:]
+    if monto is None or monto <= 0:
+        return None
+
+    categoria = None
+    for n in range(len(palabras), 0, -1):
+        categoria = buscar_categoria(" ".join(palabras[:n]), categorias_gasto)
+        if categoria:
+            palabras = palabras[n:]
+            break
+
+    nombre = " ".join(palabras)
+    if not nombre:
+        if not categoria:
+            return None
+        return {"tipo": "gasto", "monto": monto, "categoria": categoria, "producto": None, "nuevo": False}
+
+    encontrado = indice.exacto(nombre, categoria)
+    if encontrado:
+        categoria, producto = encontrado
+        return {"tipo": "gasto", "monto": monto, "categoria": categoria, "producto": producto, "nuevo": False}
+
+    return {"tipo": "gasto", "monto": monto, "categoria": categoria or "📦 Otros", "producto": nombre, "nuevo": True}
+
+# =============================
+# LOTES MULTILÍNEA
+# =============================
+MAX_LINEAS_LOTE = 100
+
+def parsear_lote(texto: str, requiere_nombre: bool = False):
+    """Una línea por elemento: 'nombre, monto' o solo 'monto', con una sola coma.
+
+    Devuelve (items, errores); items = [{"producto", "monto", "linea", "texto"}], errores = [(n_linea, linea)].
+    """
+    items, errores = [], []
+    lineas = [l.strip() for l in texto.strip().splitlines()]
+    for n, linea in enumerate(lineas, 1):
+        if not linea:
+            continue
+        if n > MAX_LINEAS_LOTE:
+            errores.append((n, f"máximo {MAX_LINEAS_LOTE} líneas por mensaje"))
+            break
+        # Como en una sola línea: más de una coma no es 'nombre, monto' ("Arroz, 50,5")
+        partes = [p.strip() for p in linea.split(",")]
+        if len(partes) > 2:
+            errores.append((n, linea))
+            continue
+        nombre = partes[0] if len(partes) == 2 else None
+        nombre = nombre or None
+        try:
+            monto = float(partes[-1])
+        except ValueError:
+            errores.append((n, linea))
+            continue
+        # 'not 0 < monto' también descarta nan
+        if not 0 < monto <= MONTO_MAX or (requiere_nombre and not nombre):
+            errores.append((n, linea))
+            continue
+        items.append({"producto": nombre, "monto": monto, "linea": n, "texto": linea})
+    return items, errores
@@ -0,0 +1,265 @@
+"""Pruebas diferenciales: las versiones optimizadas de los reportes contra las originales.
+
+Las funciones *_original reproducen tal cual el código de bot.py anterior a cualquier
+optimización y no se tocan. Cada par de EQUIVALENCIAS se corre sobre historiales aleatorios
+(fechas mal formadas, producto None o ausente, bordes de mes, listas desordenadas) y se
+compara el resultado exacto: números, texto, o la excepción que se lanza.
+
+Uso:
+    python equivalencia.py --casos 500 --semilla 7
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import warnings
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("TOKEN", "123456:ABCDEF")
+
+import bot
+
+FECHAS_MALFORMADAS = ["", "ayer", "2026-13-01T10:00:00", "2026-02-30", "10/03/2026", None, 20260301]
+CATEGORIAS_RARAS = ["Sin categoría", "🎯 Otro", "categoría, con coma"]
+
+# =============================
+# IMPLEMENTACIONES ORIGINALES
+# =============================
+def saldo_original(user, ahora):
+    total_ingresos = sum(i['monto'] for i in user.get('ingresos', []))
+    total_gastos = sum(g['monto'] for g in user.get('gastos', []))
+    return total_ingresos - total_gastos
+
+def _del_mes(user, ahora):
+    def filtrar_mes(item):
+        try:
+            fecha = datetime.fromisoformat(item['fecha'])
+            return fecha.month == ahora.month and fecha.year == ahora.year
+        except:
+            return False
+    ingresos = [i for i in user.get('ingresos', []) if filtrar_mes(i)]
+    gastos = [g for g in user.get('gastos', []) if filtrar_mes(g)]
+    return ingresos, gastos
+
+def resumen_gastos_original(user, ahora):
+    _, gastos = _del_mes(user, ahora)
+    msg = "📊 Gastos del mes:\n"
+    for g in gastos:
+        producto = g.get("producto","")
+        msg += f"- {g['categoria']}{(' → '+producto) if producto else ''}: {bot.fmt_cup(g['monto'])}\n"
+    if not gastos:
+        msg += "No hay gastos registrados este mes."
+    return [msg]
+
+def resumen_ingresos_original(user, ahora):
+    ingresos, _ = _del_mes(user, ahora)
+    msg = "📊 Ingresos del mes:\n"
+    for i in ingresos:
+        msg += f"- {i['categoria']}: {bot.fmt_cup(i['monto'])}\n"
+    if not ingresos:
+        msg += "No hay ingresos registrados este mes."
+    return [msg]
+
+def resumen_general_original(user, ahora):
+    ingresos, gastos = _del_mes(user, ahora)
+    total_ingresos = sum(i['monto'] for i in ingresos)
+    total_gastos = sum(g['monto'] for g in gastos)
+    detalle_gastos = {}
+    for g in gastos:
+        cat = g['categoria']
+        detalle_gastos[cat] = detalle_gastos.get(cat, 0) + g['monto']
+
+    msg = f"📊 Resumen general mes {ahora.strftime('%B %Y')}\n"
+    msg += f"Total Ingresos: {bot.fmt_cup(total_ingresos)}\n"
+    msg += f"Total Gastos: {bot.fmt_cup(total_gastos)}\n"
+    msg += f"Balance: {bot.fmt_cup(total_ingresos - total_gastos)}\n\n"
+    msg += "Gastos por categoría:\n"
+    for cat, val in detalle_gastos.items():
+        presupuesto = user.get('presupuestos', {}).get(cat)
+        if presupuesto:
+            porcentaje = (val / presupuesto) * 100
+            msg += f"- {cat}: {bot.fmt_cup(val)} ({porcentaje:.1f}% del presupuesto)\n"
+        else:
+            msg += f"- {cat}: {bot.fmt_cup(val)}\n"
+    return [msg]
+
+def analisis_original(user, ahora):
+    gastos = user.get('gastos', [])
+    if not gastos:
+        return None
+    dias = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+    gastos_por_dia = {dia: 0 for dia in dias}
+    for gasto in gastos:
+        try:
+            fecha = datetime.fromisoformat(gasto['fecha'])
+            gastos_por_dia[dias[fecha.weekday()]] += gasto['monto']
+        except:
+            continue
+    categorias = {}
+    for gasto in gastos:
+        cat = gasto.get('categoria', 'Sin categoría')
+        categorias[cat] = categorias.get(cat, 0) + 1
+    categoria_frecuente = max(categorias, key=categorias.get) if categorias else "Ninguna"
+    productos = {}
+    for gasto in gastos:
+        prod = gasto.get('producto', 'Sin producto')
+        if prod:
+            productos[prod] = productos.get(prod, 0) + gasto['monto']
+    producto_mas_comun = max(productos, key=productos.get) if productos else "Ninguno"
+    return {
+        "gasto_promedio_diario": sum(g['monto'] for g in gastos) / len(gastos),
+        "dia_mas_gastos": max(gastos_por_dia, key=gastos_por_dia.get),
+        "categoria_frecuente": categoria_frecuente,
+        "producto_mas_comun": producto_mas_comun
+    }
+
+def csv_original(user, ahora):
+    csv_content = "Tipo,Categoría,Producto,Monto,Fecha\n"
+    for ingreso in user.get('ingresos', []):
+        csv_content += f"Ingreso,{ingreso['categoria']},,{ingreso['monto']},{ingreso['fecha']}\n"
+    for gasto in user.get('gastos', []):
+        producto = gasto.get('producto', '')
+        csv_content += f"Gasto,{gasto['categoria']},{producto},{gasto['monto']},{gasto['fecha']}\n"
+    return [csv_content]
+
+# =============================
+# IMPLEMENTACIONES ACTUALES
+# =============================
+class _Captura:
+    # Mensaje falso que guarda lo que responde el handler (texto o contenido del documento)
+    def __init__(self, texto):
+        self.text = texto
+        self.respuestas = []
+
+    async def reply_text(self, texto, **kwargs):
+        self.respuestas.append(texto)
+
+    async def reply_document(self, document, **kwargs):
+        self.respuestas.append(document.input_file_content.decode())
+
+def _respuestas_handler(opcion):
+    """Corre resumen_opcion de bot.py con el usuario guardado en la DB y devuelve lo que respondió."""
+    def correr(user, ahora):
+        uid = 777
+        bot._db_save({"users": {str(uid): user}})
+        mensaje = _Captura(opcion)
+        update = SimpleNamespace(message=mensaje, effective_user=SimpleNamespace(id=uid))
+        asyncio.run(bot.resumen_opcion(update, None))
+        return mensaje.respuestas
+    return correr
+
+# nombre -> (original, actual); las dos reciben (user, ahora)
+EQUIVALENCIAS = {
+    "saldo_actual": (saldo_original, lambda user, ahora: bot.saldo_actual(user)),
+    "analisis_habitos": (analisis_original, lambda user, ahora: bot.analisis_habitos(user)),
+    "resumen[Resumen de gastos]": (resumen_gastos_original, _respuestas_handler("Resumen de gastos")),
+    "resumen[Resumen de ingresos]": (resumen_ingresos_original, _respuestas_handler("Resumen de ingresos")),
+    "resumen[Resumen general]": (resumen_general_original, _respuestas_handler("Resumen general")),
+    "resumen[Exportar datos]": (csv_original, _respuestas_handler("Exportar datos")),
+}
+
+# =============================
+# HISTORIALES ALEATORIOS
+# =============================
+def _fecha(rng, ahora):
+    r = rng.random()
+    if r < 0.06:
+        return rng.choice(FECHAS_MALFORMADAS)
+    if r < 0.3:
+        # Bordes: primer y último segundo del mes actual, del anterior y del siguiente, y el mismo mes hace un año
+        inicio_mes = ahora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        siguiente = (inicio_mes + timedelta(days=32)).replace(day=1)
+        borde = rng.choice([
+            inicio_mes, inicio_mes - timedelta(seconds=1), siguiente, siguiente - timedelta(seconds=1),
+            inicio_mes.replace(year=inicio_mes.year - 1), inicio_mes - timedelta(microseconds=1),
+        ])
+        return borde.isoformat() if rng.random() < 0.8 else borde.date().isoformat()
+    return (ahora - timedelta(seconds=rng.uniform(0, 120 * 86400))).isoformat()
+
+def _monto(rng):
+    return rng.choice([rng.randint(1, 500) * 10, round(rng.uniform(0.01, 999), 2), 0.1, 0.2, 1e-9, 0])
+
+def _movimiento(rng, ahora, categorias, gasto: bool):
+    mov = {"monto": _monto(rng), "categoria": rng.choice(categorias), "fecha": _fecha(rng, ahora)}
+    if gasto:
+        r = rng.random()
+        if r < 0.3:
+            mov["producto"] = None
+        elif r < 0.4:
+            mov["producto"] = ""
+        elif r < 0.9:
+            mov["producto"] = rng.choice(["Arroz", "Pollo", "Taxi", "Jabón", "Producto, raro"])
+    return mov
+
+def generar_usuario(rng, max_movimientos, ahora):
+    gastos_cat = bot.CATEGORIAS_GASTO + CATEGORIAS_RARAS
+    user = {
+        "ingresos": [_movimiento(rng, ahora, bot.CATEGORIAS_INGRESO + CATEGORIAS_RARAS, False) for _ in range(rng.randint(0, max_movimientos // 4))],
+        "gastos": [_movimiento(rng, ahora, gastos_cat, True) for _ in range(rng.randint(0, max_movimientos))],
+        "productos": {},
+        "presupuestos": {c: rng.choice([0, 100, 1500, 0.5]) for c in rng.sample(gastos_cat, rng.randint(0, 4))},
+    }
+    if rng.random() < 0.5:
+        user["gastos"].sort(key=lambda g: str(g.get("fecha")))
+    # Pocos historiales con un movimiento sin fecha: el CSV falla con KeyError y no compara el texto
+    movimientos = user["ingresos"] + user["gastos"]
+    if movimientos and rng.random() < 0.1:
+        del rng.choice(movimientos)["fecha"]
+    return user
+
+# =============================
+# COMPARACIÓN
+# =============================
+def _resultado(funcion, user, ahora):
+    try:
+        return ("ok", funcion(user, ahora))
+    except Exception as e:
+        return ("error", type(e).__name__)
+
+def comparar(casos: int, max_movimientos: int, semilla: int, nombres=None) -> dict:
+    """{nombre: [(caso, original, actual)]} con las divergencias encontradas."""
+    ahora = datetime.now()
+    divergencias = {nombre: [] for nombre in nombres or EQUIVALENCIAS}
+    for caso in range(casos):
+        base = generar_usuario(random.Random(semilla * 1_000_003 + caso), max_movimientos, ahora)
+        for nombre in divergencias:
+            original, actual = EQUIVALENCIAS[nombre]
+            # Cada implementación recibe su propia copia: algunas agregan claves al usuario
+            esperado = _resultado(original, _copia(base), ahora)
+            obtenido = _resultado(actual, _copia(base), ahora)
+            if esperado != obtenido:
+                divergencias[nombre].append((caso, esperado, obtenido))
+    return divergencias
+
+def _copia(user):
+    return {k: ([dict(m) for m in v] if isinstance(v, list) else dict(v)) for k, v in user.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara las implementaciones actuales con las originales")
+    parser.add_argument("--casos", type=int, default=300)
+    parser.add_argument("--movimientos", type=int, default=80, help="máximo de gastos por historial")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--mostrar", type=int, default=3, help="divergencias a mostrar por función")
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    warnings.filterwarnings("ignore")
+    with tempfile.TemporaryDirectory() as carpeta:
+        bot.DB_FILE = Path(carpeta) / "finanzas.json"
+        divergencias = comparar(args.casos, args.movimientos, args.semilla)
+
+    total = 0
+    for nombre, lista in divergencias.items():
+        total += len(lista)
+        print(f"{'✅' if not lista else '❌'} {nombre}: {len(lista)} divergencias en {args.casos} casos")
+        for caso, esperado, obtenido in lista[:args.mostrar]:
+            print(f"   caso {caso} (--semilla {args.semilla}):\n     original: {esperado!r:.300}\n     actual:   {obtenido!r:.300}")
+    sys.exit(1 if total else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import math
+import os
+
+# Desviaciones estándar a partir de las cuales un gasto se considera fuera de lo normal
+ATIPICO_Z = float(os.getenv("ATIPICO_Z", 3))
+# Gastos previos necesarios en la categoría antes de empezar a avisar
+ATIPICO_MIN_GASTOS = int(os.getenv("ATIPICO_MIN_GASTOS", 5))
+
+# =============================
+# ESTADÍSTICAS POR CATEGORÍA
+# =============================
+def estadisticas_gasto(user) -> dict:
+    """{categoría: {"n", "media", "m2"}} actualizadas con el algoritmo de Welford en cada gasto.
+
+    Si el usuario aún no las tiene (datos anteriores), se calculan una sola vez del historial.
+    """
+    if "estadisticas_gasto" not in user:
+        stats = {}
+        for g in user.get('gastos', []):
+            actualizar(stats.setdefault(g['categoria'], {"n": 0, "media": 0.0, "m2": 0.0}), g['monto'])
+        user["estadisticas_gasto"] = stats
+    return user["estadisticas_gasto"]
+
+def actualizar(stats, monto):
+    stats['n'] += 1
+    delta = monto - stats['media']
+    stats['media'] += delta / stats['n']
+    stats['m2'] += delta * (monto - stats['media'])
+
+def desviacion(stats) -> float:
+    return math.sqrt(stats['m2'] / (stats['n'] - 1)) if stats['n'] > 1 else 0.0
+
+def registrar(user, gasto):
+    """Compara el gasto con lo habitual en su categoría y luego lo incorpora. O(1).
+
+    Devuelve (media, desviación) si el monto está a más de ATIPICO_Z desviaciones de la media, o None.
+    """
+    stats = estadisticas_gasto(user).setdefault(gasto['categoria'], {"n": 0, "media": 0.0, "m2": 0.0})
+    atipico = None
+    if stats['n'] >= ATIPICO_MIN_GASTOS:
+        media = stats['media']
+        # Si todos los gastos previos fueron iguales (mismo producto) la desviación es 0:
+        # se toma al menos un 10% de la media para no avisar por cualquier diferencia
+        sd = max(desviacion(stats), abs(media) * 0.1)
+        if sd > 0 and abs(gasto['monto'] - media) > ATIPICO_Z * sd:
+            atipico = (media, sd)
+    actualizar(stats, gasto['monto'])
+    return atipico
@@ -0,0 +1,225 @@
+import asyncio
+import io
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import metricas
+
+GRAFICOS_CACHE = int(os.getenv("GRAFICOS_CACHE", 256))
+MAPA_CALOR_ANIOS = int(os.getenv("MAPA_CALOR_ANIOS", 5))
+# Más puntos que esto por línea y la tendencia pasa a trimestres, y luego a años
+TENDENCIA_MAX_PUNTOS = int(os.getenv("TENDENCIA_MAX_PUNTOS", 36))
+MESES = ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
+
+_DIA = re.compile(r"\d{4}-\d{2}-\d{2}")
+_MES = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+
+# pyplot no es seguro entre hilos: todos los gráficos se dibujan en un único hilo aparte
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graficos")
+
+# matplotlib, seaborn y numpy tardan ~0.5 s en importarse: se cargan recién al dibujar
+# (o con precargar() una vez que el bot ya atiende updates)
+plt = np = sns = None
+
+def _cargar():
+    global plt, np, sns
+    if plt is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot
+        import numpy
+        import seaborn
+        plt, np, sns = matplotlib.pyplot, numpy, seaborn
+
+def precargar():
+    """Importa las librerías de gráficos en el hilo de gráficos, sin bloquear el event loop."""
+    return _ejecutor.submit(_cargar)
+
+# =============================
+# RENDER FUERA DEL EVENT LOOP
+# =============================
+class CacheGraficos:
+    """PNG ya generados por (usuario, gráfico), válidos mientras no cambie la versión de sus datos."""
+
+    def __init__(self, capacidad: int = GRAFICOS_CACHE):
+        self.capacidad = capacidad
+        self._cache = OrderedDict()   # (uid, clave) -> (version, png)
+        self.aciertos = 0
+        self.fallos = 0
+
+    async def obtener(self, user_id, clave, version, dibujar, *args) -> bytes:
+        """Devuelve el PNG cacheado o ejecuta dibujar(*args) en el hilo de gráficos."""
+        llave = (str(user_id), clave)
+        entrada = self._cache.get(llave)
+        if entrada is not None and entrada[0] == version:
+            self._cache.move_to_end(llave)
+            self.aciertos += 1
+            return entrada[1]
+
+        self.fallos += 1
+        png = await renderizar(dibujar, *args)
+        self._cache[llave] = (version, png)
+        self._cache.move_to_end(llave)
+        if len(self._cache) > self.capacidad:
+            self._cache.popitem(last=False)
+        return png
+
+async def renderizar(dibujar, *args) -> bytes:
+    return await asyncio.get_running_loop().run_in_executor(_ejecutor, _medido, dibujar, *args)
+
+def _medido(dibujar, *args) -> bytes:
+    # Solo el tiempo de dibujo, sin la espera en la cola del hilo
+    _cargar()
+    with metricas.medir("grafico_render", dibujar.__name__):
+        return dibujar(*args)
+
+def _png(fig) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    plt.close(fig)
+    return buf.getvalue()
+
+# =============================
+# GRÁFICOS
+# =============================
+def grafico_categorias(gastos_por_cat: dict, ingresos_por_cat: dict) -> bytes:
+    """Barras de ingresos vs gastos por categoría."""
+    _cargar()
+    fig = plt.figure(figsize=(10, 6))
+    sns.set_theme(style="whitegrid")
+
+    todas_categorias = list(set(gastos_por_cat) | set(ingresos_por_cat))
+    x = range(len(todas_categorias))
+    width = 0.35
+
+    plt.bar([i - width/2 for i in x], [gastos_por_cat.get(cat, 0) for cat in todas_categorias],
+            width, label='Gastos', color='#ff7f7f')
+    plt.bar([i + width/2 for i in x], [ingresos_por_cat.get(cat, 0) for cat in todas_categorias],
+            width, label='Ingresos', color='#7fbf7f')
+
+    plt.xlabel('Categorías')
+    plt.ylabel('Monto (CUP)')
+    plt.title('Ingresos vs Gastos por Categoría')
+    plt.xticks(x, todas_categorias, rotation=45, ha='right')
+    plt.legend()
+    plt.tight_layout()
+    return _png(fig)
+
+def dias_validos(gastos_por_dia: dict) -> dict:
+    """Solo los días 'YYYY-MM-DD' que existen: las fechas mal formadas ('2026-02-30') se descartan."""
+    validos = {}
+    for d, total in gastos_por_dia.items():
+        if not (isinstance(d, str) and _DIA.fullmatch(d)):
+            continue
+        try:
+            date.fromisoformat(d)
+        except ValueError:
+            continue
+        validos[d] = total
+    return validos
+
+def meses_validos(totales_por_mes: dict) -> dict:
+    """Solo los meses 'YYYY-MM' válidos: claves de fechas como '10/03/2026' se descartan."""
+    return {m: t for m, t in totales_por_mes.items() if isinstance(m, str) and _MES.fullmatch(m)}
+
+def mapa_calor(gastos_por_dia: dict, anios: int = MAPA_CALOR_ANIOS) -> bytes:
+    """Calendario por año (días de la semana x semanas) con el gasto total de cada día.
+
+    gastos_por_dia: {'YYYY-MM-DD': total}. Solo se dibujan los últimos 'anios' años con datos;
+    los días que no son fechas válidas se ignoran (ver dias_validos).
+    """
+    _cargar()
+    gastos_por_dia = dias_validos(gastos_por_dia)
+    dias = sorted(gastos_por_dia)
+    ordinales = np.array([date.fromisoformat(d).toordinal() for d in dias], dtype=np.int64)
+    totales = np.array([gastos_por_dia[d] for d in dias], dtype=float)
+    anios_dias = np.array([int(d[:4]) for d in dias])
+    lista_anios = sorted(set(anios_dias.tolist()))[-anios:]
+
+    sns.set_theme(style="white")
+    fig, ejes = plt.subplots(len(lista_anios), 1, figsize=(14, 2.4 * len(lista_anios)), squeeze=False)
+    maximo = totales.max() if len(totales) else 1
+    hoy = date.today().toordinal()
+    for eje, anio in zip(ejes[:, 0], reversed(lista_anios)):
+        enero = date(anio, 1, 1).toordinal()
+        desfase = date(anio, 1, 1).weekday()
+        semanas = (date(anio, 12, 31).toordinal() - enero + desfase) // 7 + 1
+        grilla = np.full((7, semanas), np.nan)
+        # Días ya transcurridos en 0 y luego los que tienen gastos, todo vectorizado.
+        # El ordinal 1 (1/1/1) fue lunes, así que (ordinal - 1) % 7 es el día de la semana
+        todos = np.arange(enero, min(date(anio, 12, 31).toordinal(), hoy) + 1)
+        grilla[(todos - 1) % 7, (todos - enero + desfase) // 7] = 0
+        sel = anios_dias == anio
+        o = ordinales[sel]
+        grilla[(o - 1) % 7, (o - enero + desfase) // 7] = totales[sel]
+
+        sns.heatmap(grilla, ax=eje, cmap="Reds", vmin=0, vmax=maximo, cbar=True,
+                    linewidths=0.5, linecolor="white", square=True,
+                    yticklabels=["L", "M", "X", "J", "V", "S", "D"], xticklabels=False)
+        eje.set_xticks([(date(anio, m, 1).toordinal() - enero + desfase) // 7 + 0.5 for m in range(1, 13)])
+        eje.set_xticklabels(MESES)
+        eje.set_title(str(anio), loc="left")
+        eje.tick_params(axis="y", rotation=0)
+    fig.suptitle("Gasto diario (CUP)")
+    fig.tight_layout()
+    return _png(fig)
+
+def _agrupar(totales: "np.ndarray", inicio: int, tamano: int):
+    # Suma por bloques de 'tamano' meses alineados al calendario (trimestres o años)
+    relleno = inicio % tamano
+    fin = -(len(totales) + relleno) % tamano
+    return np.pad(totales, (relleno, fin)).reshape(-1, tamano).sum(axis=1), inicio - relleno
+
+def tendencia(ingresos_por_mes: dict, gastos_por_mes: dict, max_puntos: int = TENDENCIA_MAX_PUNTOS) -> bytes:
+    """Ingresos, gastos y balance por mes de todo el historial, a partir de los totales mensuales.
+
+    Con historiales largos se agrupa por trimestre o por año para no pasar de max_puntos. Los meses
+    que no son 'YYYY-MM' se ignoran (ver meses_validos); tiene que quedar al menos uno.
+    """
+    _cargar()
+    ingresos_por_mes, gastos_por_mes = meses_validos(ingresos_por_mes), meses_validos(gastos_por_mes)
+    meses = set(ingresos_por_mes) | set(gastos_por_mes)
+    # Mes como número: año * 12 + (mes - 1)
+    numeros = {m: int(m[:4]) * 12 + int(m[5:]) - 1 for m in meses}
+    inicio, fin = min(numeros.values()), max(numeros.values())
+    ingresos = np.zeros(fin - inicio + 1)
+    gastos = np.zeros(fin - inicio + 1)
+    for m, n in numeros.items():
+        ingresos[n - inicio] = ingresos_por_mes.get(m, 0)
+        gastos[n - inicio] = gastos_por_mes.get(m, 0)
+
+    tamano, nombre = 1, "mes"
+    for t, n in ((3, "trimestre"), (12, "año")):
+        if len(ingresos) / tamano <= max_puntos:
+            break
+        tamano, nombre = t, n
+    if tamano > 1:
+        ingresos, inicio_grupo = _agrupar(ingresos, inicio, tamano)
+        gastos, _ = _agrupar(gastos, inicio, tamano)
+        inicio = inicio_grupo
+
+    numeros = inicio + np.arange(len(ingresos)) * tamano
+    if tamano == 12:
+        etiquetas = [str(n // 12) for n in numeros]
+    elif tamano == 3:
+        etiquetas = [f"T{n % 12 // 3 + 1} {n // 12}" for n in numeros]
+    else:
+        etiquetas = [f"{MESES[n % 12]} {n // 12}" for n in numeros]
+
+    fig = plt.figure(figsize=(12, 6))
+    sns.set_theme(style="whitegrid")
+    x = np.arange(len(etiquetas))
+    plt.plot(x, ingresos, marker="o", label="Ingresos", color="#4c9a4c")
+    plt.plot(x, gastos, marker="o", label="Gastos", color="#d9534f")
+    plt.plot(x, ingresos - gastos, marker="o", label="Balance", color="#337ab7")
+    plt.axhline(0, color="grey", linewidth=0.8)
+    paso = max(1, len(etiquetas) // 18)
+    plt.xticks(x[::paso], etiquetas[::paso], rotation=45, ha="right")
+    plt.ylabel("Monto (CUP)")
+    plt.title(f"Tendencia por {nombre}")
+    plt.legend()
+    plt.tight_layout()
+    return _png(fig)
@@ -0,0 +1,76 @@
+import re
+from bisect import bisect_right
+from datetime import date
+
+from indice_productos import id_producto
+
+_DIA = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# =============================
+# HISTORIAL DE PRECIOS
+# =============================
+def dia_de(fecha):
+    """'YYYY-MM-DD' de una fecha ISO, o None si no es una fecha válida (datos viejos: int, '10/03/2026')."""
+    dia = str(fecha)[:10]
+    if not _DIA.fullmatch(dia):
+        return None
+    try:
+        date.fromisoformat(dia)
+    except ValueError:
+        return None
+    return dia
+
+def historial_precios(user) -> dict:
+    """{id_producto: {"categoria", "producto", "fechas", "precios"}} con fechas 'YYYY-MM-DD' ordenadas.
+
+    Solo se guarda un punto cuando el precio cambia. Si el usuario aún no tiene historial
+    (datos anteriores, o presupuestos lo descartó por gastos agregados por fuera), se arma una sola
+    vez con sus gastos y, al final, el precio actual del catálogo.
+    """
+    if "precios" not in user:
+        user["precios"] = {}
+        for g in user.get('gastos', []):
+            if g.get('producto') and dia_de(g.get('fecha')):
+                registrar_precio(user, g['categoria'], g['producto'], g['monto'], g['fecha'])
+        hoy = date.today().isoformat()
+        # También para los que tienen gastos: el catálogo pudo cambiar después del último
+        for cat, prods in user.get('productos', {}).items():
+            for p, precio in prods.items():
+                registrar_precio(user, cat, p, precio, hoy)
+    return user["precios"]
+
+def historial(user, categoria, producto):
+    return historial_precios(user).get(id_producto(categoria, producto))
+
+def registrar_precio(user, categoria, producto, precio, fecha: str):
+    """Agrega el precio en su fecha (ISO). Varios cambios el mismo día dejan solo el último.
+
+    Una fecha que no es válida no se agrega: el gasto que la trae igual se registra.
+    """
+    dia = dia_de(fecha)
+    if dia is None:
+        return
+    pid = id_producto(categoria, producto)
+    h = historial_precios(user).setdefault(pid, {"categoria": categoria, "producto": producto, "fechas": [], "precios": []})
+    fechas, precios = h["fechas"], h["precios"]
+    i = bisect_right(fechas, dia)
+    if i and fechas[i - 1] == dia:
+        precios[i - 1] = precio
+        # Si el día vuelve al precio anterior, el punto sobra
+        if i > 1 and precios[i - 2] == precio:
+            del fechas[i - 1], precios[i - 1]
+    elif not (i and precios[i - 1] == precio):
+        fechas.insert(i, dia)
+        precios.insert(i, precio)
+
+def precio_en(h, fecha: str):
+    """Precio vigente en la fecha (ISO), o None si es anterior al primer registro."""
+    i = bisect_right(h["fechas"], str(fecha)[:10])
+    return h["precios"][i - 1] if i else None
+
+def variacion(h, desde: str, hasta: str):
+    """(precio en 'desde', precio en 'hasta', variación %) o None si no hay precio en 'desde'."""
+    antes, despues = precio_en(h, desde), precio_en(h, hasta)
+    if antes is None or despues is None or not antes:
+        return None
+    return antes, despues, (despues - antes) / antes * 100
@@ -0,0 +1,108 @@
+import base64
+import hashlib
+import os
+import unicodedata
+from bisect import bisect_left
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+PRODUCTOS_POR_PAGINA = int(os.getenv("PRODUCTOS_POR_PAGINA", 8))
+
+# =============================
+# IDS Y NORMALIZACIÓN
+# =============================
+def id_producto(categoria: str, producto: str) -> str:
+    # 8 caracteres estables derivados del nombre: caben siempre en los 64 bytes de callback_data
+    digest = hashlib.blake2b(f"{categoria}\x1f{producto}".encode(), digest_size=6).digest()
+    return base64.urlsafe_b64encode(digest).decode()
+
+def normalizar(texto: str) -> str:
+    texto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in texto if not unicodedata.combining(c)).strip()
+
+# =============================
+# ÍNDICE
+# =============================
+class IndiceProductos:
+    """Índice de productos de un usuario: id corto -> (categoría, producto) y búsqueda por prefijo.
+
+    Cada producto se indexa por el inicio de cada palabra de su nombre, en listas ordenadas
+    (global y por categoría), así que buscar cuesta O(log n + resultados).
+    """
+
+    def __init__(self, productos: dict, version: int = 0):
+        self.version = version
+        self.por_id = {}
+        self._claves = {None: ([], [])}  # categoría (None = todas) -> (claves, ids)
+
+        entradas = []
+        for cat, prods in productos.items():
+            for p in prods:
+                pid = id_producto(cat, p)
+                self.por_id[pid] = (cat, p)
+                entradas.append((normalizar(p), cat, p, pid))
+        entradas.sort()
+        # id -> posición en el orden alfabético
+        self._orden = {e[3]: i for i, e in enumerate(entradas)}
+        # nombre normalizado -> [(categoría, producto)]
+        self._por_nombre = {}
+        for nombre, cat, p, pid in entradas:
+            self._por_nombre.setdefault(nombre, []).append((cat, p))
+
+        claves = []
+        for nombre, cat, p, pid in entradas:
+            palabras = nombre.split()
+            for clave in [" ".join(palabras[i:]) for i in range(len(palabras))] or [nombre]:
+                claves.append((clave, cat, pid))
+        claves.sort()
+        for clave, cat, pid in claves:
+            for grupo in (None, cat):
+                lista = self._claves.setdefault(grupo, ([], []))
+                lista[0].append(clave)
+                lista[1].append(pid)
+
+    def __len__(self):
+        return len(self.por_id)
+
+    def exacto(self, nombre: str, categoria: str = None):
+        """Busca un producto por nombre completo (sin mayúsculas ni tildes)."""
+        for cat, p in self._por_nombre.get(normalizar(nombre), []):
+            if categoria is None or cat == categoria:
+                return cat, p
+        return None
+
+    def buscar(self, prefijo: str = "", categoria: str = None) -> list:
+        """Devuelve [(categoria, producto, id)] en orden alfabético."""
+        claves, ids = self._claves.get(categoria, ([], []))
+        prefijo = normalizar(prefijo)
+        if prefijo:
+            inicio = bisect_left(claves, prefijo)
+            fin = bisect_left(claves, prefijo + "\uffff")
+            encontrados = set(ids[inicio:fin])
+        else:
+            encontrados = set(ids)
+        return [(*self.por_id[pid], pid) for pid in sorted(encontrados, key=self._orden.get)]
+
+# =============================
+# TECLADO PAGINADO
+# =============================
+def teclado_paginado(resultados, pagina=0, etiqueta=lambda c, p: p, extras=(), por_pagina=PRODUCTOS_POR_PAGINA):
+    """Teclado inline con una página de resultados: callbacks 'p:<id>' y 'pag:<n>'."""
+    paginas = max(1, -(-len(resultados) // por_pagina))
+    pagina = min(max(pagina, 0), paginas - 1)
+    inicio = pagina * por_pagina
+
+    keyboard = [
+        [InlineKeyboardButton(etiqueta(c, p), callback_data=f"p:{pid}")]
+        for c, p, pid in resultados[inicio:inicio + por_pagina]
+    ]
+    if paginas > 1:
+        nav = []
+        if pagina > 0:
+            nav.append(InlineKeyboardButton("◀️", callback_data=f"pag:{pagina - 1}"))
+        nav.append(InlineKeyboardButton(f"{pagina + 1}/{paginas}", callback_data="noop"))
+        if pagina < paginas - 1:
+            nav.append(InlineKeyboardButton("▶️", callback_data=f"pag:{pagina + 1}"))
+        keyboard.append(nav)
+    keyboard.extend(extras)
+    return InlineKeyboardMarkup(keyboard)
@@ -0,0 +1,124 @@
+import functools
+import logging
+import os
+import time
+
+import tornado.web
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes, ConversationHandler
+
+import metricas
+import perfilador
+
+logger = logging.getLogger(__name__)
+
+# Usuarios que pueden pedir /metricas, ej: "12345,67890"
+ADMIN_IDS = {int(i) for i in os.getenv("ADMIN_IDS", "").split(",") if i.strip()}
+# Puerto del endpoint /metrics en modo webhook (0 = desactivado)
+METRICAS_PUERTO = int(os.getenv("METRICAS_PUERTO", 9090))
+
+# =============================
+# LATENCIA POR HANDLER Y POR ESTADO
+# =============================
+def _envolver(handler, estado=None):
+    callback = handler.callback
+    if getattr(callback, "instrumentado", False):
+        return
+    nombre = getattr(callback, "__name__", type(handler).__name__)
+
+    @functools.wraps(callback)
+    async def medido(update, context):
+        inicio = time.perf_counter()
+        try:
+            if perfilador.activo and perfilador.muestrear(nombre, update):
+                return await perfilador.perfilar(nombre, update, callback(update, context))
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            metricas.observar("handler_error", nombre, (time.perf_counter() - inicio) * 1000)
+            raise
+        finally:
+            ms = (time.perf_counter() - inicio) * 1000
+            metricas.observar("handler_latencia", nombre, ms)
+            if estado is not None:
+                metricas.observar("estado_latencia", estado, ms)
+
+    medido.instrumentado = True
+    handler.callback = medido
+
+def _instrumentar_handler(handler):
+    if isinstance(handler, ConversationHandler):
+        conv = handler.name or "conversacion"
+        for h in handler.entry_points:
+            _instrumentar_handler_estado(h, f"{conv}:inicio")
+        for estado, handlers in handler.states.items():
+            for h in handlers:
+                _instrumentar_handler_estado(h, f"{conv}:{estado}")
+        for h in handler.fallbacks:
+            _instrumentar_handler_estado(h, f"{conv}:fallback")
+    else:
+        _envolver(handler)
+
+def _instrumentar_handler_estado(handler, estado):
+    if isinstance(handler, ConversationHandler):
+        _instrumentar_handler(handler)
+    else:
+        _envolver(handler, estado)
+
+def instrumentar(app):
+    """Mide la latencia de todos los handlers registrados, también dentro de las conversaciones.
+
+    Llamar después de agregar los handlers.
+    """
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            _instrumentar_handler(handler)
+
+# =============================
+# CONSULTA: COMANDO Y ENDPOINT
+# =============================
+def partir_mensaje(msg, limite=4096):
+    # Telegram rechaza mensajes de más de 4096 caracteres
+    partes = []
+    while len(msg) > limite:
+        corte = msg.rfind("\n", 0, limite)
+        if corte <= 0:
+            corte = limite
+        partes.append(msg[:corte])
+        msg = msg[corte:].lstrip("\n")
+    partes.append(msg)
+    return partes
+
+async def comando_metricas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /metricas, solo para ADMIN_IDS (modo polling, sin endpoint HTTP)
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    for parte in partir_mensaje(metricas.resumen_texto() or "Sin métricas todavía."):
+        await update.message.reply_text(parte)
+
+class _MetricasHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(metricas.texto_prometheus())
+
+def puerto_instancia(instancia: str, puerto: int = METRICAS_PUERTO) -> int:
+    """Puerto de /metrics de una INSTANCIA numérica: METRICAS_PUERTO + INSTANCIA, para que varias
+    instancias en el mismo host no choquen. Con otro nombre hay que dar METRICAS_PUERTO a cada una.
+    """
+    if puerto and instancia.isdigit():
+        return puerto + int(instancia)
+    return puerto
+
+def servidor_metricas(puerto: int = METRICAS_PUERTO, direccion: str = "0.0.0.0"):
+    """Sirve /metrics en formato Prometheus junto al listener del webhook, en el mismo event loop."""
+    if not puerto:
+        return None
+    try:
+        servidor = tornado.web.Application([(r"/metrics", _MetricasHandler)], log_function=lambda h: None).listen(puerto, address=direccion)
+    except OSError as e:
+        # Sin /metrics el bot sigue atendiendo: no vale la pena no arrancar por esto
+        logger.error(f"No se pudo abrir /metrics en el puerto {puerto}: {e}")
+        return None
+    logger.info(f"Métricas en http://{direccion}:{puerto}/metrics")
+    return servidor
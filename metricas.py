@@ -0,0 +1,116 @@
+import time
+from contextlib import contextmanager
+
+# Límites superiores de cada bucket, en milisegundos
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# =============================
+# HISTOGRAMAS
+# =============================
+class Histograma:
+    """Histograma de buckets fijos: memoria constante sin importar cuántas muestras."""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)
+        self.suma = 0.0
+        self.total = 0
+        self.maximo = 0.0
+
+    def observar(self, ms: float):
+        for i, limite in enumerate(self.buckets):
+            if ms <= limite:
+                self.conteos[i] += 1
+                break
+        else:
+            self.conteos[-1] += 1
+        self.suma += ms
+        self.total += 1
+        self.maximo = max(self.maximo, ms)
+
+    def percentil(self, p: float) -> float:
+        # Devuelve el límite superior del bucket donde cae el percentil
+        if not self.total:
+            return 0.0
+        objetivo = p / 100 * self.total
+        acumulado = 0
+        for i, conteo in enumerate(self.conteos):
+            acumulado += conteo
+            if acumulado >= objetivo:
+                return self.buckets[i] if i < len(self.buckets) else self.maximo
+        return self.maximo
+
+    @property
+    def promedio(self) -> float:
+        return self.suma / self.total if self.total else 0.0
+
+
+# (métrica, etiqueta) -> Histograma
+histogramas = {}
+# (métrica, etiqueta) -> último valor (tamaño de la DB, etc.)
+valores = {}
+
+def observar(metrica: str, etiqueta: str, ms: float):
+    clave = (metrica, etiqueta)
+    if clave not in histogramas:
+        histogramas[clave] = Histograma()
+    histogramas[clave].observar(ms)
+
+def fijar(metrica: str, etiqueta: str, valor: float):
+    valores[(metrica, etiqueta)] = valor
+
+@contextmanager
+def medir(metrica: str, etiqueta: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(metrica, etiqueta, (time.perf_counter() - inicio) * 1000)
+
+def resumen_texto(prefijo: str = "") -> str:
+    lineas = []
+    for (metrica, etiqueta), h in sorted(histogramas.items()):
+        if not metrica.startswith(prefijo):
+            continue
+        lineas.append(
+            f"{metrica}[{etiqueta}] n={h.total} prom={h.promedio:.1f}ms "
+            f"p50={h.percentil(50):g}ms p99={h.percentil(99):g}ms max={h.maximo:.1f}ms"
+        )
+    for (metrica, etiqueta), valor in sorted(valores.items()):
+        if metrica.startswith(prefijo):
+            lineas.append(f"{metrica}[{etiqueta}] {valor:g}")
+    return "\n".join(lineas)
+
+# =============================
+# FORMATO PROMETHEUS
+# =============================
+def _escapar(texto: str) -> str:
+    return str(texto).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def texto_prometheus(espacio: str = "finanzas") -> str:
+    """Histogramas (en ms) y valores en el formato de texto que lee Prometheus."""
+    lineas = []
+    por_metrica = {}
+    for (metrica, etiqueta), h in histogramas.items():
+        por_metrica.setdefault(metrica, []).append((etiqueta, h))
+    for metrica, series in sorted(por_metrica.items()):
+        nombre = f"{espacio}_{metrica}_ms"
+        lineas.append(f"# TYPE {nombre} histogram")
+        for etiqueta, h in sorted(series, key=lambda s: s[0]):
+            et = f'etiqueta="{_escapar(etiqueta)}"'
+            acumulado = 0
+            for limite, conteo in zip(h.buckets, h.conteos):
+                acumulado += conteo
+                lineas.append(f'{nombre}_bucket{{{et},le="{limite}"}} {acumulado}')
+            lineas.append(f'{nombre}_bucket{{{et},le="+Inf"}} {h.total}')
+            lineas.append(f"{nombre}_sum{{{et}}} {h.suma}")
+            lineas.append(f"{nombre}_count{{{et}}} {h.total}")
+
+    tipos = set()
+    for (metrica, etiqueta), valor in sorted(valores.items()):
+        nombre = f"{espacio}_{metrica}"
+        if nombre not in tipos:
+            tipos.add(nombre)
+            lineas.append(f"# TYPE {nombre} gauge")
+        lineas.append(f'{nombre}{{etiqueta="{_escapar(etiqueta)}"}} {valor}')
+    return "\n".join(lineas) + "\n"
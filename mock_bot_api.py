@@ -0,0 +1,136 @@
+"""Servidor local que imita la Bot API de Telegram para pruebas.
+
+Uso:
+    python mock_bot_api.py --puerto 8081 --latencia 50
+    TELEGRAM_API_URL=http://127.0.0.1:8081/bot TOKEN=123:abc python bot.py
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FinanzasBot", "username": "finanzas_bot"}
+
+
+class MockBotAPI:
+    """Bot API falsa en un hilo aparte. Cuenta las llamadas por método."""
+
+    def __init__(self, host="127.0.0.1", puerto=0, latencia_ms=0.0, historial=200):
+        self.latencia_ms = latencia_ms
+        self.llamadas = Counter()
+        # Últimas llamadas (método, parámetros) para inspeccionar respuestas en pruebas
+        self.historial = deque(maxlen=historial)
+        self._ids = itertools.count(1)
+        self.webhook = ""
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, puerto), self._handler())
+        self._server.daemon_threads = True
+        self._hilo = None
+
+    @property
+    def url(self):
+        host, puerto = self._server.server_address[:2]
+        return f"http://{host}:{puerto}/bot"
+
+    def start(self):
+        self._hilo = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _mensaje(self, chat_id):
+        with self._lock:
+            message_id = next(self._ids)
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+
+    def responder(self, metodo, params):
+        with self._lock:
+            self.llamadas[metodo] += 1
+            self.historial.append((metodo, params))
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+
+        if metodo == "getMe":
+            return BOT_USER
+        if metodo == "getUpdates":
+            # Long polling sin updates: espera un poco para no girar en vacío
+            time.sleep(min(float(params.get("timeout", 0) or 0), 1.0))
+            return []
+        if metodo == "setWebhook":
+            self.webhook = params.get("url", "")
+            return True
+        if metodo == "deleteWebhook":
+            self.webhook = ""
+            return True
+        if metodo == "getWebhookInfo":
+            return {"url": self.webhook, "has_custom_certificate": False, "pending_update_count": 0}
+        if metodo.startswith("send"):
+            chat_id = int(params.get("chat_id", 1))
+            return self._mensaje(chat_id)
+        return True
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                metodo = self.path.rstrip("/").rsplit("/", 1)[-1]
+                cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                params = _parsear(self.headers.get("Content-Type", ""), cuerpo)
+                datos = json.dumps({"ok": True, "result": mock.responder(metodo, params)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _parsear(content_type, cuerpo):
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return {k: v[0] for k, v in parse_qs(cuerpo.decode()).items()}
+    if content_type.startswith("application/json"):
+        return json.loads(cuerpo or b"{}")
+    if content_type.startswith("multipart/form-data"):
+        # Solo interesan los campos simples como chat_id
+        return {
+            m.group(1): m.group(2)
+            for m in re.finditer(r'name="([^"]+)"\r\n\r\n([^\r]*)\r\n', cuerpo.decode("latin-1"))
+        }
+    return {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bot API falsa para pruebas locales")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8081)
+    parser.add_argument("--latencia", type=float, default=0.0, help="latencia simulada por llamada (ms)")
+    args = parser.parse_args()
+
+    mock = MockBotAPI(args.host, args.puerto, args.latencia).start()
+    print(f"Bot API falsa en {mock.url}")
+    try:
+        while True:
+            time.sleep(60)
+            print(dict(mock.llamadas))
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,114 @@
+import cProfile
+import logging
+import os
+import pstats
+import random
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Fracción de updates a perfilar (0 = ninguno), ej: 0.05
+PERFIL_FRACCION = float(os.getenv("PERFIL_FRACCION", 0))
+# Handlers que se perfilan siempre, ej: "resumen_opcion,analisis_habitos"
+PERFIL_HANDLERS = {h.strip() for h in os.getenv("PERFIL_HANDLERS", "").split(",") if h.strip()}
+PERFIL_DIR = Path(os.getenv("PERFIL_DIR", "perfiles"))
+# Cada cuántas muestras se reescriben los archivos .prof
+PERFIL_GUARDAR_CADA = int(os.getenv("PERFIL_GUARDAR_CADA", 20))
+
+# Apagado, el único costo por handler es leer esta variable
+activo = bool(PERFIL_FRACCION or PERFIL_HANDLERS)
+
+_cargar_db = None
+_acumulados = {}       # (handler, tramo) -> pstats.Stats
+_muestras = {}         # (handler, tramo) -> cantidad
+_pendientes = 0
+_en_curso = False
+_ultimo_update = (None, False)
+
+# =============================
+# MUESTREO
+# =============================
+def configurar(cargar_db):
+    """cargar_db() se usa para etiquetar cada perfil con el tamaño del historial del usuario."""
+    global _cargar_db
+    _cargar_db = cargar_db
+
+def muestrear(handler: str, update) -> bool:
+    # La decisión por fracción se toma una vez por update: todos sus handlers quedan dentro o fuera
+    global _ultimo_update
+    if handler in PERFIL_HANDLERS:
+        return True
+    if not PERFIL_FRACCION:
+        return False
+    update_id = getattr(update, "update_id", None)
+    if _ultimo_update[0] != update_id or update_id is None:
+        _ultimo_update = (update_id, random.random() < PERFIL_FRACCION)
+    return _ultimo_update[1]
+
+def tramo(n: int) -> str:
+    # Historiales agrupados por orden de magnitud: 0-9, 10-99, 100-999...
+    if n < 10:
+        return "0-9"
+    base = 10 ** (len(str(n)) - 1)
+    return f"{base}-{base * 10 - 1}"
+
+def _tamano_historial(update) -> int:
+    usuario = getattr(update, "effective_user", None)
+    if usuario is None or _cargar_db is None:
+        return 0
+    user = _cargar_db()["users"].get(str(usuario.id), {})
+    return len(user.get('ingresos', [])) + len(user.get('gastos', []))
+
+# =============================
+# PERFILES
+# =============================
+async def perfilar(handler: str, update, corrutina):
+    """Espera la corrutina del handler con cProfile activo y acumula el perfil.
+
+    Incluye lo que el event loop ejecute mientras tanto (otras tareas); con updates
+    secuenciales eso es poco. Si ya hay un perfil en curso, no se perfila.
+    """
+    global _en_curso
+    if _en_curso:
+        return await corrutina
+    _en_curso = True
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+        try:
+            return await corrutina
+        finally:
+            perfil.disable()
+    finally:
+        _en_curso = False
+        _acumular(handler, tramo(_tamano_historial(update)), perfil)
+
+def _acumular(handler, tramo_historial, perfil):
+    global _pendientes
+    clave = (handler, tramo_historial)
+    try:
+        if clave in _acumulados:
+            _acumulados[clave].add(perfil)
+        else:
+            _acumulados[clave] = pstats.Stats(perfil)
+    except TypeError:
+        # Perfil vacío (el handler no llegó a ejecutar nada medible)
+        return
+    _muestras[clave] = _muestras.get(clave, 0) + 1
+    _pendientes += 1
+    if _pendientes >= PERFIL_GUARDAR_CADA:
+        guardar()
+
+def guardar():
+    """Escribe un .prof por (handler, tramo de historial), legible con pstats, snakeviz, etc."""
+    global _pendientes
+    if not _acumulados:
+        return
+    PERFIL_DIR.mkdir(parents=True, exist_ok=True)
+    for (handler, tramo_historial), stats in _acumulados.items():
+        stats.dump_stats(PERFIL_DIR / f"{handler}.historial_{tramo_historial}.prof")
+    _pendientes = 0
+    logger.info(
+        "Perfiles guardados en %s: %s", PERFIL_DIR,
+        ", ".join(f"{h}[{t}]={n}" for (h, t), n in sorted(_muestras.items()))
+    )
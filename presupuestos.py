@@ -0,0 +1,111 @@
+import os
+
+import estadisticas
+import historial_precios
+from historial_precios import registrar_precio
+
+# Porcentajes del presupuesto que disparan un aviso, ej: "80,100"
+UMBRALES_PRESUPUESTO = sorted(int(u) for u in os.getenv("UMBRALES_PRESUPUESTO", "80,100").split(","))
+
+# Claves que salen de user['gastos'] / user['ingresos'] y se mantienen en registrar_gasto / registrar_ingreso
+_DERIVADOS = {
+    "gastos": ("gastos_mes", "gastos_dia", "estadisticas_gasto", "precios"),
+    "ingresos": ("ingresos_mes",),
+}
+
+# =============================
+# TOTALES POR MES Y POR DÍA
+# =============================
+def mes_de(movimiento) -> str:
+    # "2026-10-19T20:15:00" -> "2026-10"
+    return str(movimiento.get('fecha', ''))[:7]
+
+def _al_dia(user, movimientos="gastos"):
+    # Un movimiento agregado sin registrar_gasto / registrar_ingreso (bot2/bot3 anteriores, una
+    # importación, una parte de trabajador, ediciones a mano) deja atrás los contadores: si no
+    # cubren todos los movimientos se descartan y se vuelven a calcular del historial
+    n = len(user.get(movimientos, []))
+    contados = f"{movimientos}_contados"
+    if user.get(contados) != n:
+        for clave in _DERIVADOS[movimientos]:
+            user.pop(clave, None)
+        user[contados] = n
+
+def gastos_mes(user) -> dict:
+    """Contadores {mes: {categoría: total}} que se mantienen al registrar cada gasto.
+
+    Si el usuario aún no los tiene (datos anteriores), se calculan una sola vez del historial.
+    """
+    _al_dia(user)
+    if "gastos_mes" not in user:
+        contadores = {}
+        for g in user.get('gastos', []):
+            por_cat = contadores.setdefault(mes_de(g), {})
+            por_cat[g['categoria']] = por_cat.get(g['categoria'], 0) + g['monto']
+        user["gastos_mes"] = contadores
+    return user["gastos_mes"]
+
+def gastos_dia(user) -> dict:
+    """Total gastado por día {'YYYY-MM-DD': total}, mantenido igual que gastos_mes."""
+    _al_dia(user)
+    if "gastos_dia" not in user:
+        totales = {}
+        for g in user.get('gastos', []):
+            dia = str(g.get('fecha', ''))[:10]
+            if len(dia) == 10:
+                totales[dia] = totales.get(dia, 0) + g['monto']
+        user["gastos_dia"] = totales
+    return user["gastos_dia"]
+
+def ingresos_mes(user) -> dict:
+    """Total ingresado por mes {'YYYY-MM': total}, mantenido al registrar cada ingreso."""
+    _al_dia(user, "ingresos")
+    if "ingresos_mes" not in user:
+        totales = {}
+        for i in user.get('ingresos', []):
+            totales[mes_de(i)] = totales.get(mes_de(i), 0) + i['monto']
+        user["ingresos_mes"] = totales
+    return user["ingresos_mes"]
+
+def historial(user, categoria, producto):
+    """historial_precios.historial, con el historial rearmado si quedó atrás de los gastos."""
+    _al_dia(user)
+    return historial_precios.historial(user, categoria, producto)
+
+def registrar_ingreso(user, ingreso):
+    por_mes = ingresos_mes(user)
+    por_mes[mes_de(ingreso)] = por_mes.get(mes_de(ingreso), 0) + ingreso['monto']
+    user['ingresos'].append(ingreso)
+    user["ingresos_contados"] += 1
+
+def registrar_gasto(user, gasto):
+    """Agrega el gasto y actualiza sus totales mensual y diario, las estadísticas de su categoría
+    y el historial de precios de su producto.
+
+    Devuelve los avisos que correspondan:
+    - "presupuesto": (umbral, gastado, presupuesto) con el umbral más alto cruzado
+    - "atipico": (monto, media, desviación) si el monto se sale de lo habitual en la categoría
+    """
+    _al_dia(user)
+    por_cat = gastos_mes(user).setdefault(mes_de(gasto), {})
+    categoria = gasto['categoria']
+    antes = por_cat.get(categoria, 0)
+    despues = antes + gasto['monto']
+    por_cat[categoria] = despues
+    por_dia = gastos_dia(user)
+    dia = str(gasto.get('fecha', ''))[:10]
+    if len(dia) == 10:
+        por_dia[dia] = por_dia.get(dia, 0) + gasto['monto']
+    avisos = {}
+    atipico = estadisticas.registrar(user, gasto)
+    user['gastos'].append(gasto)
+    user["gastos_contados"] += 1
+    if gasto.get('producto'):
+        registrar_precio(user, categoria, gasto['producto'], gasto['monto'], gasto.get('fecha'))
+    if atipico:
+        avisos["atipico"] = (gasto['monto'], *atipico)
+    presupuesto = user.get('presupuestos', {}).get(categoria)
+    cruzados = [u for u in UMBRALES_PRESUPUESTO if antes < presupuesto * u / 100 <= despues] if presupuesto else []
+    if cruzados:
+        avisos["presupuesto"] = (cruzados[-1], despues, presupuesto)
+    return avisos
@@ -0,0 +1,194 @@
+import calendar
+import os
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+PROYECCION_VENTANA = int(os.getenv("PROYECCION_VENTANA", 90))      # días de historia para el ajuste
+PROYECCION_HORIZONTE = int(os.getenv("PROYECCION_HORIZONTE", 365))  # días hacia adelante para el saldo
+PROYECCION_USUARIOS = int(os.getenv("PROYECCION_USUARIOS", 1000))
+# Con menos días con gastos no se estima tendencia, solo el promedio
+MIN_DIAS_TENDENCIA = 14
+
+# numpy se importa con la primera serie, no al arrancar el bot
+np = None
+
+def _cargar():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+# =============================
+# SERIE DIARIA
+# =============================
+def _ordinal(movimiento):
+    try:
+        return datetime.fromisoformat(movimiento['fecha']).toordinal()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class SerieDiaria:
+    """Gasto por categoría y día (e ingreso por día) en una ventana móvil que termina hoy.
+
+    Los gastos e ingresos solo se agregan al final de sus listas, así que basta recordar
+    cuántos se procesaron para sumar únicamente los nuevos en cada consulta.
+    """
+
+    def __init__(self, hoy: date, ventana: int = PROYECCION_VENTANA):
+        _cargar()
+        self.ventana = ventana
+        self.hoy = hoy.toordinal()
+        self.categorias = {}                       # categoría -> fila
+        self.gastos = np.zeros((0, ventana))
+        self.ingresos = np.zeros(ventana)
+        self.n_gastos = 0
+        self.n_ingresos = 0
+        self.primero = None                        # ordinal del primer movimiento visto
+        self._ajuste = None
+
+    def _columnas(self, ordinales):
+        # Columna de cada día dentro de la ventana; -1 si cae fuera
+        cols = ordinales - (self.hoy - self.ventana + 1)
+        cols[(cols < 0) | (cols >= self.ventana)] = -1
+        return cols
+
+    def _registrar_primero(self, ordinales):
+        if len(ordinales):
+            minimo = int(ordinales.min())
+            self.primero = minimo if self.primero is None else min(self.primero, minimo)
+
+    def agregar_gastos(self, gastos):
+        validos = [(o, g) for g in gastos if (o := _ordinal(g)) is not None]
+        self.n_gastos += len(gastos)
+        if not validos:
+            return
+        for _, g in validos:
+            if g['categoria'] not in self.categorias:
+                self.categorias[g['categoria']] = len(self.categorias)
+        if len(self.categorias) > self.gastos.shape[0]:
+            extra = np.zeros((len(self.categorias) - self.gastos.shape[0], self.ventana))
+            self.gastos = np.vstack([self.gastos, extra])
+
+        ordinales = np.fromiter((o for o, _ in validos), dtype=np.int64, count=len(validos))
+        filas = np.fromiter((self.categorias[g['categoria']] for _, g in validos), dtype=np.int64, count=len(validos))
+        montos = np.fromiter((g['monto'] for _, g in validos), dtype=float, count=len(validos))
+        cols = self._columnas(ordinales)
+        dentro = cols >= 0
+        np.add.at(self.gastos, (filas[dentro], cols[dentro]), montos[dentro])
+        self._registrar_primero(ordinales)
+        self._ajuste = None
+
+    def agregar_ingresos(self, ingresos):
+        validos = [(o, i) for i in ingresos if (o := _ordinal(i)) is not None]
+        self.n_ingresos += len(ingresos)
+        if not validos:
+            return
+        ordinales = np.fromiter((o for o, _ in validos), dtype=np.int64, count=len(validos))
+        montos = np.fromiter((i['monto'] for _, i in validos), dtype=float, count=len(validos))
+        cols = self._columnas(ordinales)
+        dentro = cols >= 0
+        np.add.at(self.ingresos, cols[dentro], montos[dentro])
+        self._registrar_primero(ordinales)
+        self._ajuste = None
+
+    def avanzar(self, hoy: date):
+        # Desplaza la ventana al nuevo día; los días que salen se descartan
+        desplazamiento = hoy.toordinal() - self.hoy
+        if desplazamiento <= 0:
+            return
+        if desplazamiento >= self.ventana:
+            self.gastos[:] = 0
+            self.ingresos[:] = 0
+        else:
+            self.gastos = np.roll(self.gastos, -desplazamiento, axis=1)
+            self.gastos[:, -desplazamiento:] = 0
+            self.ingresos = np.roll(self.ingresos, -desplazamiento)
+            self.ingresos[-desplazamiento:] = 0
+        self.hoy = hoy.toordinal()
+        self._ajuste = None
+
+    def ajuste(self):
+        """Recta por mínimos cuadrados del gasto diario de cada categoría: (nivel hoy, pendiente, media).
+
+        Se ajustan todas las categorías a la vez y el resultado queda cacheado hasta el próximo cambio.
+        """
+        if self._ajuste is not None:
+            return self._ajuste
+
+        dias = self.ventana if self.primero is None else min(self.ventana, self.hoy - self.primero + 1)
+        dias = max(dias, 1)
+        y = self.gastos[:, -dias:]
+        t = np.arange(dias) - (dias - 1)           # hoy = 0
+        media = y.mean(axis=1)
+        pendiente = np.zeros_like(media)
+        if dias > 1:
+            tc = t - t.mean()
+            pendiente = (y - media[:, None]) @ tc / (tc @ tc)
+            pendiente[(y > 0).sum(axis=1) < MIN_DIAS_TENDENCIA] = 0
+        nivel = media - pendiente * t.mean()
+        self._ajuste = (nivel, pendiente, media, self.ingresos[-dias:].mean())
+        return self._ajuste
+
+    def gasto_futuro(self, dias: int):
+        """Gasto esperado por categoría (filas) para cada uno de los próximos días (columnas)."""
+        nivel, pendiente, _, _ = self.ajuste()
+        k = np.arange(1, dias + 1)
+        return np.clip(nivel[:, None] + pendiente[:, None] * k, 0, None)
+
+# =============================
+# CACHE POR USUARIO
+# =============================
+_series = OrderedDict()
+
+def serie_usuario(user_id, user, hoy: date) -> SerieDiaria:
+    uid = str(user_id)
+    serie = _series.get(uid)
+    if serie is None or serie.n_gastos > len(user['gastos']) or serie.n_ingresos > len(user['ingresos']):
+        serie = SerieDiaria(hoy)
+        _series[uid] = serie
+        if len(_series) > PROYECCION_USUARIOS:
+            _series.popitem(last=False)
+    _series.move_to_end(uid)
+
+    serie.avanzar(hoy)
+    serie.agregar_gastos(user['gastos'][serie.n_gastos:])
+    serie.agregar_ingresos(user['ingresos'][serie.n_ingresos:])
+    return serie
+
+# =============================
+# PROYECCIÓN
+# =============================
+def proyectar(user_id, user, saldo: float, gastado_mes: dict, hoy: date = None):
+    """Proyección a fin de mes por categoría y fecha en que el saldo pasaría a negativo.
+
+    gastado_mes: {categoría: gastado en el mes actual} (contadores mantenidos al registrar).
+    """
+    hoy = hoy or date.today()
+    serie = serie_usuario(user_id, user, hoy)
+    _, _, media, ingreso_diario = serie.ajuste()
+
+    restantes = calendar.monthrange(hoy.year, hoy.month)[1] - hoy.day
+    resto_mes = serie.gasto_futuro(restantes).sum(axis=1)
+
+    presupuestos = user.get('presupuestos', {})
+    categorias = []
+    for cat in sorted(set(gastado_mes) | set(presupuestos) | set(serie.categorias), key=str):
+        gastado = gastado_mes.get(cat, 0)
+        fila = serie.categorias.get(cat)
+        proyectado = gastado + (resto_mes[fila] if fila is not None else 0)
+        if gastado or presupuestos.get(cat) or proyectado >= 0.01:
+            categorias.append((cat, gastado, float(proyectado), presupuestos.get(cat)))
+
+    # Saldo día a día con los promedios: extrapolar la tendencia un año entero no es fiable
+    flujo = np.full(PROYECCION_HORIZONTE, ingreso_diario - media.sum())
+    trayectoria = saldo + np.cumsum(flujo)
+    negativos = np.flatnonzero(trayectoria < 0)
+    fecha_negativo = hoy + timedelta(days=int(negativos[0]) + 1) if len(negativos) else None
+
+    return {
+        "categorias": categorias,
+        "fecha_negativo": fecha_negativo,
+        "gasto_diario": float(media.sum()),
+        "ingreso_diario": float(ingreso_diario),
+        "dias_restantes": restantes,
+    }
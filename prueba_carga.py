@@ -0,0 +1,275 @@
+"""Prueba de carga de punta a punta contra la Application real de bot.py.
+
+Usuarios virtuales recorren los flujos de ingreso, gasto, productos y resumen en paralelo.
+Los updates entran por la cola de la Application, igual que con polling, y las respuestas van
+a una Bot API falsa en el mismo proceso.
+
+Uso:
+    python prueba_carga.py --usuarios 500 --flujos 5 --latencia 30
+    python prueba_carga.py --usuarios 100 --historial 2000 --salida carga.json
+    CONCURRENCIA=64 python prueba_carga.py --usuarios 200 --rafaga 5
+    CONCURRENCIA=32 python prueba_carga.py --usuarios 100 --acaparador 500 --p99-max 4000
+
+Con --acaparador un usuario más manda esa cantidad de ingresos de golpe mientras los demás recorren
+sus flujos: sus updates van en fila y no tienen que demorar a nadie más. --p99-max falla (código 1)
+si el p99 de los otros usuarios pasa ese límite.
+
+Al final se cuentan los ingresos y gastos de cada usuario en la DB contra los que registró:
+cualquier diferencia es un movimiento perdido (o duplicado).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from collections import Counter
+from pathlib import Path
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from mock_bot_api import MockBotAPI
+
+RESUMENES = [
+    "Resumen de gastos", "Resumen de ingresos", "Resumen general", "Gráfico", "Mapa de calor",
+    "Análisis de hábitos", "Proyección", "Tendencia", "Exportar datos",
+]
+MEZCLA = "ingreso=1,gasto=4,productos=1,resumen=2"
+
+# =============================
+# FLUJOS
+# =============================
+def flujo_ingreso(rng):
+    return [("inicio", "➕ Ingreso"), ("categoria", "💼 Salario"), ("monto", str(rng.randint(50, 300) * 100))]
+
+def flujo_gasto(rng):
+    # Transporte no tiene productos en el flujo de productos (que agrega a '📦 Otros'): siempre pide el monto
+    return [("inicio", "➖ Gasto"), ("categoria", "🚕 Transporte"), ("monto", str(rng.randint(1, 50) * 10))]
+
+def flujo_productos(rng):
+    return [
+        ("inicio", "📦 Productos"), ("agregar", "Agregar Producto"),
+        ("nuevo", f"Producto {rng.randint(1, 30)}, {rng.randint(1, 50) * 10}"),
+        ("ver", "Ver Productos"), ("salir", "🔙 Menú principal"),
+    ]
+
+def flujo_resumen(rng):
+    opcion = rng.choice(RESUMENES)
+    return [("inicio", "📊 Resumen"), (opcion, opcion), ("salir", "🔙 Menú principal")]
+
+FLUJOS = {"ingreso": flujo_ingreso, "gasto": flujo_gasto, "productos": flujo_productos, "resumen": flujo_resumen}
+
+# =============================
+# CARGA
+# =============================
+class Carga:
+    """Inyecta updates en la cola de la Application y mide hasta que terminan todos sus handlers."""
+
+    def __init__(self, app, timeout: float):
+        self.app = app
+        self.timeout = timeout
+        self.latencias = {}        # paso -> [ms]
+        self.errores = Counter()   # paso -> cantidad
+        self._pendientes = {}      # update_id -> future
+        self._fallidos = {}        # update_id -> nombre de la excepción
+        self._ids = itertools.count(10 ** 9)
+        self.esperados = {}        # user_id -> Counter de 'ingresos' y 'gastos' registrados
+        # Grupo alto: corre después de todos los handlers del bot para ese update
+        app.add_handler(TypeHandler(Update, self._terminado), group=99)
+        app.add_error_handler(self._error)
+
+    async def _terminado(self, update, context):
+        futuro = self._pendientes.pop(update.update_id, None)
+        if futuro is not None and not futuro.done():
+            futuro.set_result(self._fallidos.pop(update.update_id, None))
+
+    async def _error(self, update, context):
+        if isinstance(update, Update):
+            self._fallidos[update.update_id] = type(context.error).__name__
+
+    async def paso(self, user_id: int, etiqueta: str, texto: str):
+        update_id = next(self._ids)
+        mensaje = {
+            "message_id": update_id, "date": int(time.time()), "text": texto,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"U{user_id}"},
+        }
+        if texto.startswith("/"):
+            mensaje["entities"] = [{"type": "bot_command", "offset": 0, "length": len(texto.split()[0])}]
+        update = Update.de_json({"update_id": update_id, "message": mensaje}, self.app.bot)
+        futuro = asyncio.get_running_loop().create_future()
+        self._pendientes[update_id] = futuro
+
+        inicio = time.perf_counter()
+        await self.app.update_queue.put(update)
+        try:
+            error = await asyncio.wait_for(futuro, self.timeout)
+        except asyncio.TimeoutError:
+            self._pendientes.pop(update_id, None)
+            error = "timeout"
+        self.latencias.setdefault(etiqueta, []).append((time.perf_counter() - inicio) * 1000)
+        if error:
+            self.errores[etiqueta] += 1
+
+    async def usuario_virtual(self, user_id: int, flujos: int, pesos: dict, pausa_ms: float, demora: float, rafaga: int = 0):
+        rng = random.Random(user_id)
+        esperados = self.esperados[user_id] = Counter()
+        await asyncio.sleep(demora)
+        await self.paso(user_id, "start", "/start")
+        # Primero un ingreso para que haya saldo para los gastos
+        elegidos = ["ingreso"] + rng.choices(list(pesos), weights=list(pesos.values()), k=flujos - 1)
+        for nombre in elegidos:
+            for paso, texto in FLUJOS[nombre](rng):
+                await self.paso(user_id, f"{nombre}:{paso}", texto)
+                if pausa_ms:
+                    await asyncio.sleep(rng.uniform(0, pausa_ms) / 1000)
+            if nombre in ("ingreso", "gasto"):
+                esperados[f"{nombre}s"] += 1
+        # Toques seguidos sin esperar respuesta: con updates concurrentes se pisarían sin el lock del usuario
+        await asyncio.gather(*(self.paso(user_id, "rafaga", "+100 salario") for _ in range(rafaga)))
+        esperados["ingresos"] += rafaga
+
+    async def acaparador(self, user_id: int, n: int):
+        """Un usuario que manda n ingresos de golpe, sin esperar respuesta, mientras los demás siguen."""
+        esperados = self.esperados[user_id] = Counter()
+        await self.paso(user_id, "acaparador:start", "/start")
+        await asyncio.gather(*(self.paso(user_id, "acaparador:ingreso", "+100 salario") for _ in range(n)))
+        esperados["ingresos"] += n
+
+    def perdidos(self, inicial, final) -> int:
+        """Diferencia entre los movimientos registrados y los que se sumaron a la DB."""
+        total = 0
+        for user_id, esperados in self.esperados.items():
+            antes = inicial["users"].get(str(user_id), {})
+            despues = final["users"].get(str(user_id), {})
+            for tipo, n in esperados.items():
+                total += abs(len(antes.get(tipo, [])) + n - len(despues.get(tipo, [])))
+        return total
+
+# =============================
+# REPORTE
+# =============================
+def _percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+def resumen(carga: Carga, duracion: float, llamadas: Counter, perdidos: int) -> dict:
+    pasos = {}
+    for etiqueta, tiempos in sorted(carga.latencias.items()):
+        ordenados = sorted(tiempos)
+        pasos[etiqueta] = {
+            "n": len(ordenados),
+            "p50_ms": round(_percentil(ordenados, 50), 2),
+            "p99_ms": round(_percentil(ordenados, 99), 2),
+            "max_ms": round(ordenados[-1], 2),
+            "errores": carga.errores[etiqueta],
+        }
+    total = sum(p["n"] for p in pasos.values())
+    errores = sum(carga.errores.values())
+    otros = sorted(t for e, ts in carga.latencias.items() if not e.startswith("acaparador") for t in ts)
+    return {
+        "updates": total,
+        "duracion_s": round(duracion, 2),
+        "updates_por_s": round(total / duracion, 1) if duracion else 0,
+        "errores": errores,
+        "tasa_error": round(errores / total, 4) if total else 0,
+        "movimientos_perdidos": perdidos,
+        "p99_otros_ms": round(_percentil(otros, 99), 2) if otros else 0,
+        "llamadas_api": dict(llamadas),
+        "pasos": pasos,
+    }
+
+def imprimir(r: dict):
+    print(f"\nUpdates: {r['updates']} en {r['duracion_s']} s → {r['updates_por_s']} updates/s")
+    print(f"Errores: {r['errores']} ({r['tasa_error']:.2%})")
+    print(f"Movimientos perdidos o duplicados: {r['movimientos_perdidos']}")
+    print(f"p99 de los usuarios (sin el acaparador): {r['p99_otros_ms']:.1f} ms")
+    print(f"Llamadas a la Bot API: {r['llamadas_api']}\n")
+    print(f"{'paso':<36}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errores':>9}")
+    for etiqueta, p in r["pasos"].items():
+        print(f"{etiqueta:<36}{p['n']:>7}{p['p50_ms']:>10.1f}{p['p99_ms']:>10.1f}{p['max_ms']:>10.1f}{p['errores']:>9}")
+
+# =============================
+# MAIN
+# =============================
+async def correr(app, args, pesos, usuarios):
+    carga = Carga(app, args.timeout)
+    async with app:
+        await app.start()
+        inicio = time.perf_counter()
+        tareas = [
+            carga.usuario_virtual(uid, args.flujos, pesos, args.pausa, args.rampa * i / len(usuarios), args.rafaga)
+            for i, uid in enumerate(usuarios)
+        ]
+        if args.acaparador:
+            tareas.append(carga.acaparador(usuarios[0] - 1, args.acaparador))
+        await asyncio.gather(*tareas)
+        duracion = time.perf_counter() - inicio
+        await app.stop()
+    return carga, duracion
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con usuarios virtuales")
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--flujos", type=int, default=5, help="flujos que recorre cada usuario")
+    parser.add_argument("--mezcla", default=MEZCLA, help="pesos de cada flujo, ej: " + MEZCLA)
+    parser.add_argument("--latencia", type=float, default=20, help="latencia de la Bot API falsa (ms)")
+    parser.add_argument("--pausa", type=float, default=0, help="pausa máxima entre pasos de un usuario (ms)")
+    parser.add_argument("--rampa", type=float, default=0, help="segundos en los que se van sumando los usuarios")
+    parser.add_argument("--rafaga", type=int, default=0, help="ingresos rápidos que cada usuario manda de golpe al final")
+    parser.add_argument("--acaparador", type=int, default=0, help="ingresos que un usuario extra manda de golpe al empezar")
+    parser.add_argument("--p99-max", type=float, default=0, help="fallar si el p99 de los demás usuarios pasa estos ms")
+    parser.add_argument("--historial", type=int, default=0, help="movimientos previos sintéticos por usuario")
+    parser.add_argument("--db", help="finanzas.json inicial (se copia, no se modifica)")
+    parser.add_argument("--timeout", type=float, default=60, help="segundos antes de contar un paso como error")
+    parser.add_argument("--salida", help="guardar el resultado en JSON")
+    args = parser.parse_args()
+    pesos = {k: float(v) for k, v in (p.split("=") for p in args.mezcla.split(","))}
+
+    mock = MockBotAPI(latencia_ms=args.latencia).start()
+    os.environ["TELEGRAM_API_URL"] = mock.url
+    os.environ.setdefault("TOKEN", "123456:ABCDEF")
+    logging.disable(logging.INFO)
+    warnings.filterwarnings("ignore")
+
+    # Después de fijar la URL de la API, que cliente_http lee al importarse
+    import benchmark
+    import bot
+
+    carpeta = Path(tempfile.mkdtemp(prefix="carga_"))
+    bot.DB_FILE = carpeta / "finanzas.json"
+    bot.STATE_FILE = carpeta / "conversaciones.pkl"
+    bot.updates_procesados.archivo = carpeta / "updates_procesados.json"
+    usuarios = list(range(5000, 5000 + args.usuarios))
+    if args.db:
+        shutil.copy(args.db, bot.DB_FILE)
+    elif args.historial:
+        db = benchmark.generar(args.usuarios, args.historial)
+        db["users"] = {str(uid): user for uid, user in zip(usuarios, db["users"].values())}
+        bot._db_save(db)
+
+    try:
+        inicial = bot._db_load()
+        carga, duracion = asyncio.run(correr(bot.construir_app(), args, pesos, usuarios))
+        perdidos = carga.perdidos(inicial, bot._db_load())
+    finally:
+        mock.stop()
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    resultado = resumen(carga, duracion, mock.llamadas, perdidos)
+    imprimir(resultado)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    if args.p99_max and resultado["p99_otros_ms"] > args.p99_max:
+        print(f"❌ p99 de los demás usuarios {resultado['p99_otros_ms']:.1f} ms > {args.p99_max:.0f} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Varias instancias de bot2/bot3 sobre el mismo finanzas.json, como detrás de un balanceador.
+
+Cada instancia es un proceso aparte con su Application y su INSTANCIA, y arranca con su post_init
+como en producción (abre /metrics). Todas registran ingresos para los mismos usuarios a la vez; al
+final se cuenta que no se haya perdido ninguno, que el JSON sea válido y que cada una tenga /metrics.
+
+Uso:
+    python prueba_instancias.py --instancias 4 --usuarios 10 --rondas 20
+    ALMACEN_ESPERA=0 python prueba_instancias.py     # sin esperar el lock: ejercita conflictos y reintentos
+"""
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+from mock_bot_api import MockBotAPI
+
+MONTO = 10
+
+def _update(Update, bot, update_id, user_id, texto):
+    mensaje = {
+        "message_id": update_id, "date": int(time.time()), "text": texto,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"U{user_id}"},
+    }
+    if texto.startswith("/"):
+        mensaje["entities"] = [{"type": "bot_command", "offset": 0, "length": len(texto)}]
+    return Update.de_json({"update_id": update_id, "message": mensaje}, bot)
+
+async def _usuario(app, Update, ids, user_id, rondas):
+    # Los updates de un usuario van en orden dentro de la instancia; los usuarios, en paralelo
+    for _ in range(rondas):
+        for texto in ("➕ Ingreso", "💼 Salario", str(MONTO)):
+            await app.process_update(_update(Update, app.bot, next(ids), user_id, texto))
+
+async def _correr(app, indice, usuarios, rondas):
+    from telegram import Update
+    ids = itertools.count(indice * 10 ** 7)
+    async with app:
+        # post_init como en producción: ahí se abre /metrics, que tiene que tener un puerto por instancia
+        await app.post_init(app)
+        metricas_ok = app.bot_data.get("servidor_metricas") is not None
+        await app.start()
+        await asyncio.gather(*(_usuario(app, Update, ids, uid, rondas) for uid in usuarios))
+        await app.stop()
+    await app.post_shutdown(app)
+    return metricas_ok
+
+def instancia(modulo: str, indice: int, carpeta: str, usuarios: list, rondas: int, resultados):
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings("ignore")
+    os.environ["INSTANCIA"] = str(indice)
+    bot = importlib.import_module(modulo)
+    carpeta = Path(carpeta)
+    bot.DB_FILE = bot.almacen.archivo = carpeta / "finanzas.json"
+    bot.STATE_FILE = carpeta / f"conversaciones.{indice}.pkl"
+    bot.updates_procesados.archivo = carpeta / f"updates_procesados.{indice}.json"
+    inicio = time.perf_counter()
+    metricas_ok = asyncio.run(_correr(bot.construir_app(), indice, usuarios, rondas))
+    conflictos = sum(h.total for (m, _), h in bot.metricas.histogramas.items() if m == "almacen_conflicto")
+    errores = sum(h.total for (m, _), h in bot.metricas.histogramas.items() if m == "handler_error")
+    resultados.put((indice, time.perf_counter() - inicio, conflictos, errores, metricas_ok))
+
+def main():
+    parser = argparse.ArgumentParser(description="Varias instancias sobre el mismo finanzas.json")
+    parser.add_argument("--bot", default="bot2", choices=["bot2", "bot3"])
+    parser.add_argument("--instancias", type=int, default=4)
+    parser.add_argument("--usuarios", type=int, default=10)
+    parser.add_argument("--rondas", type=int, default=10, help="ingresos por usuario en cada instancia")
+    parser.add_argument("--latencia", type=float, default=5, help="latencia de la Bot API falsa (ms)")
+    args = parser.parse_args()
+
+    mock = MockBotAPI(latencia_ms=args.latencia).start()
+    # Las instancias heredan el entorno: responden a la Bot API falsa
+    os.environ["TELEGRAM_API_URL"] = mock.url
+    os.environ.setdefault("TOKEN", "123456:ABCDEF")
+    # Lejos del 9090 por defecto, por si hay un bot corriendo en la máquina
+    os.environ.setdefault("METRICAS_PUERTO", "19090")
+    carpeta = tempfile.mkdtemp(prefix="instancias_")
+    usuarios = list(range(7000, 7000 + args.usuarios))
+
+    contexto = multiprocessing.get_context("spawn")
+    resultados = contexto.Queue()
+    procesos = [
+        contexto.Process(target=instancia, args=(args.bot, i, carpeta, usuarios, args.rondas, resultados))
+        for i in range(args.instancias)
+    ]
+    try:
+        for p in procesos:
+            p.start()
+        por_instancia = sorted(resultados.get() for _ in procesos)
+        for p in procesos:
+            p.join()
+        with open(Path(carpeta) / "finanzas.json", encoding="utf-8") as f:
+            db = json.load(f)
+    finally:
+        mock.stop()
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    sin_metricas = 0
+    for indice, segundos, conflictos, errores, metricas_ok in por_instancia:
+        print(f"instancia {indice}: {segundos:.2f} s, {conflictos} conflictos reintentados, {errores} errores"
+              f"{'' if metricas_ok else ', sin /metrics'}")
+        sin_metricas += not metricas_ok
+    esperado = args.instancias * args.rondas
+    perdidos = 0
+    for uid in usuarios:
+        user = db["users"].get(str(uid), {})
+        registrados = len(user.get("ingresos", []))
+        perdidos += esperado - registrados
+        if registrados != esperado or user.get("_version") != esperado:
+            print(f"❌ usuario {uid}: {registrados} ingresos (esperados {esperado}), versión {user.get('_version')}")
+    print(f"{'✅' if not perdidos else '❌'} {len(usuarios) * esperado - perdidos}/{len(usuarios) * esperado} ingresos guardados")
+    if sin_metricas:
+        print(f"❌ {sin_metricas} instancias no pudieron abrir /metrics")
+    sys.exit(1 if perdidos or sin_metricas else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+from entrada_rapida import buscar_categoria
+from indice_productos import normalizar
+from presupuestos import registrar_gasto, registrar_ingreso
+
+DIAS_SEMANA = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
+FRECUENCIAS = ("mensual", "semanal")
+
+# =============================
+# REGLAS RECURRENTES
+# =============================
+def _dia_mensual(anio, mes, dia):
+    # Día 31 en un mes de 30 días (o 29-31 en febrero) cae en el último día del mes
+    return date(anio, mes, min(dia, calendar.monthrange(anio, mes)[1]))
+
+def siguiente_fecha(regla, desde: date) -> date:
+    """Primera fecha en que vence la regla, a partir de 'desde' (incluido)."""
+    if regla['frecuencia'] == "semanal":
+        return desde + timedelta(days=(regla['dia'] - desde.weekday()) % 7)
+
+    fecha = _dia_mensual(desde.year, desde.month, regla['dia'])
+    if fecha < desde:
+        anio, mes = (desde.year + 1, 1) if desde.month == 12 else (desde.year, desde.month + 1)
+        fecha = _dia_mensual(anio, mes, regla['dia'])
+    return fecha
+
+def parsear_regla(texto, categorias_ingreso, categorias_gasto, hoy: date):
+    """'tipo, monto, categoría, frecuencia, día[, producto]' -> regla. Lanza ValueError si no es válida.
+
+    Ej: 'ingreso, 1500, salario, mensual, 1' o 'gasto, 300, hogar, semanal, lunes, Gas'
+    """
+    partes = [p.strip() for p in texto.split(",")]
+    if len(partes) not in (5, 6):
+        raise ValueError("se esperan 5 o 6 campos separados por coma")
+
+    tipo, monto, categoria, frecuencia, dia = (normalizar(partes[0]), partes[1], partes[2],
+                                               normalizar(partes[3]), normalizar(partes[4]))
+    if tipo not in ("ingreso", "gasto"):
+        raise ValueError("el tipo debe ser 'ingreso' o 'gasto'")
+    monto = float(monto)
+    if monto <= 0:
+        raise ValueError("el monto debe ser positivo")
+    if frecuencia not in FRECUENCIAS:
+        raise ValueError("la frecuencia debe ser 'mensual' o 'semanal'")
+
+    if frecuencia == "semanal":
+        if dia not in DIAS_SEMANA:
+            raise ValueError("el día semanal debe ser lunes, martes, ..., domingo")
+        dia = DIAS_SEMANA.index(dia)
+    else:
+        dia = int(dia)
+        if not 1 <= dia <= 31:
+            raise ValueError("el día del mes debe estar entre 1 y 31")
+
+    categorias = categorias_ingreso if tipo == "ingreso" else categorias_gasto
+    regla = {
+        "tipo": tipo,
+        "monto": monto,
+        "categoria": buscar_categoria(categoria, categorias) or categoria,
+        "producto": partes[5] if len(partes) == 6 and tipo == "gasto" else None,
+        "frecuencia": frecuencia,
+        "dia": dia,
+    }
+    regla['proxima'] = siguiente_fecha(regla, hoy).isoformat()
+    return regla
+
+def describir(regla) -> str:
+    if regla['frecuencia'] == "semanal":
+        cuando = f"cada {DIAS_SEMANA[regla['dia']]}"
+    else:
+        cuando = f"el día {regla['dia']} de cada mes"
+    producto = f" ({regla['producto']})" if regla.get('producto') else ""
+    return f"{regla['tipo'].capitalize()} {regla['categoria']}{producto} {cuando}, próxima {regla['proxima']}"
+
+def aplicar_vencidas(user, hoy: date):
+    """Aplica todas las ocurrencias vencidas hasta 'hoy', incluidas las perdidas por caídas.
+
+    Cada ocurrencia usa su propia fecha de vencimiento y avanza 'proxima', así que volver
+    a ejecutar sobre el mismo estado guardado no aplica nada dos veces.
+    Devuelve la lista de movimientos añadidos.
+    """
+    aplicados = []
+    for regla in user.get('recurrentes', []):
+        vence = date.fromisoformat(regla['proxima'])
+        while vence <= hoy:
+            movimiento = {
+                "monto": regla['monto'],
+                "categoria": regla['categoria'],
+                "fecha": datetime.combine(vence, datetime.min.time()).isoformat(),
+                "recurrente": regla['id'],
+            }
+            if regla['tipo'] == "gasto":
+                movimiento['producto'] = regla.get('producto')
+                registrar_gasto(user, movimiento)
+            else:
+                registrar_ingreso(user, movimiento)
+            aplicados.append((regla, movimiento))
+            vence = siguiente_fecha(regla, vence + timedelta(days=1))
+        regla['proxima'] = vence.isoformat()
+    return aplicados
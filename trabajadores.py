@@ -0,0 +1,284 @@
+"""Modo trabajadores: un proceso principal recibe los updates y los reparte entre N procesos.
+
+Cada usuario va siempre al mismo trabajador (crc32 del id % N), que tiene su propia parte de
+la DB y de los estados de conversación (finanzas.w0.json, conversaciones.bot.w0.pkl, ...), así que
+los updates de un usuario se atienden en orden y sin escrituras cruzadas entre procesos.
+
+- Al arrancar se juntan las partes anteriores y se reparten para el N actual.
+- Si un trabajador se cae, se relanza con los updates que no llegó a confirmar, en orden. La
+  confirmación puede perderse aunque el update ya esté guardado: cada trabajador descarta los que
+  ya atendió con su propio updates_procesados (updates_procesados.bot.w0.json, ...).
+- Al cerrar en orden se juntan las partes en finanzas.json y conversaciones.bot.pkl.
+"""
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+from telegram import Update
+from telegram.ext import PersistenceInput, PicklePersistence
+
+from dedupe import UpdatesProcesados
+
+logger = logging.getLogger(__name__)
+
+# 0 o 1: un solo proceso, como siempre
+TRABAJADORES = int(os.getenv("TRABAJADORES", 0))
+TRABAJADORES_VIGILAR = float(os.getenv("TRABAJADORES_VIGILAR", 1))
+# Lo mismo que guarda construir_app: estados de conversación y user_data
+DATOS_PERSISTIDOS = PersistenceInput(bot_data=False, chat_data=False, callback_data=False)
+
+_PARTE = re.compile(r"\.w\d+$")
+
+# =============================
+# REPARTO
+# =============================
+def trabajador_de(user_id, n: int) -> int:
+    # crc32 y no hash(): tiene que dar lo mismo en todos los procesos y entre reinicios
+    return zlib.crc32(str(user_id).encode()) % n
+
+def archivo_de(base: Path, indice: int) -> Path:
+    return base.with_name(f"{base.stem}.w{indice}{base.suffix}")
+
+def _partes(base: Path) -> list:
+    patron = re.compile(rf"{re.escape(base.stem)}\.w\d+{re.escape(base.suffix)}$")
+    return sorted(p for p in base.parent.glob(f"{base.stem}.w*{base.suffix}") if patron.match(p.name))
+
+def _leer_json(archivo: Path) -> dict:
+    try:
+        with archivo.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Error leyendo {archivo.name}: {e}")
+        return {"users": {}}
+
+def _escribir_json(archivo: Path, db: dict):
+    tmp = archivo.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(db, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, archivo)
+
+def db_completa(db_file: Path) -> dict:
+    """La DB entera, también con los trabajadores corriendo. db_file puede ser la base o una parte."""
+    base = db_file.with_name(_PARTE.sub("", db_file.stem) + db_file.suffix)
+    db = _leer_json(base) if base.exists() else {"users": {}}
+    # Cada usuario está completo en su parte, que es más nueva que la base
+    for parte in _partes(base):
+        db["users"].update(_leer_json(parte).get("users", {}))
+    return db
+
+def repartir_db(base: Path, n: int):
+    db = db_completa(base)
+    partes = [{"users": {}} for _ in range(n)]
+    for uid, user in db["users"].items():
+        partes[trabajador_de(uid, n)]["users"][uid] = user
+    # La base queda con todo por si se vuelve al modo de un proceso sin cerrar en orden
+    _escribir_json(base, db)
+    for parte in _partes(base):
+        parte.unlink()
+    for i, parte in enumerate(partes):
+        _escribir_json(archivo_de(base, i), parte)
+
+def juntar_db(base: Path):
+    if not _partes(base):
+        return
+    _escribir_json(base, db_completa(base))
+    for parte in _partes(base):
+        parte.unlink()
+
+async def _leer_estados(archivos, bot):
+    user_data, conversaciones = {}, {}
+    for archivo in archivos:
+        if not archivo.exists():
+            continue
+        persistencia = PicklePersistence(archivo, store_data=DATOS_PERSISTIDOS)
+        persistencia.set_bot(bot)
+        user_data.update(await persistencia.get_user_data())
+        for nombre, estados in (persistencia.conversations or {}).items():
+            conversaciones.setdefault(nombre, {}).update(estados)
+    return user_data, conversaciones
+
+async def _escribir_estados(archivo, bot, user_data, conversaciones):
+    persistencia = PicklePersistence(archivo, store_data=DATOS_PERSISTIDOS, on_flush=True)
+    persistencia.set_bot(bot)
+    for uid, datos in user_data.items():
+        await persistencia.update_user_data(uid, datos)
+    for nombre, estados in conversaciones.items():
+        for clave, estado in estados.items():
+            await persistencia.update_conversation(nombre, clave, estado)
+    await persistencia.flush()
+
+async def repartir_estados(base: Path, n: int, bot):
+    # Las claves de conversación son (chat_id, user_id): se reparten por el último elemento
+    user_data, conversaciones = await _leer_estados([base] + _partes(base), bot)
+    for parte in _partes(base):
+        parte.unlink()
+    for i in range(n):
+        await _escribir_estados(
+            archivo_de(base, i), bot,
+            {uid: d for uid, d in user_data.items() if trabajador_de(uid, n) == i},
+            {nombre: {k: e for k, e in estados.items() if trabajador_de(k[-1], n) == i}
+             for nombre, estados in conversaciones.items()},
+        )
+    # Los estados ya están en las partes: la base vieja resucitaría conversaciones terminadas
+    base.unlink(missing_ok=True)
+
+async def juntar_estados(base: Path, bot):
+    if not _partes(base):
+        return
+    user_data, conversaciones = await _leer_estados(_partes(base), bot)
+    await _escribir_estados(base, bot, user_data, conversaciones)
+    for parte in _partes(base):
+        parte.unlink()
+
+def juntar_partes(db_file: Path, state_file: Path, bot):
+    """Para el modo de un proceso, antes de arrancar la Application.
+
+    Si los trabajadores no cerraron en orden, lo último está en las partes (y conversaciones.bot.pkl ya
+    no existe): se juntan para no atender con la base vieja ni mezclar después partes viejas encima.
+    """
+    juntar_db(db_file)
+    if _partes(state_file):
+        logger.warning("Quedaron partes de los trabajadores: se juntan antes de arrancar")
+        # Loop propio y sin fijarlo como actual: run_polling después usa el suyo
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(juntar_estados(state_file, bot))
+        finally:
+            loop.close()
+
+# =============================
+# TRABAJADOR
+# =============================
+def _trabajador(modulo: str, indice: int, db_file: Path, state_file: Path, entrada, confirmados):
+    # Ctrl+C y el SIGTERM del servicio llegan a todo el grupo: el cierre lo ordena el proceso principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    mod = importlib.import_module(modulo)
+    mod.DB_FILE = archivo_de(db_file, indice)
+    mod.STATE_FILE = archivo_de(state_file, indice)
+    # Se guarda después de cada update, recién guardados sus datos y antes de confirmarlo: una
+    # confirmación perdida en la cola no hace que el update se repita al relanzar
+    mod.updates_procesados = UpdatesProcesados(archivo_de(mod.updates_procesados.archivo, indice), intervalo=0)
+    app = mod.construir_app(recibir=False)
+    asyncio.run(_atender(app, indice, entrada, confirmados))
+
+async def _atender(app, indice, entrada, confirmados):
+    loop = asyncio.get_running_loop()
+    async with app:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        logger.info(f"Trabajador {indice} listo")
+        while True:
+            try:
+                datos = await loop.run_in_executor(None, entrada.get, True, 1)
+            except queue.Empty:
+                # Si el proceso principal murió sin avisar, nadie va a mandar el None
+                if multiprocessing.parent_process().is_alive():
+                    continue
+                logger.error(f"Trabajador {indice}: el proceso principal terminó")
+                break
+            if datos is None:
+                break
+            # De a uno: así se mantiene el orden de cada usuario
+            await app.process_update(Update.de_json(datos, app.bot))
+            confirmados.put(datos["update_id"])
+        await app.stop()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+# =============================
+# PROCESO PRINCIPAL
+# =============================
+class Frente:
+    """Reparte los updates que recibe la Application principal entre los trabajadores."""
+
+    def __init__(self, modulo: str, n: int, db_file: Path, state_file: Path):
+        self.modulo = modulo
+        self.n = n
+        self.db_file = db_file
+        self.state_file = state_file
+        self._contexto = multiprocessing.get_context("spawn")
+        self._procesos = [None] * n
+        self._colas = [None] * n
+        self._confirmados = [None] * n
+        self._pendientes = [OrderedDict() for _ in range(n)]   # update_id -> update sin confirmar
+        self._vigilancia = None
+        self._cerrando = False
+
+    def _lanzar(self, i: int):
+        # Colas nuevas en cada lanzamiento: un proceso muerto puede haber dejado tomado el lock de las viejas
+        if self._colas[i] is not None:
+            self._colas[i].cancel_join_thread()
+            self._confirmados[i].cancel_join_thread()
+        self._colas[i] = self._contexto.Queue()
+        self._confirmados[i] = self._contexto.Queue()
+        for datos in self._pendientes[i].values():
+            self._colas[i].put(datos)
+        self._procesos[i] = self._contexto.Process(
+            target=_trabajador, args=(self.modulo, i, self.db_file, self.state_file, self._colas[i], self._confirmados[i]),
+            name=f"trabajador-{i}", daemon=True,
+        )
+        self._procesos[i].start()
+
+    async def iniciar(self, app):
+        """post_init del proceso principal: reparte los datos y lanza los trabajadores."""
+        repartir_db(self.db_file, self.n)
+        await repartir_estados(self.state_file, self.n, app.bot)
+        for i in range(self.n):
+            self._lanzar(i)
+        self._vigilancia = asyncio.create_task(self._vigilar())
+        logger.info(f"{self.n} trabajadores lanzados")
+
+    async def enrutar(self, update: Update, context):
+        usuario = update.effective_user
+        i = trabajador_de(usuario.id if usuario else 0, self.n)
+        datos = update.to_dict()
+        self._pendientes[i][update.update_id] = datos
+        self._colas[i].put(datos)
+
+    def _descontar_confirmados(self, i: int):
+        try:
+            while True:
+                self._pendientes[i].pop(self._confirmados[i].get_nowait(), None)
+        except queue.Empty:
+            pass
+
+    async def _vigilar(self):
+        while not self._cerrando:
+            await asyncio.sleep(TRABAJADORES_VIGILAR)
+            for i, proceso in enumerate(self._procesos):
+                self._descontar_confirmados(i)
+                if not proceso.is_alive() and not self._cerrando:
+                    logger.warning(
+                        f"Trabajador {i} terminó (código {proceso.exitcode}): "
+                        f"se relanza con {len(self._pendientes[i])} updates pendientes"
+                    )
+                    self._lanzar(i)
+
+    async def cerrar(self, app):
+        """post_shutdown del proceso principal: vacía las colas, espera a los trabajadores y junta los datos."""
+        self._cerrando = True
+        if self._vigilancia:
+            self._vigilancia.cancel()
+        for cola in self._colas:
+            cola.put(None)
+        for i, proceso in enumerate(self._procesos):
+            await asyncio.to_thread(proceso.join, 30)
+            if proceso.is_alive():
+                logger.error(f"Trabajador {i} no terminó a tiempo")
+                proceso.terminate()
+            self._descontar_confirmados(i)
+            if self._pendientes[i]:
+                logger.error(f"Trabajador {i}: {len(self._pendientes[i])} updates sin atender")
+        juntar_db(self.db_file)
+        await juntar_estados(self.state_file, app.bot)